@@ -0,0 +1,142 @@
+import logging
+import math
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import SLOT_SEAT_CAPACITY, SLOT_TABLE_CAPACITY, SEATS_PER_TABLE
+from ledger import SlotClaim
+from reservation_store import (
+    reservation_store,
+    COLUMN_BOOKING_ID,
+    COLUMN_DATE,
+    COLUMN_TIME,
+    COLUMN_STATUS,
+    COLUMN_PARTY_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+# ช่วงเวลาที่เปิดให้จอง (18:30 - 21:30 ทุก 30 นาที)
+SERVICE_TIMES = ["18:30", "19:00", "19:30", "20:00", "20:30", "21:00", "21:30"]
+_SLOT_INDEX = {t: i for i, t in enumerate(SERVICE_TIMES)}
+
+# สถานะที่ไม่ใช้ที่นั่งแล้ว (ต้องตรงกับ INACTIVE_STATUSES ใน google_sheets.py)
+RELEASED_STATUSES = ('ยกเลิกแล้ว', 'ไม่มาใช้บริการ')
+
+def tables_needed(party_size: int, seats_per_table: int = SEATS_PER_TABLE) -> int:
+    """จำนวนโต๊ะที่ต้องใช้สำหรับจำนวนคน"""
+    return max(1, math.ceil(party_size / max(1, seats_per_table)))
+
+def _party_size(record: Dict[str, Any]) -> int:
+    try:
+        return max(1, int(record.get(COLUMN_PARTY_SIZE) or 1))
+    except (TypeError, ValueError):
+        return 1
+
+def booking_usage(record: Dict[str, Any]) -> Optional[Tuple[str, str, str, int, int, bool]]:
+    """ที่นั่งที่การจองหนึ่งรายการใช้ (booking_id, date, time, seats, tables, active) สำหรับ ledger"""
+    booking_id = record.get(COLUMN_BOOKING_ID)
+    date = str(record.get(COLUMN_DATE, ''))
+    time_str = str(record.get(COLUMN_TIME, ''))
+    if not booking_id or not date or time_str not in _SLOT_INDEX:
+        return None
+
+    party_size = _party_size(record)
+    active = record.get(COLUMN_STATUS) not in RELEASED_STATUSES
+    return str(booking_id), date, time_str, party_size, tables_needed(party_size), active
+
+class AvailabilityGrid:
+    """
+    ตารางที่นั่ง/โต๊ะที่ถูกใช้ของแต่ละวันและช่วงเวลา
+
+    ลงทะเบียนเป็น listener ของ reservation store จึงถูกอัพเดททีละรายการ
+    ทุกครั้งที่มีการจอง / ยกเลิก / เปลี่ยนสถานะ (โหลด sheet ใหม่ = สร้างตารางใหม่)
+    การถามว่าช่วงเวลาไหนรับ N คนได้ดูแค่ช่องของวันนั้น ไม่ต้องวนดูการจองทั้งหมด
+    """
+
+    def __init__(
+        self,
+        seat_capacity: int = SLOT_SEAT_CAPACITY,
+        table_capacity: int = SLOT_TABLE_CAPACITY,
+        seats_per_table: int = SEATS_PER_TABLE
+    ):
+        self.seat_capacity = seat_capacity
+        self.table_capacity = table_capacity
+        self.seats_per_table = seats_per_table
+        self._lock = threading.Lock()
+        self._seats: Dict[str, List[int]] = {}
+        self._tables: Dict[str, List[int]] = {}
+
+    # === Store listener ===
+    def on_insert(self, record: Dict[str, Any]):
+        self._apply(record, 1)
+
+    def on_remove(self, record: Dict[str, Any]):
+        self._apply(record, -1)
+
+    def on_clear(self):
+        with self._lock:
+            self._seats.clear()
+            self._tables.clear()
+
+    def _apply(self, record: Dict[str, Any], sign: int):
+        if record.get(COLUMN_STATUS) in RELEASED_STATUSES:
+            return
+
+        slot = _SLOT_INDEX.get(str(record.get(COLUMN_TIME, '')))
+        date = str(record.get(COLUMN_DATE, ''))
+        if slot is None or not date:
+            return
+
+        party_size = _party_size(record)
+        with self._lock:
+            seats = self._seats.setdefault(date, [0] * len(SERVICE_TIMES))
+            tables = self._tables.setdefault(date, [0] * len(SERVICE_TIMES))
+            seats[slot] += sign * party_size
+            tables[slot] += sign * tables_needed(party_size, self.seats_per_table)
+
+    # === Queries ===
+    def can_fit(self, date: str, time_str: str, party_size: int) -> bool:
+        """ตรวจสอบว่าช่วงเวลานี้ยังรับจำนวนคนนี้ได้หรือไม่"""
+        slot = _SLOT_INDEX.get(time_str)
+        if slot is None:
+            return False
+
+        with self._lock:
+            seats = self._seats.get(date)
+            used_seats = seats[slot] if seats else 0
+            used_tables = self._tables[date][slot] if seats else 0
+
+        return (used_seats + party_size <= self.seat_capacity and
+                used_tables + tables_needed(party_size, self.seats_per_table) <= self.table_capacity)
+
+    def slot_claim(self, date: str, time_str: str, party_size: int) -> SlotClaim:
+        """ที่นั่ง/โต๊ะที่ต้องจองใน ledger สำหรับการจองนี้ (ใช้ความจุเดียวกับตาราง)"""
+        return SlotClaim(
+            date, time_str, party_size, tables_needed(party_size, self.seats_per_table),
+            self.seat_capacity, self.table_capacity
+        )
+
+    def available_times(self, date: str, party_size: int = 1) -> List[str]:
+        """ช่วงเวลาในวันที่ระบุที่ยังรับจำนวนคนนี้ได้"""
+        return [t for t in SERVICE_TIMES if self.can_fit(date, t, party_size)]
+
+    def get_occupancy(self, date: str) -> Dict[str, Dict[str, int]]:
+        """ที่นั่ง/โต๊ะที่ถูกใช้และที่เหลือของแต่ละช่วงเวลา"""
+        with self._lock:
+            seats = list(self._seats.get(date, [0] * len(SERVICE_TIMES)))
+            tables = list(self._tables.get(date, [0] * len(SERVICE_TIMES)))
+
+        return {
+            t: {
+                'seats_used': seats[i],
+                'seats_left': max(0, self.seat_capacity - seats[i]),
+                'tables_used': tables[i],
+                'tables_left': max(0, self.table_capacity - tables[i])
+            }
+            for i, t in enumerate(SERVICE_TIMES)
+        }
+
+# ตารางที่ใช้ร่วมกันทั้ง process (ผูกกับ reservation store)
+availability_grid = AvailabilityGrid()
+reservation_store.add_listener(availability_grid)
@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional
+
+# ขั้นตอนของบทสนทนาการจองหนึ่งครั้ง (ข้อความแรกเริ่มการจอง)
+BOOKING_STEPS = ["start", "name", "phone", "date", "time", "party_size", "special_requests"]
+
+class FakeWorksheet:
+    """
+    Worksheet จำลอง (แทน gspread.Worksheet ใน google_sheets.py) พร้อมหน่วงเวลาทุกการเรียก
+
+    ใช้เฉพาะ method ที่ระบบจองเรียก และนับจำนวนการเรียกแยกตาม method
+    """
+
+    def __init__(self, headers: List[str], title: str, latency: float = 0.0):
+        self.headers = list(headers)
+        self.title = title
+        self.latency = latency
+        self.rows: List[List[Any]] = []
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, name: str):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_all_records(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        self._call('get_all_records')
+        with self._lock:
+            return [dict(zip(self.headers, row)) for row in self.rows]
+
+    def col_values(self, column: int, *args, **kwargs) -> List[Any]:
+        self._call('col_values')
+        with self._lock:
+            return [self.headers[column - 1]] + [row[column - 1] for row in self.rows]
+
+    def append_rows(self, rows: List[List[Any]], *args, **kwargs) -> Dict[str, Any]:
+        self._call('append_rows')
+        with self._lock:
+            start_row = len(self.rows) + 2
+            self.rows.extend([list(row) for row in rows])
+        end_row = start_row + len(rows) - 1
+        return {'updates': {'updatedRange': f"'{self.title}'!A{start_row}:L{end_row}"}}
+
+    def append_row(self, row: List[Any], *args, **kwargs) -> Dict[str, Any]:
+        return self.append_rows([row])
+
+    def batch_update(self, data: List[Dict[str, Any]], *args, **kwargs):
+        self._call('batch_update')
+        with self._lock:
+            for item in data:
+                match = re.match(r'([A-Z]+)(\d+)', item['range'])
+                column = 0
+                for char in match.group(1):
+                    column = column * 26 + ord(char) - ord('A') + 1
+                row = self.rows[int(match.group(2)) - 2]
+                row.extend([''] * (column - len(row)))
+                row[column - 1] = item['values'][0][0]
+
+class FakeLine:
+    """LINE Messaging API จำลอง (httpx MockTransport) พร้อมหน่วงเวลาและนับการเรียกแยกตาม endpoint"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    async def handle(self, request):
+        import httpx
+
+        path = request.url.path
+        endpoint = "/v2/bot/profile/{user_id}" if path.startswith("/v2/bot/profile/") else path
+        self.calls[f"{request.method} {endpoint}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if endpoint == "/v2/bot/profile/{user_id}":
+            user_id = path.rsplit('/', 1)[-1]
+            return httpx.Response(200, json={'userId': user_id, 'displayName': f"bench {user_id}"})
+        return httpx.Response(200, json={})
+
+def sign_body(body: bytes, channel_secret: str) -> str:
+    """signature แบบเดียวกับ verify_line_signature (HMAC-SHA256 แล้ว base64)"""
+    digest = hmac.new(channel_secret.encode('utf-8'), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+def percentile(values: List[float], percent: float) -> float:
+    """percentile แบบ nearest-rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def latency_summary(values: List[float]) -> Dict[str, Any]:
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2) if values else 0.0
+    }
+
+def booking_messages(user_index: int, service_times: List[str]) -> List[str]:
+    """ข้อความของบทสนทนาการจองหนึ่งครั้ง (กระจายวันและเวลาไม่ให้ช่วงเวลาเต็มเร็ว)"""
+    booking_date = date.today() + timedelta(days=1 + user_index % 7)
+    booking_time = service_times[(user_index // 7) % len(service_times)]
+    return [
+        "booking",
+        f"ลูกค้า {user_index}",
+        f"08{user_index:08d}",
+        booking_date.strftime("%d-%m-") + str(booking_date.year + 543),
+        booking_time,
+        "2",
+        "-"
+    ]
+
+async def run_benchmark(
+    users: int,
+    line_latency: float,
+    sheets_latency: float,
+    async_queue: bool = False
+) -> Dict[str, Any]:
+    """รัน main.app ใน process เดียวกับ LINE / Sheets จำลอง แล้วจองพร้อมกัน users คน"""
+    # ตั้งค่าก่อน import แอป (ไฟล์ ledger / index แยกจากของจริง)
+    work_dir = tempfile.mkdtemp(prefix="booking-bench-")
+    os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark-secret")
+    os.environ["LINE_CHANNEL_ACCESS_TOKEN"] = "benchmark-token"
+    os.environ["LEDGER_PATH"] = os.path.join(work_dir, "ledger.db")
+    os.environ["PHONE_INDEX_PATH"] = os.path.join(work_dir, "phone_index.db")
+    os.environ["SESSION_STORE"] = "memory"
+    os.environ["WEBHOOK_ASYNC_PROCESSING"] = "true" if async_queue else "false"
+
+    import httpx
+    import google_sheets
+    import main
+    from availability import SERVICE_TIMES
+    from line_client import line_client
+    from utils import LINE_CHANNEL_SECRET
+
+    worksheet = FakeWorksheet(google_sheets.HEADERS, google_sheets.DEFAULT_SHEET_NAME, sheets_latency)
+    google_sheets.get_worksheet = lambda sheet_name=google_sheets.DEFAULT_SHEET_NAME: worksheet
+    fake_line = FakeLine(line_latency)
+    line_client.transport = httpx.MockTransport(fake_line.handle)
+
+    latencies: Dict[str, List[float]] = {step: [] for step in BOOKING_STEPS}
+    statuses: Counter = Counter()
+
+    async def post_message(client, user_id: str, text: str, reply_token: str) -> int:
+        body = json.dumps({
+            'destination': 'benchmark',
+            'events': [{
+                'type': 'message',
+                'mode': 'active',
+                'timestamp': int(time.time() * 1000),
+                'replyToken': reply_token,
+                'source': {'type': 'user', 'userId': user_id},
+                'message': {'id': reply_token, 'type': 'text', 'text': text}
+            }]
+        }, ensure_ascii=False).encode('utf-8')
+        response = await client.post("/webhook", content=body, headers={
+            'content-type': 'application/json',
+            'x-line-signature': sign_body(body, LINE_CHANNEL_SECRET)
+        })
+        return response.status_code
+
+    async def converse(client, user_index: int):
+        user_id = f"Ubench{user_index:06d}"
+        for step, text in zip(BOOKING_STEPS, booking_messages(user_index, SERVICE_TIMES)):
+            started = time.perf_counter()
+            status = await post_message(client, user_id, text, f"{user_id}-{step}")
+            latencies[step].append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    await main.startup()
+    started = time.perf_counter()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            await asyncio.gather(*(converse(client, i) for i in range(users)))
+            if async_queue:
+                # รอ worker ประมวลผล event ที่ค้างในคิว
+                while main.event_queue.get_metrics()['depth'] or main.event_queue.get_metrics()['busy_workers']:
+                    await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    finally:
+        # shutdown flush การเขียนที่ค้างลง sheet จำลอง
+        await main.shutdown()
+
+    requests = sum(len(values) for values in latencies.values())
+    completed = len(worksheet.rows)
+    per_booking = lambda calls: {name: round(count / completed, 2) for name, count in sorted(calls.items())} if completed else {}
+    return {
+        'users': users,
+        'line_latency_ms': line_latency * 1000,
+        'sheets_latency_ms': sheets_latency * 1000,
+        'async_queue': async_queue,
+        'elapsed_seconds': round(elapsed, 3),
+        'requests': requests,
+        'requests_per_second': round(requests / elapsed, 1) if elapsed else 0.0,
+        'bookings_completed': completed,
+        'http_statuses': dict(statuses),
+        'latency': latency_summary([value for values in latencies.values() for value in values]),
+        'latency_by_step': {step: latency_summary(values) for step, values in latencies.items()},
+        'line_calls': dict(fake_line.calls),
+        'sheets_calls': dict(worksheet.calls),
+        'line_calls_per_booking': per_booking(fake_line.calls),
+        'sheets_calls_per_booking': per_booking(worksheet.calls)
+    }
+
+def format_report(report: Dict[str, Any]) -> str:
+    """รายงานแบบอ่านง่ายบน terminal"""
+    lines = [
+        f"users={report['users']} line_latency={report['line_latency_ms']:.0f}ms "
+        f"sheets_latency={report['sheets_latency_ms']:.0f}ms async_queue={report['async_queue']}",
+        f"{report['requests']} requests in {report['elapsed_seconds']}s "
+        f"({report['requests_per_second']} req/s), {report['bookings_completed']} bookings completed, "
+        f"statuses {report['http_statuses']}",
+        "",
+        f"{'step':<18}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    ]
+    rows = list(report['latency_by_step'].items()) + [('all', report['latency'])]
+    for step, summary in rows:
+        lines.append(
+            f"{step:<18}{summary['count']:>7}{summary['p50_ms']:>10}{summary['p95_ms']:>10}"
+            f"{summary['p99_ms']:>10}{summary['max_ms']:>10}"
+        )
+    lines.append("")
+    lines.append(f"LINE calls per booking:   {report['line_calls_per_booking']}")
+    lines.append(f"Sheets calls per booking: {report['sheets_calls_per_booking']}")
+    return "\n".join(lines)
+
+def main(argv: Optional[List[str]] = None):
+    """CLI: python benchmark.py --users 50 --line-latency-ms 40 --sheets-latency-ms 300"""
+    parser = argparse.ArgumentParser(description="Offline booking benchmark (fake LINE and Google Sheets)")
+    parser.add_argument("--users", type=int, default=20, help="จำนวนผู้ใช้ที่จองพร้อมกัน")
+    parser.add_argument("--line-latency-ms", type=float, default=30.0, help="เวลาตอบของ LINE API จำลอง")
+    parser.add_argument("--sheets-latency-ms", type=float, default=200.0, help="เวลาตอบของ Google Sheets จำลอง")
+    parser.add_argument("--async-queue", action="store_true", help="ตอบ webhook ทันทีแล้วประมวลผลในคิว")
+    parser.add_argument("--json", action="store_true", help="แสดงผลเป็น JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(
+        users=args.users,
+        line_latency=args.line_latency_ms / 1000,
+        sheets_latency=args.sheets_latency_ms / 1000,
+        async_queue=args.async_queue
+    ))
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+
+if __name__ == "__main__":
+    main()
@@ -12,10 +12,13 @@ from flex_messages import (
     send_user_reservations_flex
 )
 from models import ReservationData
-from google_sheets import (
-    add_reservation_to_sheet, 
-    find_user_reservations, 
-    cancel_reservation
+from availability import SERVICE_TIMES
+from google_sheets import SLOT_FULL_MESSAGE
+from sheets_io import (
+    add_reservation_to_sheet_async,
+    find_user_reservations_async,
+    cancel_reservation_async,
+    get_available_time_slots_async
 )
 from session_manager import (
     get_user_session, 
@@ -25,10 +28,13 @@ from session_manager import (
     start_cancellation_session,
     reset_timeout_task
 )
-from utils import get_line_display_name
+from profile_cache import get_cached_display_name
+from metrics import booking_step
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
+@traced()
 async def handle_booking_process(reply_token: str, user_id: str, message: str, display_name: str = None) -> bool:
     """
     จัดการกระบวนการจองโต๊ะ (ใช้กับระบบ session management)
@@ -38,7 +44,7 @@ async def handle_booking_process(reply_token: str, user_id: str, message: str, d
     """
     try:
         if not display_name:
-            display_name = get_line_display_name(user_id)
+            display_name = await get_cached_display_name(user_id)
         
         # ตรวจสอบคำสั่งพิเศษก่อน
         if message in ['จองโต๊ะ', 'จอง', 'booking']:
@@ -62,7 +68,7 @@ async def handle_booking_process(reply_token: str, user_id: str, message: str, d
             return True
         
         # ตรวจสอบว่าผู้ใช้อยู่ในระหว่างกระบวนการจองหรือไม่
-        session = get_user_session(user_id)
+        session = await get_user_session(user_id)
         if not session:
             return False
         
@@ -101,8 +107,8 @@ async def handle_booking_process(reply_token: str, user_id: str, message: str, d
         )
         
         # ล้างสถานะและแจ้งผู้ใช้
-        clear_reservation_session(user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในระบบ กรุณาเริ่มการจองใหม่อีกครั้ง\nพิมพ์ 'จองโต๊ะ' เพื่อเริ่มต้น")
+        await clear_reservation_session(user_id)
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในระบบ กรุณาเริ่มการจองใหม่อีกครั้ง\nพิมพ์ 'จองโต๊ะ' เพื่อเริ่มต้น")
         return True
 
 async def start_booking_process(reply_token: str, user_id: str, display_name: str):
@@ -115,7 +121,7 @@ async def start_booking_process(reply_token: str, user_id: str, display_name: st
         )
         
         # เริ่ม session ใหม่
-        start_reservation_session(user_id)
+        await start_reservation_session(user_id)
         
         reservation_info = (
             "🏮 ยินดีต้อนรับสู่ร้านยักษ์ใหญ่แดนใต้\n\n"
@@ -127,12 +133,13 @@ async def start_booking_process(reply_token: str, user_id: str, display_name: st
             "🔄 เริ่มขั้นตอนการจอง...\n"
             "ขอชื่อผู้จองค่ะ"
         )
-        reply_to_user(reply_token, reservation_info)
+        await reply_to_user(reply_token, reservation_info)
         
     except Exception as e:
         log_error_with_context(error=e, context="start_booking_process", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการเริ่มจอง กรุณาลองใหม่อีกครั้ง")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการเริ่มจอง กรุณาลองใหม่อีกครั้ง")
 
+@booking_step('name')
 async def handle_name_input(reply_token: str, user_id: str, name_text: str, display_name: str) -> bool:
     """จัดการการใส่ชื่อ"""
     try:
@@ -140,15 +147,15 @@ async def handle_name_input(reply_token: str, user_id: str, name_text: str, disp
         
         # ตรวจสอบความยาวชื่อ
         if len(name) < 2:
-            reply_to_user(reply_token, "กรุณาระบุชื่อที่มีความยาวอย่างน้อย 2 ตัวอักษร")
+            await reply_to_user(reply_token, "กรุณาระบุชื่อที่มีความยาวอย่างน้อย 2 ตัวอักษร")
             return True
             
         if len(name) > 50:
-            reply_to_user(reply_token, "ชื่อยาวเกินไป กรุณาระบุชื่อที่สั้นกว่า 50 ตัวอักษร")
+            await reply_to_user(reply_token, "ชื่อยาวเกินไป กรุณาระบุชื่อที่สั้นกว่า 50 ตัวอักษร")
             return True
         
         # อัพเดท session
-        update_user_session(user_id, step="phone", data={"customer_name": name})
+        await update_user_session(user_id, step="phone", data={"customer_name": name})
         
         log_booking_event(
             event_type="NAME_ENTERED",
@@ -157,14 +164,15 @@ async def handle_name_input(reply_token: str, user_id: str, name_text: str, disp
             details={"customer_name": name}
         )
         
-        reply_to_user(reply_token, "ขอเบอร์โทรค่ะ 📞\n\n(หากต้องการยกเลิก พิมพ์ 'ยกเลิก')")
+        await reply_to_user(reply_token, "ขอเบอร์โทรค่ะ 📞\n\n(หากต้องการยกเลิก พิมพ์ 'ยกเลิก')")
         return True
         
     except Exception as e:
         log_error_with_context(error=e, context="handle_name_input", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการระบุชื่อ กรุณาลองใหม่")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการระบุชื่อ กรุณาลองใหม่")
         return True
 
+@booking_step('phone')
 async def handle_phone_input(reply_token: str, user_id: str, phone_text: str, display_name: str) -> bool:
     """จัดการการใส่เบอร์โทร"""
     try:
@@ -173,11 +181,11 @@ async def handle_phone_input(reply_token: str, user_id: str, phone_text: str, di
         # ตรวจสอบรูปแบบเบอร์โทร (10 หลัก, เริ่มต้นด้วย 0)
         phone_pattern = r'^0\d{9}$'
         if not re.match(phone_pattern, phone):
-            reply_to_user(reply_token, "กรุณาระบุเบอร์โทรศัพท์ที่ถูกต้อง (10 หลัก เริ่มต้นด้วย 0)")
+            await reply_to_user(reply_token, "กรุณาระบุเบอร์โทรศัพท์ที่ถูกต้อง (10 หลัก เริ่มต้นด้วย 0)")
             return True
         
         # อัพเดท session
-        update_user_session(user_id, step="date", data={"phone": phone})
+        await update_user_session(user_id, step="date", data={"phone": phone})
         
         log_booking_event(
             event_type="PHONE_ENTERED",
@@ -187,21 +195,22 @@ async def handle_phone_input(reply_token: str, user_id: str, phone_text: str, di
         )
         
         # ส่งการเลือกวันที่
-        send_date_selection_flex(reply_token)
+        await send_date_selection_flex(reply_token)
         return True
         
     except Exception as e:
         log_error_with_context(error=e, context="handle_phone_input", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการระบุเบอร์โทร กรุณาลองใหม่")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการระบุเบอร์โทร กรุณาลองใหม่")
         return True
 
+@booking_step('date')
 async def handle_date_selection(reply_token: str, user_id: str, date_text: str, display_name: str) -> bool:
     """จัดการการเลือกวันที่"""
     try:
         # ตรวจสอบรูปแบบวันที่ (dd-mm-yyyy)
         date_pattern = r'^\d{1,2}-\d{1,2}-\d{4}$'
         if not re.match(date_pattern, date_text):
-            reply_to_user(reply_token, "กรุณาเลือกวันที่จากปุ่มที่กำหนดให้")
+            await reply_to_user(reply_token, "กรุณาเลือกวันที่จากปุ่มที่กำหนดให้")
             return True
         
         # แปลงและตรวจสอบวันที่
@@ -213,20 +222,26 @@ async def handle_date_selection(reply_token: str, user_id: str, date_text: str,
             # ตรวจสอบว่าเป็นวันที่ในอนาคต
             today = datetime.now().date()
             if selected_date < today:
-                reply_to_user(reply_token, "ไม่สามารถจองย้อนหลังได้ กรุณาเลือกวันที่ใหม่")
+                await reply_to_user(reply_token, "ไม่สามารถจองย้อนหลังได้ กรุณาเลือกวันที่ใหม่")
                 return True
                 
             # ตรวจสอบว่าไม่เกิน 7 วัน
             if (selected_date - today).days > 7:
-                reply_to_user(reply_token, "สามารถจองล่วงหน้าได้สูงสุด 7 วัน กรุณาเลือกวันที่ใหม่")
+                await reply_to_user(reply_token, "สามารถจองล่วงหน้าได้สูงสุด 7 วัน กรุณาเลือกวันที่ใหม่")
                 return True
                 
         except ValueError:
-            reply_to_user(reply_token, "รูปแบบวันที่ไม่ถูกต้อง กรุณาเลือกใหม่")
+            await reply_to_user(reply_token, "รูปแบบวันที่ไม่ถูกต้อง กรุณาเลือกใหม่")
+            return True
+        
+        # ดึงช่วงเวลาที่ยังว่างในวันนั้น
+        available_times = await get_available_time_slots_async(date_text)
+        if not available_times:
+            await reply_to_user(reply_token, f"ขออภัยค่ะ วันที่ {date_text} ที่นั่งเต็มทุกช่วงเวลาแล้ว กรุณาเลือกวันอื่นค่ะ")
             return True
         
         # อัพเดท session
-        update_user_session(user_id, step="time", data={"date": date_text})
+        await update_user_session(user_id, step="time", data={"date": date_text})
         
         log_booking_event(
             event_type="DATE_SELECTED",
@@ -235,22 +250,23 @@ async def handle_date_selection(reply_token: str, user_id: str, date_text: str,
             details={"selected_date": date_text}
         )
         
-        # ส่งการเลือกเวลา
-        send_time_selection_flex(reply_token)
+        # ส่งการเลือกเวลา (เฉพาะช่วงเวลาที่ยังว่าง)
+        await send_time_selection_flex(reply_token, available_times)
         return True
         
     except Exception as e:
         log_error_with_context(error=e, context="handle_date_selection", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการเลือกวันที่ กรุณาลองใหม่")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการเลือกวันที่ กรุณาลองใหม่")
         return True
 
+@booking_step('time')
 async def handle_time_selection(reply_token: str, user_id: str, time_text: str, display_name: str) -> bool:
     """จัดการการเลือกเวลา"""
     try:
         # ตรวจสอบรูปแบบเวลา (HH:MM)
         time_pattern = r'^\d{2}:\d{2}$'
         if not re.match(time_pattern, time_text):
-            reply_to_user(reply_token, "กรุณาเลือกเวลาจากปุ่มที่กำหนดให้")
+            await reply_to_user(reply_token, "กรุณาเลือกเวลาจากปุ่มที่กำหนดให้")
             return True
         
         # ตรวจสอบช่วงเวลาที่ให้บริการ
@@ -260,15 +276,23 @@ async def handle_time_selection(reply_token: str, user_id: str, time_text: str,
             end_time = datetime.strptime("21:30", "%H:%M").time()
             
             if not (start_time <= selected_time <= end_time):
-                reply_to_user(reply_token, "เวลาที่เลือกไม่ถูกต้อง กรุณาเลือกเวลา 18:30 - 21:30 น.")
+                await reply_to_user(reply_token, "เวลาที่เลือกไม่ถูกต้อง กรุณาเลือกเวลา 18:30 - 21:30 น.")
                 return True
                 
         except ValueError:
-            reply_to_user(reply_token, "รูปแบบเวลาไม่ถูกต้อง กรุณาเลือกใหม่")
+            await reply_to_user(reply_token, "รูปแบบเวลาไม่ถูกต้อง กรุณาเลือกใหม่")
+            return True
+        
+        # รับจองเฉพาะช่วงเวลาทุก 30 นาที (เวลาอื่นเช่น 19:15 ไม่มีในตารางที่นั่ง)
+        if time_text not in SERVICE_TIMES:
+            await reply_to_user(
+                reply_token,
+                f"กรุณาเลือกเวลาใดเวลาหนึ่งต่อไปนี้ค่ะ\n{', '.join(SERVICE_TIMES)}"
+            )
             return True
         
         # อัพเดท session
-        update_user_session(user_id, step="party_size", data={"time": time_text})
+        await update_user_session(user_id, step="party_size", data={"time": time_text})
         
         log_booking_event(
             event_type="TIME_SELECTED",
@@ -277,14 +301,15 @@ async def handle_time_selection(reply_token: str, user_id: str, time_text: str,
             details={"selected_time": time_text}
         )
         
-        reply_to_user(reply_token, "จำนวนคนค่ะ 👥\n\n(หากต้องการยกเลิก พิมพ์ 'ยกเลิก')")
+        await reply_to_user(reply_token, "จำนวนคนค่ะ 👥\n\n(หากต้องการยกเลิก พิมพ์ 'ยกเลิก')")
         return True
         
     except Exception as e:
         log_error_with_context(error=e, context="handle_time_selection", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการเลือกเวลา กรุณาลองใหม่")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการเลือกเวลา กรุณาลองใหม่")
         return True
 
+@booking_step('party_size')
 async def handle_party_size_input(reply_token: str, user_id: str, party_size_text: str, display_name: str) -> bool:
     """จัดการการใส่จำนวนคน"""
     try:
@@ -292,20 +317,45 @@ async def handle_party_size_input(reply_token: str, user_id: str, party_size_tex
         try:
             party_size = int(party_size_text.strip())
         except ValueError:
-            reply_to_user(reply_token, "กรุณาระบุจำนวนเป็นตัวเลขเท่านั้น (1-20)")
+            await reply_to_user(reply_token, "กรุณาระบุจำนวนเป็นตัวเลขเท่านั้น (1-20)")
             return True
         
         # ตรวจสอบช่วงจำนวนคน
         if party_size <= 0:
-            reply_to_user(reply_token, "กรุณาระบุจำนวนคนมากกว่า 0")
+            await reply_to_user(reply_token, "กรุณาระบุจำนวนคนมากกว่า 0")
             return True
             
         if party_size > 20:
-            reply_to_user(reply_token, "จำนวนคนเกิน 20 คน กรุณาติดต่อร้านโดยตรงค่ะ")
+            await reply_to_user(reply_token, "จำนวนคนเกิน 20 คน กรุณาติดต่อร้านโดยตรงค่ะ")
             return True
         
+        # ตรวจสอบว่าช่วงเวลาที่เลือกยังรับจำนวนคนนี้ได้
+        session = await get_user_session(user_id)
+        session_data = session.get('data', {}) if session else {}
+        selected_date = session_data.get('date')
+        selected_time = session_data.get('time')
+        
+        if selected_date and selected_time:
+            available_times = await get_available_time_slots_async(selected_date, party_size)
+            if selected_time not in available_times:
+                if available_times:
+                    # ให้เลือกเวลาใหม่จากช่วงที่ยังรับได้
+                    await update_user_session(user_id, step="time")
+                    await send_time_selection_flex(
+                        reply_token,
+                        available_times,
+                        note=f"เวลา {selected_time} น. ที่นั่งไม่พอสำหรับ {party_size} ท่านแล้ว กรุณาเลือกเวลาอื่นค่ะ"
+                    )
+                else:
+                    await update_user_session(user_id, step="date")
+                    await reply_to_user(
+                        reply_token,
+                        f"ขออภัยค่ะ วันที่ {selected_date} ไม่มีช่วงเวลาที่รองรับ {party_size} ท่านแล้ว กรุณาเลือกวันอื่นค่ะ"
+                    )
+                return True
+        
         # อัพเดท session
-        update_user_session(user_id, step="special_requests", data={"party_size": party_size})
+        await update_user_session(user_id, step="special_requests", data={"party_size": party_size})
         
         log_booking_event(
             event_type="PARTY_SIZE_ENTERED",
@@ -314,21 +364,22 @@ async def handle_party_size_input(reply_token: str, user_id: str, party_size_tex
             details={"party_size": party_size}
         )
         
-        reply_to_user(reply_token, "มีคำขอเพิ่มเติมไหมคะ (เช่น โต๊ะริมหน้าต่าง, อาหารแพ้)\nถ้าไม่มี พิมพ์ - ค่ะ\n\n(หากต้องการยกเลิก พิมพ์ 'ยกเลิก')")
+        await reply_to_user(reply_token, "มีคำขอเพิ่มเติมไหมคะ (เช่น โต๊ะริมหน้าต่าง, อาหารแพ้)\nถ้าไม่มี พิมพ์ - ค่ะ\n\n(หากต้องการยกเลิก พิมพ์ 'ยกเลิก')")
         return True
         
     except Exception as e:
         log_error_with_context(error=e, context="handle_party_size_input", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการระบุจำนวนคน กรุณาลองใหม่")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการระบุจำนวนคน กรุณาลองใหม่")
         return True
 
+@booking_step('special_requests')
 async def handle_special_requests_input(reply_token: str, user_id: str, requests_text: str, display_name: str) -> bool:
     """จัดการการใส่ความต้องการพิเศษและทำการจองให้สมบูรณ์"""
     try:
         special_requests = requests_text.strip() if requests_text.strip() != "-" else ""
         
         if len(special_requests) > 200:
-            reply_to_user(reply_token, "ความต้องการพิเศษยาวเกินไป กรุณาระบุให้สั้นกว่า 200 ตัวอักษร")
+            await reply_to_user(reply_token, "ความต้องการพิเศษยาวเกินไป กรุณาระบุให้สั้นกว่า 200 ตัวอักษร")
             return True
         
         log_booking_event(
@@ -339,9 +390,9 @@ async def handle_special_requests_input(reply_token: str, user_id: str, requests
         )
         
         # ดึงข้อมูลจาก session
-        session = get_user_session(user_id)
+        session = await get_user_session(user_id)
         if not session:
-            reply_to_user(reply_token, "เซสชันหมดอายุ กรุณาเริ่มจองใหม่")
+            await reply_to_user(reply_token, "เซสชันหมดอายุ กรุณาเริ่มจองใหม่")
             return True
         
         session_data = session.get('data', {})
@@ -361,10 +412,24 @@ async def handle_special_requests_input(reply_token: str, user_id: str, requests
         )
         
         # บันทึกลง Google Sheets
-        success, msg, booking_id = add_reservation_to_sheet(reservation)
+        success, msg, booking_id = await add_reservation_to_sheet_async(reservation)
+        
+        # ช่วงเวลาเพิ่งเต็มระหว่างบันทึก ให้เลือกเวลาใหม่โดยไม่ต้องเริ่มจองใหม่
+        if not success and msg == SLOT_FULL_MESSAGE:
+            available_times = await get_available_time_slots_async(reservation.date, reservation.party_size)
+            if available_times:
+                log_booking_event(
+                    event_type="BOOKING_SLOT_FULL",
+                    user_id=user_id,
+                    user_name=display_name,
+                    details={"date": reservation.date, "time": reservation.time, "party_size": reservation.party_size}
+                )
+                await update_user_session(user_id, step="time")
+                await send_time_selection_flex(reply_token, available_times, note=msg)
+                return True
         
         # ล้าง session
-        clear_reservation_session(user_id)
+        await clear_reservation_session(user_id)
         
         if success:
             reservation.booking_id = booking_id
@@ -381,7 +446,7 @@ async def handle_special_requests_input(reply_token: str, user_id: str, requests
                 }
             )
             
-            send_flex_confirmation(reply_token, reservation)
+            await send_flex_confirmation(reply_token, reservation)
         else:
             log_booking_event(
                 event_type="BOOKING_FAILED",
@@ -390,14 +455,14 @@ async def handle_special_requests_input(reply_token: str, user_id: str, requests
                 details={"error_message": msg}
             )
             
-            reply_to_user(reply_token, msg)
+            await reply_to_user(reply_token, msg)
         
         return True
         
     except Exception as e:
         log_error_with_context(error=e, context="handle_special_requests_input", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการทำรายการจอง กรุณาลองใหม่อีกครั้ง")
-        clear_reservation_session(user_id)
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการทำรายการจอง กรุณาลองใหม่อีกครั้ง")
+        await clear_reservation_session(user_id)
         return True
 
 async def show_user_reservations(reply_token: str, user_id: str, display_name: str):
@@ -410,12 +475,12 @@ async def show_user_reservations(reply_token: str, user_id: str, display_name: s
         )
         
         # เริ่ม session สำหรับการยกเลิก
-        start_cancellation_session(user_id)
-        reply_to_user(reply_token, "กรุณาใส่เบอร์โทรที่ใช้จองเพื่อค้นหาการจองของคุณค่ะ")
+        await start_cancellation_session(user_id)
+        await reply_to_user(reply_token, "กรุณาใส่เบอร์โทรที่ใช้จองเพื่อค้นหาการจองของคุณค่ะ")
         
     except Exception as e:
         log_error_with_context(error=e, context="show_user_reservations", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการดูรายการจอง กรุณาลองใหม่")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการดูรายการจอง กรุณาลองใหม่")
 
 async def start_cancellation_process(reply_token: str, user_id: str, display_name: str):
     """เริ่มกระบวนการยกเลิกการจอง"""
@@ -426,13 +491,14 @@ async def start_cancellation_process(reply_token: str, user_id: str, display_nam
             user_name=display_name
         )
         
-        start_cancellation_session(user_id)
-        reply_to_user(reply_token, "กรุณาใส่เบอร์โทรที่ใช้จองเพื่อค้นหาการจองของคุณค่ะ")
+        await start_cancellation_session(user_id)
+        await reply_to_user(reply_token, "กรุณาใส่เบอร์โทรที่ใช้จองเพื่อค้นหาการจองของคุณค่ะ")
         
     except Exception as e:
         log_error_with_context(error=e, context="start_cancellation_process", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการเริ่มกระบวนการยกเลิก กรุณาลองใหม่")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการเริ่มกระบวนการยกเลิก กรุณาลองใหม่")
 
+@booking_step('cancel_phone')
 async def handle_cancellation_phone_input(reply_token: str, user_id: str, phone_text: str, display_name: str) -> bool:
     """จัดการเบอร์โทรสำหรับการยกเลิก"""
     try:
@@ -446,16 +512,16 @@ async def handle_cancellation_phone_input(reply_token: str, user_id: str, phone_
         )
         
         # ค้นหาการจอง
-        reservations = find_user_reservations(phone)
+        reservations = await find_user_reservations_async(phone)
         
         # ตรวจสอบว่ามีข้อมูลการยกเลิกเฉพาะจาก session
-        session = get_user_session(user_id)
+        session = await get_user_session(user_id)
         session_data = session.get('data', {}) if session else {}
         
         if "cancel_date" in session_data and "cancel_time" in session_data:
             # ยกเลิกการจองเฉพาะ
-            success, msg = cancel_reservation(phone, session_data["cancel_date"], session_data["cancel_time"])
-            clear_reservation_session(user_id)
+            success, msg = await cancel_reservation_async(phone, session_data["cancel_date"], session_data["cancel_time"])
+            await clear_reservation_session(user_id)
             
             if success:
                 log_booking_event(
@@ -481,22 +547,22 @@ async def handle_cancellation_phone_input(reply_token: str, user_id: str, phone_
                     }
                 )
             
-            reply_to_user(reply_token, msg)
+            await reply_to_user(reply_token, msg)
         else:
             # แสดงรายการการจองทั้งหมด
-            clear_reservation_session(user_id)
+            await clear_reservation_session(user_id)
             
             if reservations:
-                send_user_reservations_flex(reply_token, reservations)
+                await send_user_reservations_flex(reply_token, reservations)
             else:
-                reply_to_user(reply_token, "ไม่พบการจองของเบอร์นี้ในระบบค่ะ")
+                await reply_to_user(reply_token, "ไม่พบการจองของเบอร์นี้ในระบบค่ะ")
         
         return True
         
     except Exception as e:
         log_error_with_context(error=e, context="handle_cancellation_phone_input", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการค้นหาการจอง กรุณาลองใหม่")
-        clear_reservation_session(user_id)
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการค้นหาการจอง กรุณาลองใหม่")
+        await clear_reservation_session(user_id)
         return True
 
 async def handle_specific_cancellation(reply_token: str, user_id: str, cancel_message: str, display_name: str):
@@ -505,7 +571,7 @@ async def handle_specific_cancellation(reply_token: str, user_id: str, cancel_me
         # แยกข้อมูลจากข้อความ: "ยกเลิก:dd-mm-yyyy:HH:MM"
         parts = cancel_message.split(':')
         if len(parts) != 3:
-            reply_to_user(reply_token, "รูปแบบการยกเลิกไม่ถูกต้อง")
+            await reply_to_user(reply_token, "รูปแบบการยกเลิกไม่ถูกต้อง")
             return
         
         _, date_part, time_part = parts
@@ -518,25 +584,25 @@ async def handle_specific_cancellation(reply_token: str, user_id: str, cancel_me
         )
         
         # เริ่ม session สำหรับการยกเลิกเฉพาะ
-        start_cancellation_session(user_id)
-        update_user_session(user_id, data={
+        await start_cancellation_session(user_id)
+        await update_user_session(user_id, data={
             "cancel_date": date_part,
             "cancel_time": time_part
         })
         
-        reply_to_user(reply_token, f"กรุณายืนยันการยกเลิกการจอง\nวันที่: {date_part} เวลา: {time_part}\n\nกรุณาใส่เบอร์โทรที่ใช้จองค่ะ")
+        await reply_to_user(reply_token, f"กรุณายืนยันการยกเลิกการจอง\nวันที่: {date_part} เวลา: {time_part}\n\nกรุณาใส่เบอร์โทรที่ใช้จองค่ะ")
         
     except Exception as e:
         log_error_with_context(error=e, context="handle_specific_cancellation", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการยกเลิกการจอง กรุณาลองใหม่")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการยกเลิกการจอง กรุณาลองใหม่")
 
 async def cancel_booking_process(reply_token: str, user_id: str, display_name: str):
     """ยกเลิกขั้นตอนการจอง"""
     try:
-        session = get_user_session(user_id)
+        session = await get_user_session(user_id)
         
         if session:
-            clear_reservation_session(user_id)
+            await clear_reservation_session(user_id)
             
             log_booking_event(
                 event_type="BOOKING_PROCESS_CANCELLED",
@@ -544,30 +610,30 @@ async def cancel_booking_process(reply_token: str, user_id: str, display_name: s
                 user_name=display_name
             )
             
-            reply_to_user(reply_token, "ยกเลิกขั้นตอนการจองเรียบร้อยแล้ว 😊\nหากต้องการจองใหม่ สามารถพิมพ์ 'จองโต๊ะ' ได้เลยค่ะ")
+            await reply_to_user(reply_token, "ยกเลิกขั้นตอนการจองเรียบร้อยแล้ว 😊\nหากต้องการจองใหม่ สามารถพิมพ์ 'จองโต๊ะ' ได้เลยค่ะ")
         else:
-            reply_to_user(reply_token, "ไม่พบขั้นตอนการจองที่ต้องยกเลิก")
+            await reply_to_user(reply_token, "ไม่พบขั้นตอนการจองที่ต้องยกเลิก")
             
     except Exception as e:
         log_error_with_context(error=e, context="cancel_booking_process", user_id=user_id)
-        reply_to_user(reply_token, "เกิดข้อผิดพลาดในการยกเลิกขั้นตอน")
+        await reply_to_user(reply_token, "เกิดข้อผิดพลาดในการยกเลิกขั้นตอน")
 
 # Utility functions สำหรับการตรวจสอบสถานะ
-def get_active_booking_sessions() -> List[str]:
+async def get_active_booking_sessions() -> List[str]:
     """ดึงรายชื่อ user_id ที่มี session การจองที่ active"""
     # ฟังก์ชันนี้ต้องใช้ร่วมกับ session_manager
     from session_manager import get_all_active_sessions
     try:
-        active_sessions = get_all_active_sessions()
+        active_sessions = await get_all_active_sessions()
         return [session['user_id'] for session in active_sessions if session.get('step') != 'cancel_phone']
     except Exception as e:
         logger.error(f"Error getting active booking sessions: {e}")
         return []
 
-def get_booking_session_info(user_id: str) -> Optional[Dict[str, Any]]:
+async def get_booking_session_info(user_id: str) -> Optional[Dict[str, Any]]:
     """ดึงข้อมูล session การจองของผู้ใช้"""
     try:
-        session = get_user_session(user_id)
+        session = await get_user_session(user_id)
         if not session:
             return None
         
@@ -582,19 +648,19 @@ def get_booking_session_info(user_id: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Error getting booking session info for {user_id}: {e}")
         return None
 
-def cleanup_expired_sessions():
+async def cleanup_expired_sessions():
     """ล้าง session ที่หมดอายุ (เรียกจาก scheduled job)"""
     try:
         from session_manager import cleanup_expired_sessions as cleanup
-        cleanup()
+        await cleanup()
         logger.info("Expired sessions cleaned up successfully")
     except Exception as e:
         logger.error(f"Error cleaning up expired sessions: {e}")
 
-def is_user_in_booking_process(user_id: str) -> bool:
+async def is_user_in_booking_process(user_id: str) -> bool:
     """ตรวจสอบว่าผู้ใช้อยู่ในกระบวนการจองหรือไม่"""
     try:
-        session = get_user_session(user_id)
+        session = await get_user_session(user_id)
         return session is not None and session.get('step') in [
             'name', 'phone', 'date', 'time', 'party_size', 'special_requests'
         ]
@@ -602,10 +668,10 @@ def is_user_in_booking_process(user_id: str) -> bool:
         logger.error(f"Error checking booking process for {user_id}: {e}")
         return False
 
-def get_booking_progress(user_id: str) -> Dict[str, Any]:
+async def get_booking_progress(user_id: str) -> Dict[str, Any]:
     """ดึงความคืบหน้าการจองของผู้ใช้"""
     try:
-        session = get_user_session(user_id)
+        session = await get_user_session(user_id)
         if not session:
             return {'progress': 0, 'step': 'none', 'data': {}}
         
@@ -633,21 +699,21 @@ def get_booking_progress(user_id: str) -> Dict[str, Any]:
         return {'progress': 0, 'step': 'error', 'data': {}}
 
 # ฟังก์ชันสำหรับ admin
-def get_all_bookings_in_progress() -> List[Dict[str, Any]]:
+async def get_all_bookings_in_progress() -> List[Dict[str, Any]]:
     """ดึงการจองทั้งหมดที่อยู่ระหว่างดำเนินการ (สำหรับ admin)"""
     try:
-        active_users = get_active_booking_sessions()
+        active_users = await get_active_booking_sessions()
         bookings = []
         
         for user_id in active_users:
-            progress = get_booking_progress(user_id)
+            progress = await get_booking_progress(user_id)
             if progress['progress'] > 0:
-                display_name = get_line_display_name(user_id)
+                display_name = await get_cached_display_name(user_id)
                 bookings.append({
                     'user_id': user_id,
                     'display_name': display_name,
                     'progress': progress,
-                    'started_at': get_user_session(user_id).get('created_at')
+                    'started_at': (await get_user_session(user_id) or {}).get('created_at')
                 })
         
         return bookings
@@ -664,11 +730,11 @@ async def handle_booking_timeout(user_id: str):
         log_booking_event(
             event_type="BOOKING_TIMEOUT",
             user_id=user_id,
-            user_name=get_line_display_name(user_id)
+            user_name=await get_cached_display_name(user_id)
         )
         
         # ส่งข้อความเตือน
-        send_timeout_warning_flex(user_id)
+        await send_timeout_warning_flex(user_id)
         
         # อาจจะลบ session หรือทำ action อื่นๆ ตามต้องการ
         # clear_reservation_session(user_id)
@@ -1,8 +1,10 @@
 import os
 import logging
-from logging.handlers import RotatingFileHandler
 from datetime import datetime
 
+from log_pipeline import LogPipeline, BatchedRotatingFileHandler
+from structured_log import EventSampler, encode_log_line, parse_sample_rates
+
 # Environment Variables
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")
@@ -15,16 +17,119 @@ ADMIN_GROUP_ID = os.getenv("ADMIN_GROUP_ID")
 APP_TITLE = os.getenv("APP_TITLE", "LINE Bot Restaurant Booking")
 APP_VERSION = os.getenv("APP_VERSION", "1.0.0")
 
+# Reservation Store (cache ข้อมูลการจองใน memory)
+# โหลดข้อมูลจาก sheet ใหม่ทุกๆ x วินาที เพื่อรับการแก้ไขที่ทำใน sheet โดยตรง
+RESERVATION_STORE_TTL_SECONDS = int(os.getenv("RESERVATION_STORE_TTL_SECONDS", "300"))
+
+# Webhook event queue (ตอบ LINE ทันทีแล้วประมวลผล event เบื้องหลัง)
+WEBHOOK_ASYNC_PROCESSING = os.getenv("WEBHOOK_ASYNC_PROCESSING", "true").lower() == "true"
+WEBHOOK_QUEUE_WORKERS = int(os.getenv("WEBHOOK_QUEUE_WORKERS", "8"))
+WEBHOOK_QUEUE_MAX_SIZE = int(os.getenv("WEBHOOK_QUEUE_MAX_SIZE", "1000"))
+WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS", "2"))
+
+# จำกัดจำนวน event ที่ประมวลผลพร้อมกัน (ต่อ webhook request และทั้ง process)
+MAX_CONCURRENT_EVENTS_PER_WEBHOOK = int(os.getenv("MAX_CONCURRENT_EVENTS_PER_WEBHOOK", "10"))
+MAX_CONCURRENT_EVENTS = int(os.getenv("MAX_CONCURRENT_EVENTS", "50"))
+
+# Thread pool สำหรับเรียก Google Sheets (gspread เป็น blocking I/O)
+SHEETS_IO_POOL_SIZE = int(os.getenv("SHEETS_IO_POOL_SIZE", "4"))
+
+# Write-behind buffer สำหรับการเขียน Google Sheets
+# รวมการเขียนหลายรายการเป็น append_rows / batch_update ครั้งเดียว เมื่อครบจำนวนหรือครบเวลา
+# ปิด (false) = เขียนลง sheet ทันทีทุกครั้ง (ยังรวม cell ของรายการเดียวกันเป็น request เดียว)
+WRITE_BUFFER_ENABLED = os.getenv("WRITE_BUFFER_ENABLED", "true").lower() == "true"
+WRITE_BUFFER_MAX_OPS = int(os.getenv("WRITE_BUFFER_MAX_OPS", "20"))
+WRITE_BUFFER_FLUSH_INTERVAL_SECONDS = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL_SECONDS", "2"))
+
+# การเรียก Google Sheets API (ใช้ร่วมกันทุก request ของ process)
+# จำกัดอัตราตามโควต้าต่อนาที, error ชั่วคราว (429 / 5xx) ลองใหม่แบบ exponential backoff + jitter
+# ล้มเหลวต่อเนื่องครบ SHEETS_CIRCUIT_FAILURE_THRESHOLD ครั้ง = หยุดเรียก SHEETS_CIRCUIT_RESET_SECONDS วินาที
+SHEETS_RATE_LIMIT_PER_MINUTE = float(os.getenv("SHEETS_RATE_LIMIT_PER_MINUTE", "60"))
+SHEETS_RATE_LIMIT_BURST = int(os.getenv("SHEETS_RATE_LIMIT_BURST", "10"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "4"))
+SHEETS_BACKOFF_BASE_SECONDS = float(os.getenv("SHEETS_BACKOFF_BASE_SECONDS", "0.5"))
+SHEETS_BACKOFF_MAX_SECONDS = float(os.getenv("SHEETS_BACKOFF_MAX_SECONDS", "16"))
+SHEETS_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("SHEETS_CIRCUIT_FAILURE_THRESHOLD", "5"))
+SHEETS_CIRCUIT_RESET_SECONDS = float(os.getenv("SHEETS_CIRCUIT_RESET_SECONDS", "30"))
+
+# Ledger การจอง (SQLite WAL) บันทึกทุกการเปลี่ยนแปลงก่อนยืนยันกับผู้ใช้
+# แล้วจึงเขียนตามลง sheet ภายหลัง ถ้าเขียนไม่สำเร็จจะลองใหม่โดยเว้นระยะเพิ่มขึ้นเรื่อยๆ ไม่เกิน REPLICATION_MAX_BACKOFF_SECONDS
+LEDGER_PATH = os.getenv("LEDGER_PATH", "data/reservation_ledger.db")
+REPLICATION_MAX_BACKOFF_SECONDS = float(os.getenv("REPLICATION_MAX_BACKOFF_SECONDS", "60"))
+# ทุก worker ใช้ไฟล์ ledger เดียวกันได้: แต่ละ worker ถือ lease ของ event ที่ตัวเองเขียนและต่ออายุเป็นระยะ
+# event ที่ lease หมดอายุ (worker ตาย) จึงจะถูก worker อื่นรับไปเขียนต่อ
+LEDGER_LEASE_SECONDS = float(os.getenv("LEDGER_LEASE_SECONDS", "60"))
+
+# Backup (เก็บ fingerprint ของแต่ละแถวจาก snapshot ล่าสุด สำหรับ incremental backup)
+BACKUP_STATE_PATH = os.getenv("BACKUP_STATE_PATH", "data/backup_state.json")
+
+# Index เบอร์โทร -> การจอง (SQLite) สำหรับ "ดูการจอง" โดยไม่ต้องโหลดทั้ง sheet
+# สร้างใหม่จาก sheet ได้ด้วย: python phone_index.py rebuild
+PHONE_INDEX_PATH = os.getenv("PHONE_INDEX_PATH", "data/phone_index.db")
+
+# ความจุของร้านต่อช่วงเวลา (ใช้คำนวณช่วงเวลาที่ยังรับจองได้)
+SLOT_SEAT_CAPACITY = int(os.getenv("SLOT_SEAT_CAPACITY", "40"))
+SLOT_TABLE_CAPACITY = int(os.getenv("SLOT_TABLE_CAPACITY", "10"))
+SEATS_PER_TABLE = int(os.getenv("SEATS_PER_TABLE", "4"))
+
+# Session Store (memory / redis / sqlite)
+# ถ้ารันหลาย worker (uvicorn --workers N) ต้องใช้ redis หรือ sqlite เพื่อให้ทุก worker เห็น session เดียวกัน
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").lower()
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_REDIS_PREFIX = os.getenv("SESSION_REDIS_PREFIX", "booking:session:")
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "data/sessions.db")
+
 # LINE Headers
 LINE_HEADERS = {
     "Content-Type": "application/json",
     "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}"
 }
 
+# LINE Messaging API client (connection pool ที่ใช้ร่วมกัน)
+LINE_API_BASE_URL = os.getenv("LINE_API_BASE_URL", "https://api.line.me")
+LINE_HTTP_TIMEOUT_SECONDS = float(os.getenv("LINE_HTTP_TIMEOUT_SECONDS", "10"))
+LINE_HTTP_MAX_CONNECTIONS = int(os.getenv("LINE_HTTP_MAX_CONNECTIONS", "20"))
+LINE_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LINE_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LINE_MAX_CONCURRENT_REQUESTS = int(os.getenv("LINE_MAX_CONCURRENT_REQUESTS", "20"))
+
+# Cache ชื่อแสดงของผู้ใช้ LINE (profile)
+PROFILE_CACHE_MAX_SIZE = int(os.getenv("PROFILE_CACHE_MAX_SIZE", "10000"))
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "3600"))
+PROFILE_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+
+# Metrics สำหรับ Prometheus (/metrics) ปิดได้ถ้าไม่ต้องการ
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Endpoint สำหรับผู้ดูแล (/admin/...) ต้องส่ง header X-Admin-Token (ไม่ตั้ง = ปิด endpoint)
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+
+# Trace span ของ webhook / ขั้นตอนการจอง / การเรียก Sheets และ LINE API (เขียนลง logs/trace.jsonl)
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2000"))
+
 # ======================= LOGGING CONFIGURATION =======================
 
+# Logging แบบ async: logger แค่ใส่ record ลงคิว thread แยกเขียนไฟล์ทีละ batch
+# คิวเต็ม = ทิ้ง record ใหม่ (นับไว้ใน /health) แทนที่จะให้ request รอ disk
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+
+# รูปแบบ booking.log / webhook.log: "text" (อ่านง่าย) หรือ "json" (JSON หนึ่งบรรทัดต่อ event)
+# LOG_SAMPLE_RATES กำหนดสัดส่วนที่เก็บของ event ที่มีจำนวนมาก เช่น "MESSAGE_RECEIVED=0.1"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_SAMPLE_RATES = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+# Sampler ของ booking / webhook log ที่ใช้ร่วมกันทั้ง process (นับปริมาณ log ของแต่ละ event ด้วย)
+log_sampler = EventSampler(LOG_SAMPLE_RATES)
+
+# Pipeline ที่ใช้ร่วมกันทั้ง process (None = LOG_ASYNC ปิด เขียน log ตรงใน thread ที่เรียก)
+log_pipeline = None
+
 def setup_logging():
     """ตั้งค่า logging สำหรับระบบ"""
+    global log_pipeline
     
     # สร้างโฟลเดอร์ logs ถ้าไม่มี
     log_dir = "logs"
@@ -52,10 +157,9 @@ def setup_logging():
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
     
     # === 2. General Log File (ทุกอย่าง) ===
-    general_handler = RotatingFileHandler(
+    general_handler = BatchedRotatingFileHandler(
         filename=f"{log_dir}/app.log",
         maxBytes=10*1024*1024,  # 10MB
         backupCount=5,  # เก็บไฟล์ย้อนหลัง 5 ไฟล์
@@ -63,10 +167,9 @@ def setup_logging():
     )
     general_handler.setLevel(logging.DEBUG)
     general_handler.setFormatter(formatter)
-    logger.addHandler(general_handler)
     
     # === 3. Error Log File (เฉพาะ Error) ===
-    error_handler = RotatingFileHandler(
+    error_handler = BatchedRotatingFileHandler(
         filename=f"{log_dir}/error.log",
         maxBytes=10*1024*1024,  # 10MB
         backupCount=5,
@@ -74,30 +177,30 @@ def setup_logging():
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
     
     # === 4. Booking Log File (เฉพาะการจอง) ===
-    booking_handler = RotatingFileHandler(
+    booking_handler = BatchedRotatingFileHandler(
         filename=f"{log_dir}/booking.log",
         maxBytes=5*1024*1024,  # 5MB
         backupCount=10,
         encoding='utf-8'
     )
     booking_handler.setLevel(logging.INFO)
+    # โหมด json: message เป็น JSON ที่มีเวลาอยู่แล้ว ไม่ต้องเติมอะไร
+    json_formatter = logging.Formatter('%(message)s')
     booking_formatter = logging.Formatter(
         '%(asctime)s | BOOKING | %(levelname)s | %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    booking_handler.setFormatter(booking_formatter)
+    booking_handler.setFormatter(json_formatter if LOG_FORMAT == "json" else booking_formatter)
     
     # สร้าง logger เฉพาะสำหรับ booking
     booking_logger = logging.getLogger('booking')
     booking_logger.setLevel(logging.INFO)
-    booking_logger.addHandler(booking_handler)
     booking_logger.propagate = False  # ไม่ให้ส่งต่อไป parent logger
     
     # === 5. Webhook Log File (เฉพาะ webhook requests) ===
-    webhook_handler = RotatingFileHandler(
+    webhook_handler = BatchedRotatingFileHandler(
         filename=f"{log_dir}/webhook.log",
         maxBytes=10*1024*1024,  # 10MB
         backupCount=3,
@@ -108,33 +211,103 @@ def setup_logging():
         '%(asctime)s | WEBHOOK | %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    webhook_handler.setFormatter(webhook_formatter)
+    webhook_handler.setFormatter(json_formatter if LOG_FORMAT == "json" else webhook_formatter)
     
     # สร้าง logger เฉพาะสำหรับ webhook
     webhook_logger = logging.getLogger('webhook')
     webhook_logger.setLevel(logging.INFO)
-    webhook_logger.addHandler(webhook_handler)
     webhook_logger.propagate = False
     
-    print(f"✅ Logging setup completed - Level: {log_level}")
+    # === 6. Trace File (span ที่จบแล้ว, JSON lines) ===
+    trace_handler = BatchedRotatingFileHandler(
+        filename=f"{log_dir}/trace.jsonl",
+        maxBytes=20*1024*1024,  # 20MB
+        backupCount=3,
+        encoding='utf-8',
+        delay=True  # ไม่สร้างไฟล์ถ้าไม่ได้เปิด tracing
+    )
+    trace_handler.setLevel(logging.INFO)
+    trace_handler.setFormatter(json_formatter)
+    
+    trace_logger = logging.getLogger('trace')
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+    
+    # === ส่ง handler ให้ logger แต่ละตัว (ผ่านคิว หรือเขียนตรง) ===
+    routes = {
+        None: [console_handler, general_handler, error_handler],
+        'booking': [booking_handler],
+        'webhook': [webhook_handler],
+        'trace': [trace_handler] if TRACE_ENABLED else []
+    }
+    
+    if log_pipeline is not None:
+        log_pipeline.stop()
+        log_pipeline = None
+    
+    if LOG_ASYNC:
+        log_pipeline = LogPipeline(max_queue=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE)
+        for name, handlers in routes.items():
+            log_pipeline.route(name, handlers)
+            target = logging.getLogger(name)
+            for handler in target.handlers[:]:
+                target.removeHandler(handler)
+            target.addHandler(log_pipeline.handler())
+        log_pipeline.start()
+    else:
+        for name, handlers in routes.items():
+            target = logging.getLogger(name)
+            for handler in target.handlers[:]:
+                target.removeHandler(handler)
+            for handler in handlers:
+                # โหมดเขียนตรงต้อง flush ทุก record
+                if isinstance(handler, BatchedRotatingFileHandler):
+                    handler.batched = False
+                target.addHandler(handler)
+    
+    print(f"✅ Logging setup completed - Level: {log_level} ({'async queue' if LOG_ASYNC else 'sync'}, {LOG_FORMAT})")
     print(f"📁 Log directory: {os.path.abspath(log_dir)}")
     
     return logger
 
+def get_logging_stats() -> dict:
+    """สถิติของ log pipeline (จำนวนที่เขียน / ที่ถูกทิ้ง / ที่ค้างในคิว)"""
+    if log_pipeline is None:
+        return {'async': False}
+    return log_pipeline.get_stats()
+
+def get_log_volume_report() -> dict:
+    """ปริมาณ booking / webhook log แยกตามชนิด event (จำนวน, bytes, สัดส่วน)"""
+    return log_sampler.report()
+
 # === Custom Log Functions ===
+def _emit(logger_name: str, event_type: str, *messages: str):
+    # นับเป็น event เดียวแม้จะเขียนหลายบรรทัด
+    log_sampler.record(event_type, sum(len(message.encode('utf-8')) for message in messages))
+    target = logging.getLogger(logger_name)
+    for message in messages:
+        target.info(message)
+
+def _json_event(event_type: str, fields: dict) -> str:
+    data = {"ts": datetime.now().isoformat(timespec='milliseconds'), "event": event_type}
+    rate = log_sampler.rate(event_type)
+    if rate < 1.0:
+        # บอกสัดส่วนที่เก็บ เพื่อคูณกลับเป็นจำนวนจริงตอนวิเคราะห์
+        data["sample_rate"] = rate
+    data.update(fields)
+    return encode_log_line(data)
+
 def log_booking_event(event_type: str, user_id: str, user_name: str, details: dict = None):
     """บันทึก log เฉพาะเหตุการณ์การจอง"""
-    booking_logger = logging.getLogger('booking')
-    
-    log_data = {
-        "event": event_type,
-        "user_id": user_id,
-        "user_name": user_name,
-        "timestamp": datetime.now().isoformat()
-    }
+    if not log_sampler.should_log(event_type):
+        return
     
-    if details:
-        log_data.update(details)
+    if LOG_FORMAT == "json":
+        fields = {"user_id": user_id, "user_name": user_name}
+        if details:
+            fields["details"] = details
+        _emit('booking', event_type, _json_event(event_type, fields))
+        return
     
     # แปลงเป็น string ที่อ่านง่าย
     log_message = f"{event_type} | User: {user_name} ({user_id})"
@@ -142,25 +315,42 @@ def log_booking_event(event_type: str, user_id: str, user_name: str, details: di
         detail_str = " | ".join([f"{k}: {v}" for k, v in details.items()])
         log_message += f" | {detail_str}"
     
-    booking_logger.info(log_message)
+    _emit('booking', event_type, log_message)
 
-def log_webhook_request(method: str, headers: dict, body: dict, response_status: int = None):
-    """บันทึก log เฉพาะ webhook requests"""
-    webhook_logger = logging.getLogger('webhook')
+def log_webhook_request(method: str, headers: dict, body: dict = None, response_status: int = None):
+    """บันทึก log เฉพาะ webhook requests (body = None บันทึกแค่บรรทัดสถานะ)"""
+    event_type = "WEBHOOK_STATUS" if body is None else "WEBHOOK_REQUEST"
+    if not log_sampler.should_log(event_type):
+        return
     
-    # ซ่อนข้อมูลสำคัญ
-    safe_headers = {k: v for k, v in headers.items() if k.lower() not in ['authorization', 'x-line-signature']}
-    if 'authorization' in headers:
-        safe_headers['authorization'] = 'Bearer ***HIDDEN***'
-    if 'x-line-signature' in headers:
-        safe_headers['x-line-signature'] = '***HIDDEN***'
+    safe_headers = None
+    if body is not None:
+        # ซ่อนข้อมูลสำคัญ
+        safe_headers = {k: v for k, v in headers.items() if k.lower() not in ['authorization', 'x-line-signature']}
+        if 'authorization' in headers:
+            safe_headers['authorization'] = 'Bearer ***HIDDEN***'
+        if 'x-line-signature' in headers:
+            safe_headers['x-line-signature'] = '***HIDDEN***'
+    
+    if LOG_FORMAT == "json":
+        fields = {"method": method}
+        if response_status:
+            fields["status"] = response_status
+        if body is not None:
+            fields["headers"] = safe_headers
+            fields["body"] = body
+        _emit('webhook', event_type, _json_event(event_type, fields))
+        return
     
     log_message = f"{method} Request"
     if response_status:
         log_message += f" | Status: {response_status}"
     
-    webhook_logger.info(f"{log_message} | Headers: {safe_headers}")
-    webhook_logger.info(f"Body: {body}")
+    if body is None:
+        _emit('webhook', event_type, log_message)
+        return
+    
+    _emit('webhook', event_type, f"{log_message} | Headers: {safe_headers}", f"Body: {body}")
 
 def log_error_with_context(error: Exception, context: str, user_id: str = None, additional_data: dict = None):
     """บันทึก error พร้อม context"""
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Deque, Tuple
+
+from config import (
+    WEBHOOK_QUEUE_WORKERS,
+    WEBHOOK_QUEUE_MAX_SIZE,
+    WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS,
+    log_error_with_context
+)
+from webhook_handler import dispatch_event, get_event_user_key
+
+logger = logging.getLogger(__name__)
+
+class WebhookEventQueue:
+    """
+    คิวประมวลผล webhook event เบื้องหลัง
+
+    endpoint แค่นำ event เข้าคิวแล้วตอบ LINE ทันที worker หลายตัวดึง event ไปประมวลผล
+    event ของผู้ใช้คนเดียวกันจะถูกประมวลผลตามลำดับเสมอ (มี worker ทำได้ครั้งละตัว)
+    คิวมีขนาดจำกัด ถ้าเต็มจะรอได้ไม่เกิน put_timeout แล้วปฏิเสธทั้ง batch
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Awaitable[None]] = dispatch_event,
+        num_workers: int = WEBHOOK_QUEUE_WORKERS,
+        max_size: int = WEBHOOK_QUEUE_MAX_SIZE,
+        put_timeout: float = WEBHOOK_QUEUE_PUT_TIMEOUT_SECONDS
+    ):
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.max_size = max(1, max_size)
+        self.put_timeout = put_timeout
+        self._pending: Dict[str, Deque[Tuple[Dict[str, Any], float]]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._workers: List[asyncio.Task] = []
+        self._size = 0
+        self._busy_workers = 0
+        self._stats = {
+            'enqueued': 0,
+            'processed': 0,
+            'failed': 0,
+            'rejected_batches': 0,
+            'max_depth': 0
+        }
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        self._total_lag = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        """เริ่ม worker (เรียกตอน startup)"""
+        if self._workers:
+            return
+
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"webhook-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        logger.info(f"Started {self.num_workers} webhook queue workers (max size {self.max_size})")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """หยุด worker (รอให้ event ที่ค้างอยู่เสร็จก่อนไม่เกิน drain_timeout วินาที)"""
+        if not self._workers:
+            return
+
+        try:
+            deadline = time.monotonic() + drain_timeout
+            while self._size > 0 and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+
+            if self._size > 0:
+                logger.warning(f"Stopping webhook queue with {self._size} unprocessed events")
+        finally:
+            for task in self._workers:
+                task.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+
+    async def enqueue_events(self, events: List[Dict[str, Any]]) -> bool:
+        """นำ event ทั้ง batch เข้าคิว (False = คิวเต็ม ไม่มี event ใดถูกนำเข้า)"""
+        if not events:
+            return True
+
+        count = len(events)
+        async with self._space:
+            if self._size + count > self.max_size:
+                try:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: self._size + count <= self.max_size),
+                        timeout=self.put_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self._stats['rejected_batches'] += 1
+                    logger.warning(f"Webhook queue full ({self._size}/{self.max_size}), rejected {count} events")
+                    return False
+
+            now = time.monotonic()
+            for event in events:
+                key = get_event_user_key(event)
+                pending = self._pending.get(key)
+                if pending is None:
+                    self._pending[key] = deque([(event, now)])
+                    self._ready.put_nowait(key)
+                else:
+                    # มี worker ดูแลผู้ใช้คนนี้อยู่แล้ว ต่อท้ายคิวของผู้ใช้
+                    pending.append((event, now))
+
+            self._size += count
+            self._stats['enqueued'] += count
+            self._stats['max_depth'] = max(self._stats['max_depth'], self._size)
+
+        return True
+
+    async def _worker(self, worker_id: int):
+        while True:
+            key = await self._ready.get()
+            self._busy_workers += 1
+            try:
+                await self._drain_user(key)
+            finally:
+                self._busy_workers -= 1
+                self._ready.task_done()
+
+    async def _drain_user(self, key: str):
+        pending = self._pending[key]
+        while pending:
+            event, enqueued_at = pending.popleft()
+
+            lag = time.monotonic() - enqueued_at
+            self._last_lag = lag
+            self._max_lag = max(self._max_lag, lag)
+            self._total_lag += lag
+
+            try:
+                await self.handler(event)
+                self._stats['processed'] += 1
+            except Exception as e:
+                self._stats['failed'] += 1
+                log_error_with_context(
+                    error=e,
+                    context="webhook_queue_worker",
+                    user_id=key,
+                    additional_data={"event_type": event.get('type')}
+                )
+            finally:
+                await self._release(1)
+
+        # ไม่มี event ค้างแล้ว (ไม่มี await ระหว่างตรวจสอบกับลบ จึงไม่มี event หลุด)
+        del self._pending[key]
+
+    async def _release(self, count: int):
+        async with self._space:
+            self._size -= count
+            self._space.notify_all()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """สถิติของคิว (ใช้ใน /health)"""
+        started = self._stats['processed'] + self._stats['failed']
+        return {
+            'running': self.is_running,
+            'workers': self.num_workers,
+            'busy_workers': self._busy_workers,
+            'depth': self._size,
+            'max_size': self.max_size,
+            'users_pending': len(self._pending),
+            'enqueued': self._stats['enqueued'],
+            'processed': self._stats['processed'],
+            'failed': self._stats['failed'],
+            'rejected_batches': self._stats['rejected_batches'],
+            'max_depth': self._stats['max_depth'],
+            'last_lag_ms': round(self._last_lag * 1000, 2),
+            'max_lag_ms': round(self._max_lag * 1000, 2),
+            'avg_lag_ms': round(self._total_lag / started * 1000, 2) if started else 0.0
+        }
+
+# คิวที่ใช้ร่วมกันทั้ง process
+event_queue = WebhookEventQueue()
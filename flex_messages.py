@@ -1,27 +1,31 @@
-import json
-import requests
 from datetime import datetime, date, timedelta
-from config import LINE_HEADERS
+from functools import lru_cache
+from typing import List, Tuple, Optional
+from availability import SERVICE_TIMES
+from flex_templates import FlexTemplate, reply_template, slot, dumps, json_array
+from line_client import line_client, REPLY_PATH, PUSH_PATH
+from metrics import flex_send
 from models import ReservationData
 import logging
 import os
 
 logger = logging.getLogger(__name__)
 
-def reply_to_user(reply_token: str, message: str):
+@flex_send
+async def reply_to_user(reply_token: str, message: str):
     """ส่งข้อความธรรมดา"""
     payload = {
         "replyToken": reply_token,
         "messages": [{"type": "text", "text": message}]
     }
     try:
-        requests.post("https://api.line.me/v2/bot/message/reply", headers=LINE_HEADERS, data=json.dumps(payload))
+        await line_client.post(REPLY_PATH, payload)
     except Exception as e:
         logger.error(f"reply_to_user error: {e}")
 
-def send_flex_confirmation(reply_token: str, res: ReservationData):
-    """ส่งการยืนยันการจอง"""
-    flex_message = {
+def _confirmation_flex() -> dict:
+    """Flex ยืนยันการจอง (ข้อมูลการจองเป็น slot)"""
+    return {
         "type": "flex",
         "altText": "ยืนยันการจองโต๊ะ",
         "contents": {
@@ -60,7 +64,7 @@ def send_flex_confirmation(reply_token: str, res: ReservationData):
                         "contents": [
                             {
                                 "type": "text",
-                                "text": f"🎫 ID การจอง: {res.booking_id}",
+                                "text": slot("booking_id"),
                                 "weight": "bold",
                                 "size": "lg",
                                 "color": "#2d5016",
@@ -94,7 +98,7 @@ def send_flex_confirmation(reply_token: str, res: ReservationData):
                                     },
                                     {
                                         "type": "text",
-                                        "text": res.customer_name,
+                                        "text": slot("customer_name"),
                                         "size": "md",
                                         "color": "#333333",
                                         "flex": 3,
@@ -115,7 +119,7 @@ def send_flex_confirmation(reply_token: str, res: ReservationData):
                                     },
                                     {
                                         "type": "text",
-                                        "text": res.phone,
+                                        "text": slot("phone"),
                                         "size": "md",
                                         "color": "#333333",
                                         "flex": 3,
@@ -135,7 +139,7 @@ def send_flex_confirmation(reply_token: str, res: ReservationData):
                                     },
                                     {
                                         "type": "text",
-                                        "text": res.date,
+                                        "text": slot("date"),
                                         "size": "md",
                                         "color": "#333333",
                                         "flex": 3,
@@ -156,7 +160,7 @@ def send_flex_confirmation(reply_token: str, res: ReservationData):
                                     },
                                     {
                                         "type": "text",
-                                        "text": res.time,
+                                        "text": slot("time"),
                                         "size": "md",
                                         "color": "#333333",
                                         "flex": 3,
@@ -177,7 +181,7 @@ def send_flex_confirmation(reply_token: str, res: ReservationData):
                                     },
                                     {
                                         "type": "text",
-                                        "text": f"{res.party_size} คน",
+                                        "text": slot("party_size"),
                                         "size": "md",
                                         "color": "#333333",
                                         "flex": 3,
@@ -198,7 +202,7 @@ def send_flex_confirmation(reply_token: str, res: ReservationData):
                                     },
                                     {
                                         "type": "text",
-                                        "text": res.special_requests or "ไม่มี",
+                                        "text": slot("special_requests"),
                                         "size": "md",
                                         "color": "#333333",
                                         "flex": 3,
@@ -225,15 +229,31 @@ def send_flex_confirmation(reply_token: str, res: ReservationData):
             }
         }
     }
-    payload = {"replyToken": reply_token, "messages": [flex_message]}
+
+# serialize ส่วนคงที่ครั้งเดียวตอน import
+_CONFIRMATION_TEMPLATE = reply_template(_confirmation_flex())
+
+@flex_send
+async def send_flex_confirmation(reply_token: str, res: ReservationData):
+    """ส่งการยืนยันการจอง"""
     try:
-        requests.post("https://api.line.me/v2/bot/message/reply", headers=LINE_HEADERS, data=json.dumps(payload))
+        body = _CONFIRMATION_TEMPLATE.render(
+            reply_token=reply_token,
+            booking_id=f"🎫 ID การจอง: {res.booking_id}",
+            customer_name=res.customer_name,
+            phone=res.phone,
+            date=res.date,
+            time=res.time,
+            party_size=f"{res.party_size} คน",
+            special_requests=res.special_requests or "ไม่มี"
+        )
+        await line_client.post_raw(REPLY_PATH, body)
     except Exception as e:
         logger.error(f"send_flex_confirmation error: {e}")
 
-def send_date_selection_flex(reply_token: str):
-    """ส่งการเลือกวันที่"""
-    today = datetime.today().date()
+@lru_cache(maxsize=2)
+def _date_selection_template(today: date) -> FlexTemplate:
+    """Flex เลือกวันที่ของวันนี้ (เปลี่ยนวันละครั้ง)"""
     days = [(today + timedelta(days=i)) for i in range(7)]
 
     thai_days = ["จันทร์", "อังคาร", "พุธ", "พฤหัสบดี", "ศุกร์", "เสาร์", "อาทิตย์"]
@@ -353,21 +373,20 @@ def send_date_selection_flex(reply_token: str):
         }
     }
 
-    payload = {
-        "replyToken": reply_token,
-        "messages": [flex]
-    }
+    return reply_template(flex)
 
+@flex_send
+async def send_date_selection_flex(reply_token: str):
+    """ส่งการเลือกวันที่"""
     try:
-        requests.post("https://api.line.me/v2/bot/message/reply", headers=LINE_HEADERS, data=json.dumps(payload))
+        body = _date_selection_template(datetime.today().date()).render(reply_token=reply_token)
+        await line_client.post_raw(REPLY_PATH, body)
     except Exception as e:
         logger.error(f"send_date_selection_flex error: {e}")
 
-def send_time_selection_flex(reply_token: str):
-    """ส่งการเลือกเวลา"""
-    start_time = datetime.strptime("18:30", "%H:%M")
-    times = [(start_time + timedelta(minutes=30 * i)).strftime("%H:%M") for i in range(7)]  # 18:30 ถึง 21:30
-
+@lru_cache(maxsize=128)
+def _time_selection_template(times: Tuple[str, ...], note: Optional[str]) -> FlexTemplate:
+    """Flex เลือกเวลาสำหรับชุดช่วงเวลาที่ว่าง + ข้อความแจ้ง (มีไม่กี่แบบ จึง cache ไว้)"""
     buttons = []
     for t in times:
         buttons.append({
@@ -395,17 +414,6 @@ def send_time_selection_flex(reply_token: str):
             "contents": row_buttons
         })
 
-    # เพิ่มปุ่มสำหรับเวลาที่เหลือ (ถ้าเป็นจำนวนคี่)
-    if len(times) % 2 == 1:
-        last_button_box = {
-            "type": "box",
-            "layout": "horizontal",
-            "spacing": "md",
-            "margin": "sm",
-            "contents": [buttons[-1]]
-        }
-        button_boxes[-1] = last_button_box
-
     # เพิ่มปุ่มยกเลิกขั้นตอนการจอง
     cancel_button = {
         "type": "button",
@@ -483,115 +491,140 @@ def send_time_selection_flex(reply_token: str):
         }
     }
 
-    payload = {
-        "replyToken": reply_token,
-        "messages": [flex]
-    }
+    # ข้อความแจ้งเพิ่มเติม (เช่น ช่วงเวลาที่เลือกไว้เต็มแล้ว)
+    if note:
+        flex["contents"]["body"]["contents"].insert(3, {
+            "type": "text",
+            "text": note,
+            "size": "sm",
+            "color": "#dc3545",
+            "align": "center",
+            "wrap": True,
+            "margin": "md"
+        })
+
+    return reply_template(flex)
+
+@flex_send
+async def send_time_selection_flex(reply_token: str, times: List[str] = None, note: str = None):
+    """ส่งการเลือกเวลา (times = เฉพาะช่วงเวลาที่ยังว่าง, note = ข้อความแจ้งเพิ่มเติมเหนือปุ่ม)"""
+    if times is None:
+        times = SERVICE_TIMES
+
     try:
-        requests.post("https://api.line.me/v2/bot/message/reply", headers=LINE_HEADERS, data=json.dumps(payload))
+        body = _time_selection_template(tuple(times), note).render(reply_token=reply_token)
+        await line_client.post_raw(REPLY_PATH, body)
     except Exception as e:
         logger.error(f"send_time_selection_flex error: {e}")
 
-def send_user_reservations_flex(reply_token: str, reservations: list):
-    """ส่งรายการการจองของผู้ใช้"""
-    if not reservations:
-        reply_to_user(reply_token, "ไม่พบการจองของคุณในระบบ")
-        return
-    
-    contents = []
-    for i, res in enumerate(reservations[:5]):  # แสดงสูงสุด 5 รายการ
-        data = res["data"]
-        booking_id = data.get("ID การจอง", "ไม่ระบุ")
-        contents.append({
+# รายการการจอง 1 รายการ (ข้อความเป็น slot)
+_RESERVATION_ITEM_TEMPLATE = FlexTemplate({
+    "type": "box",
+    "layout": "vertical",
+    "spacing": "sm",
+    "paddingAll": "md",
+    "backgroundColor": "#f8f9fa",
+    "cornerRadius": "md",
+    "contents": [
+        {
+            "type": "text",
+            "text": slot("booking_id"),
+            "weight": "bold",
+            "size": "md",
+            "color": "#2d5016"
+        },
+        {
+            "type": "text",
+            "text": slot("date_time"),
+            "size": "sm",
+            "color": "#333333"
+        },
+        {
+            "type": "text",
+            "text": slot("party_size"),
+            "size": "sm",
+            "color": "#666666"
+        },
+        {
+            "type": "button",
+            "action": {
+                "type": "message",
+                "label": "ยกเลิกการจองนี้",
+                "text": slot("cancel_text")
+            },
+            "style": "primary",
+            "color": "#dc3545",
+            "height": "sm"
+        }
+    ]
+})
+
+_RESERVATION_SEPARATOR = dumps({"type": "separator", "margin": "md"})
+
+_RESERVATIONS_TEMPLATE = reply_template({
+    "type": "flex",
+    "altText": "รายการการจองของคุณ",
+    "contents": {
+        "type": "bubble",
+        "size": "mega",
+        "body": {
             "type": "box",
             "layout": "vertical",
-            "spacing": "sm",
-            "paddingAll": "md",
-            "backgroundColor": "#f8f9fa",
-            "cornerRadius": "md",
+            "spacing": "md",
             "contents": [
                 {
                     "type": "text",
-                    "text": f"🎫 ID: {booking_id}",
+                    "text": "📋 รายการการจองของคุณ",
                     "weight": "bold",
-                    "size": "md",
-                    "color": "#2d5016"
+                    "size": "xl",
+                    "color": "#2d5016",
+                    "align": "center"
                 },
                 {
-                    "type": "text",
-                    "text": f"📅 {data['วันที่']} ⏰ {data['เวลา']}",
-                    "size": "sm",
-                    "color": "#333333"
-                },
-                {
-                    "type": "text",
-                    "text": f"👥 {data['จำนวนคน']} คน",
-                    "size": "sm",
-                    "color": "#666666"
+                    "type": "separator",
+                    "margin": "md",
+                    "color": "#2d5016"
                 },
                 {
-                    "type": "button",
-                    "action": {
-                        "type": "message",
-                        "label": "ยกเลิกการจองนี้",
-                        "text": f"ยกเลิก:{data['วันที่']}:{data['เวลา']}"
-                    },
-                    "style": "primary",
-                    "color": "#dc3545",
-                    "height": "sm"
+                    "type": "box",
+                    "layout": "vertical",
+                    "spacing": "md",
+                    "margin": "lg",
+                    "contents": slot("items")
                 }
             ]
-        })
-        
-        if i < len(reservations) - 1:
-            contents.append({"type": "separator", "margin": "md"})
-    
-    flex = {
-        "type": "flex",
-        "altText": "รายการการจองของคุณ",
-        "contents": {
-            "type": "bubble",
-            "size": "mega",
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "spacing": "md",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": "📋 รายการการจองของคุณ",
-                        "weight": "bold",
-                        "size": "xl",
-                        "color": "#2d5016",
-                        "align": "center"
-                    },
-                    {
-                        "type": "separator",
-                        "margin": "md",
-                        "color": "#2d5016"
-                    },
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "spacing": "md",
-                        "margin": "lg",
-                        "contents": contents
-                    }
-                ]
-            }
         }
     }
+})
+
+@flex_send
+async def send_user_reservations_flex(reply_token: str, reservations: list):
+    """ส่งรายการการจองของผู้ใช้"""
+    if not reservations:
+        await reply_to_user(reply_token, "ไม่พบการจองของคุณในระบบ")
+        return
     
-    payload = {
-        "replyToken": reply_token,
-        "messages": [flex]
-    }
     try:
-        requests.post("https://api.line.me/v2/bot/message/reply", headers=LINE_HEADERS, data=json.dumps(payload))
+        items = []
+        for i, res in enumerate(reservations[:5]):  # แสดงสูงสุด 5 รายการ
+            data = res["data"]
+            items.append(_RESERVATION_ITEM_TEMPLATE.render(
+                booking_id=f"🎫 ID: {data.get('ID การจอง', 'ไม่ระบุ')}",
+                date_time=f"📅 {data['วันที่']} ⏰ {data['เวลา']}",
+                party_size=f"👥 {data['จำนวนคน']} คน",
+                cancel_text=f"ยกเลิก:{data['วันที่']}:{data['เวลา']}"
+            ))
+            
+            if i < len(reservations) - 1:
+                items.append(_RESERVATION_SEPARATOR)
+        
+        body = _RESERVATIONS_TEMPLATE.render(reply_token=reply_token, items=json_array(items))
+        await line_client.post_raw(REPLY_PATH, body)
     except Exception as e:
         logger.error(f"send_user_reservations_flex error: {e}")
 
-def send_timeout_warning_flex(user_id: str):
+@flex_send
+async def send_timeout_warning_flex(user_id: str):
     """ส่งข้อความเตือน timeout พร้อมปุ่มเลือก"""
     flex_message = {
         "type": "flex",
@@ -682,11 +715,12 @@ def send_timeout_warning_flex(user_id: str):
     }
     
     try:
-        requests.post("https://api.line.me/v2/bot/message/push", headers=LINE_HEADERS, data=json.dumps(payload))
+        await line_client.post(PUSH_PATH, payload)
     except Exception as e:
         logger.error(f"send_timeout_warning_flex error: {e}")
 
-def send_admin_notification(user_id: str, message_text: str, display_name: str):
+@flex_send
+async def send_admin_notification(user_id: str, message_text: str, display_name: str):
     """ส่งข้อความแจ้งแอดมินเมื่อมีลูกค้าพิมพ์คุยระหว่างการจอง"""
     # ดึง Admin User ID หรือ Group ID จาก environment
     ADMIN_USER_ID = os.getenv("ADMIN_USER_ID")  # เพิ่มใน .env
@@ -823,11 +857,11 @@ def send_admin_notification(user_id: str, message_text: str, display_name: str):
     }
     
     try:
-        response = requests.post("https://api.line.me/v2/bot/message/push", headers=LINE_HEADERS, data=json.dumps(payload))
-        if response.status_code == 200:
+        response = await line_client.post(PUSH_PATH, payload)
+        if response is not None and response.status_code == 200:
             logger.info(f"Admin notification sent successfully for customer {display_name}")
         else:
-            logger.error(f"Failed to send admin notification: {response.status_code}")
+            logger.error(f"Failed to send admin notification: {response.status_code if response is not None else 'no response'}")
     except Exception as e:
         logger.error(f"send_admin_notification error: {e}")
         # Fallback เป็น log
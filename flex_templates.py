@@ -0,0 +1,50 @@
+import json
+import re
+from typing import Dict, Any, List
+
+try:
+    import orjson
+except ImportError:  # orjson ไม่ได้ติดตั้ง ใช้ json มาตรฐานแทน (ช้ากว่าแต่ผลลัพธ์เหมือนกัน)
+    orjson = None
+
+# ตำแหน่งของค่าที่เปลี่ยนทุก request ใน template เช่น "__slot__reply_token__"
+_SLOT_PATTERN = re.compile(rb'"__slot__(\w+?)__"')
+
+def dumps(obj: Any) -> bytes:
+    """แปลงเป็น JSON (UTF-8 bytes แบบไม่มีช่องว่าง)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def slot(name: str) -> str:
+    """ค่าแทนตำแหน่งที่ต้องใส่ค่าจริงตอน render"""
+    return f"__slot__{name}__"
+
+def json_array(items: List[bytes]) -> bytes:
+    """รวม JSON ที่ encode แล้วเป็น array (ใช้ใส่ใน slot ได้ทันที)"""
+    return b'[' + b','.join(items) + b']'
+
+class FlexTemplate:
+    """
+    JSON ที่ serialize ไว้ล่วงหน้า แบ่งเป็นส่วนคงที่ (bytes) สลับกับ slot
+
+    render จะ encode เฉพาะค่าของ slot แล้วต่อ bytes เข้าด้วยกัน
+    ค่าที่เป็น bytes ถือว่าเป็น JSON ที่ encode แล้ว (เช่น จาก template อื่น) ใส่ลงไปตรงๆ
+    """
+
+    def __init__(self, obj: Any):
+        parts = _SLOT_PATTERN.split(dumps(obj))
+        self._literals = parts[0::2]
+        self.slots = [name.decode('ascii') for name in parts[1::2]]
+
+    def render(self, **values: Any) -> bytes:
+        out = [self._literals[0]]
+        for name, literal in zip(self.slots, self._literals[1:]):
+            value = values[name]
+            out.append(value if isinstance(value, bytes) else dumps(value))
+            out.append(literal)
+        return b''.join(out)
+
+def reply_template(*messages: Dict[str, Any]) -> FlexTemplate:
+    """template ของ body สำหรับ reply API (reply token เป็น slot)"""
+    return FlexTemplate({"replyToken": slot("reply_token"), "messages": list(messages)})
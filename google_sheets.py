@@ -1,13 +1,27 @@
 import logging
 import json
+import hashlib
+import os
+import threading
+import time
 from datetime import datetime
 from typing import List, Dict, Any, Tuple, Optional
 import gspread
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.service_account import Credentials
 
-from config import GOOGLE_SHEETS_CREDENTIALS, SPREADSHEET_ID
+from config import GOOGLE_SHEETS_CREDENTIALS, SPREADSHEET_ID, BACKUP_STATE_PATH
 from models import ReservationData
-from utils import generate_booking_id, sanitize_for_sheets
+from reservation_store import reservation_store, RESERVATION_SHEET_NAME
+from reservation_stats import get_reservation_snapshot
+from availability import availability_grid, booking_usage, SERVICE_TIMES
+from slot_locks import slot_locks
+from sheets_write_buffer import write_buffer
+from sheets_api import GuardedClient
+from phone_index import phone_index
+from metrics import sheets_call
+from utils import generate_booking_id, sanitize_for_sheets, normalize_phone
 
 logger = logging.getLogger(__name__)
 
@@ -33,73 +47,254 @@ HEADERS = [
     'หมายเหตุ'
 ]
 
+# ข้อความเมื่อช่วงเวลาเต็มระหว่างบันทึกการจอง (มีคนจองตัดหน้า)
+SLOT_FULL_MESSAGE = "ขออภัยค่ะ ช่วงเวลานี้เพิ่งมีผู้จองเต็มไปเมื่อสักครู่ กรุณาเลือกเวลาอื่นค่ะ"
+
+# สถานะที่ถือว่าการจองไม่ active แล้ว
+INACTIVE_STATUSES = ['ยกเลิกแล้ว', 'ไม่มาใช้บริการ']
+
+# Worksheet สำหรับ incremental backup (เก็บเฉพาะแถวที่เปลี่ยนแปลง + เวลาที่สำรอง)
+INCREMENTAL_BACKUP_SHEET_NAME = "สำรอง_รายการเปลี่ยนแปลง"
+BACKUP_TIME_HEADER = 'เวลาสำรอง'
+
+# Cache ของ client / spreadsheet / worksheet (ใช้ร่วมกันทั้ง process)
+DEFAULT_SHEET_NAME = RESERVATION_SHEET_NAME
+
+_sheets_lock = threading.RLock()
+_credentials: Optional[Credentials] = None
+_client: Optional[gspread.Client] = None
+_spreadsheet: Optional[gspread.Spreadsheet] = None
+_worksheets: Dict[str, gspread.Worksheet] = {}
+
+def _refresh_credentials_if_needed():
+    """ต่ออายุ access token เมื่อหมดอายุ (ไม่ต้องสร้าง client ใหม่)"""
+    if _credentials is not None and not _credentials.valid:
+        _credentials.refresh(GoogleAuthRequest())
+        logger.debug("Refreshed Google Sheets access token")
+
 def get_google_sheets_client():
-    """สร้าง Google Sheets client"""
-    try:
-        if not GOOGLE_SHEETS_CREDENTIALS:
-            raise ValueError("GOOGLE_SHEETS_CREDENTIALS not configured")
-        
-        # แปลง credentials จาก string เป็น dict
-        if isinstance(GOOGLE_SHEETS_CREDENTIALS, str):
-            creds_dict = json.loads(GOOGLE_SHEETS_CREDENTIALS)
-        else:
-            creds_dict = GOOGLE_SHEETS_CREDENTIALS
-        
-        # สร้าง credentials object
-        credentials = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-        
-        # สร้าง client
-        client = gspread.authorize(credentials)
-        
-        return client
-        
-    except Exception as e:
-        logger.error(f"Error creating Google Sheets client: {e}")
-        return None
+    """ดึง Google Sheets client (สร้างครั้งเดียวแล้วใช้ซ้ำทั้ง process)"""
+    global _credentials, _client
+    with _sheets_lock:
+        try:
+            if _client is not None:
+                _refresh_credentials_if_needed()
+                return _client
+            
+            if not GOOGLE_SHEETS_CREDENTIALS:
+                raise ValueError("GOOGLE_SHEETS_CREDENTIALS not configured")
+            
+            # แปลง credentials จาก string เป็น dict
+            if isinstance(GOOGLE_SHEETS_CREDENTIALS, str):
+                creds_dict = json.loads(GOOGLE_SHEETS_CREDENTIALS)
+            else:
+                creds_dict = GOOGLE_SHEETS_CREDENTIALS
+            
+            # สร้าง credentials object
+            credentials = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+            
+            # สร้าง client (ทุก request ผ่าน rate limiter / retry / circuit breaker)
+            _client = gspread.authorize(credentials, client_factory=GuardedClient)
+            _credentials = credentials
+            
+            logger.info("Created Google Sheets client")
+            return _client
+            
+        except Exception as e:
+            logger.error(f"Error creating Google Sheets client: {e}")
+            _credentials = None
+            _client = None
+            return None
 
-def get_worksheet(sheet_name: str = "การจอง"):
-    """ดึง worksheet จาก Google Sheets"""
-    try:
+def get_spreadsheet():
+    """ดึง spreadsheet หลัก (เปิดครั้งเดียวแล้วใช้ซ้ำ)"""
+    global _spreadsheet
+    with _sheets_lock:
         client = get_google_sheets_client()
         if not client:
             return None
         
-        if not SPREADSHEET_ID:
-            raise ValueError("SPREADSHEET_ID not configured")
-        
-        # เปิด spreadsheet
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
+        if _spreadsheet is None:
+            if not SPREADSHEET_ID:
+                raise ValueError("SPREADSHEET_ID not configured")
+            _spreadsheet = client.open_by_key(SPREADSHEET_ID)
         
-        # ลองเปิด worksheet ที่มีอยู่
-        try:
-            worksheet = spreadsheet.worksheet(sheet_name)
-        except gspread.WorksheetNotFound:
-            # สร้าง worksheet ใหม่ถ้าไม่มี
-            logger.info(f"Creating new worksheet: {sheet_name}")
-            worksheet = spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=20)
+        return _spreadsheet
+
+def get_worksheet(sheet_name: str = DEFAULT_SHEET_NAME):
+    """ดึง worksheet จาก Google Sheets (cache handle แยกตามชื่อ worksheet)"""
+    try:
+        with _sheets_lock:
+            worksheet = _worksheets.get(sheet_name)
+            if worksheet is not None:
+                # เรียกเพื่อต่ออายุ token ถ้าจำเป็น
+                get_google_sheets_client()
+                return worksheet
             
-            # เพิ่ม headers
-            worksheet.append_row(HEADERS)
+            spreadsheet = get_spreadsheet()
+            if not spreadsheet:
+                return None
             
-            # จัดรูปแบบ header
-            worksheet.format('A1:L1', {
-                'backgroundColor': {'red': 0.8, 'green': 0.8, 'blue': 0.8},
-                'textFormat': {'bold': True}
-            })
-        
-        return worksheet
+            # ลองเปิด worksheet ที่มีอยู่
+            try:
+                worksheet = spreadsheet.worksheet(sheet_name)
+            except gspread.WorksheetNotFound:
+                # สร้าง worksheet ใหม่ถ้าไม่มี
+                logger.info(f"Creating new worksheet: {sheet_name}")
+                worksheet = spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=20)
+                
+                # เพิ่ม headers
+                worksheet.append_row(HEADERS)
+                
+                # จัดรูปแบบ header
+                worksheet.format('A1:L1', {
+                    'backgroundColor': {'red': 0.8, 'green': 0.8, 'blue': 0.8},
+                    'textFormat': {'bold': True}
+                })
+            
+            _worksheets[sheet_name] = worksheet
+            return worksheet
         
     except Exception as e:
         logger.error(f"Error getting worksheet '{sheet_name}': {e}")
+        _handle_sheets_error(e, sheet_name)
         return None
 
+def invalidate_sheets_cache(sheet_name: str = None):
+    """ล้าง cache (ระบุ sheet_name เพื่อล้างเฉพาะ worksheet นั้น)"""
+    global _credentials, _client, _spreadsheet
+    with _sheets_lock:
+        if sheet_name:
+            _worksheets.pop(sheet_name, None)
+            if sheet_name == DEFAULT_SHEET_NAME:
+                # worksheet อาจถูกสร้างใหม่ เลขแถวใน store จึงใช้ไม่ได้แล้ว
+                reservation_store.invalidate()
+            logger.info(f"Invalidated cached worksheet '{sheet_name}'")
+            return
+        
+        _worksheets.clear()
+        _spreadsheet = None
+        _client = None
+        _credentials = None
+        logger.info("Invalidated Google Sheets client cache")
+
+def _get_api_error_status(error: Exception) -> Optional[int]:
+    """ดึง HTTP status code จาก gspread APIError"""
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def _handle_sheets_error(error: Exception, sheet_name: str = DEFAULT_SHEET_NAME):
+    """ล้าง cache ที่อาจใช้ไม่ได้แล้วตามประเภทของ error"""
+    try:
+        if isinstance(error, RefreshError):
+            invalidate_sheets_cache()
+            return
+        
+        if isinstance(error, gspread.WorksheetNotFound):
+            invalidate_sheets_cache(sheet_name)
+            return
+        
+        if isinstance(error, gspread.exceptions.APIError):
+            status = _get_api_error_status(error)
+            if status in (401, 403):
+                # token / สิทธิ์มีปัญหา สร้าง client ใหม่ทั้งหมด
+                invalidate_sheets_cache()
+            elif status in (400, 404):
+                # worksheet ถูกลบหรือเปลี่ยนชื่อ ("Unable to parse range")
+                invalidate_sheets_cache(sheet_name)
+                
+    except Exception as e:
+        logger.error(f"Error handling sheets error: {e}")
+
+def _fetch_records(worksheet) -> List[Dict[str, Any]]:
+    """ดึงข้อมูลทั้ง sheet และปรับที่นั่งที่ใช้ใน ledger ให้ตรงกับ sheet"""
+    started_at = time.time()
+    records = worksheet.get_all_records()
+    write_buffer.sync_bookings([usage for usage in map(booking_usage, records) if usage], started_at)
+    return records
+
+def _pending_records() -> List[Dict[str, Any]]:
+    """การจองที่ยังไม่ได้เขียนลง sheet (ให้ store ที่โหลดใหม่ยังเห็นรายการเหล่านี้)"""
+    return [dict(zip(HEADERS, row)) for row in write_buffer.pending_rows()]
+
+@sheets_call
+def _load_reservation_store(worksheet=None) -> bool:
+    """โหลดข้อมูลการจองเข้า store (ดึงทั้ง sheet เฉพาะครั้งแรกหรือเมื่อข้อมูลหมดอายุ)"""
+    # เขียนรายการที่ค้างใน buffer ก่อนโหลด เพื่อให้ข้อมูลที่โหลดมามีรายการเหล่านั้นด้วย
+    if reservation_store.needs_reload() and write_buffer.has_pending():
+        if write_buffer.is_backing_off() or not flush_pending_writes():
+            # sheet ยังตามหลัง ledger อยู่ ถ้าโหลดใหม่ตอนนี้รายการที่ค้างจะหายจาก store
+            return reservation_store.is_loaded()
+    
+    def loader():
+        try:
+            ws = worksheet or get_worksheet()
+            if not ws:
+                return None
+            return _fetch_records(ws)
+        except Exception as e:
+            # โหลดไม่ได้ ใช้ข้อมูลเดิมใน store ไปก่อน (ถ้าเคยโหลดแล้ว)
+            logger.warning(f"Could not reload reservations from sheet: {e}")
+            _handle_sheets_error(e)
+            return None
+    
+    return reservation_store.ensure_loaded(loader, _pending_records)
+
+def _flush_pending_writes():
+    """เขียนรายการใน write buffer ลง sheet (raise ถ้าไม่สำเร็จ)"""
+    worksheet = get_worksheet()
+    if not worksheet:
+        raise RuntimeError("ไม่สามารถเชื่อมต่อ Google Sheets ได้")
+    
+    write_buffer.flush(
+        worksheet,
+        HEADERS,
+        lambda: reservation_store.ensure_loaded(lambda: _fetch_records(worksheet), _pending_records)
+    )
+
+@sheets_call
+def flush_pending_writes() -> bool:
+    """เขียนรายการใน write buffer ลง sheet (ใช้โดย background flusher)"""
+    try:
+        _flush_pending_writes()
+        return True
+    except Exception as e:
+        logger.error(f"Error flushing pending sheet writes: {e}")
+        _handle_sheets_error(e)
+        return False
+
+def _submit_writes(booking_id: str):
+    """ส่งการเขียนที่เข้าคิวไว้ (buffer เปิด = รอ flush เบื้องหลัง, ปิด = เขียนทันที)"""
+    if write_buffer.enabled:
+        return
+    
+    try:
+        _flush_pending_writes()
+    except Exception:
+        # แจ้งผู้ใช้ว่าไม่สำเร็จแล้ว ไม่ต้องเขียนซ้ำภายหลัง
+        write_buffer.discard(booking_id)
+        raise
+
+def _to_user_reservation(row_number: int, record: Dict[str, Any]) -> Dict[str, Any]:
+    """แปลง record เป็นรูปแบบที่ flex message ต้องการ"""
+    return {
+        'data': {
+            'ID การจอง': record.get('ID การจอง', ''),
+            'ชื่อผู้จอง': record.get('ชื่อผู้จอง', ''),
+            'เบอร์โทร': normalize_phone(record.get('เบอร์โทร', '')),
+            'วันที่': record.get('วันที่', ''),
+            'เวลา': record.get('เวลา', ''),
+            'จำนวนคน': record.get('จำนวนคน', ''),
+            'ความต้องการพิเศษ': record.get('ความต้องการพิเศษ', ''),
+            'สถานะ': record.get('สถานะ', '')
+        },
+        'row_number': row_number
+    }
+
+@sheets_call
 def add_reservation_to_sheet(reservation: ReservationData) -> Tuple[bool, str, Optional[str]]:
-    """เพิ่มการจองลง Google Sheets"""
+    """เพิ่มการจอง (บันทึกลง ledger แล้วเขียนตามลง Google Sheets)"""
     try:
-        worksheet = get_worksheet()
-        if not worksheet:
-            return False, "ไม่สามารถเชื่อมต่อ Google Sheets ได้", None
-        
         # สร้าง booking ID ถ้ายังไม่มี
         if not reservation.booking_id:
             reservation.booking_id = generate_booking_id()
@@ -121,69 +316,72 @@ def add_reservation_to_sheet(reservation: ReservationData) -> Tuple[bool, str, O
             ""  # หมายเหตุ
         ]
         
-        # เพิ่มข้อมูลลง sheet
-        worksheet.append_row(row_data)
+        # การจองช่วงเวลาเดียวกันใน process นี้ต้องต่อคิวกัน (ตรวจที่ว่าง + บันทึก เป็นขั้นตอนเดียว)
+        with slot_locks.hold(reservation.date, reservation.time):
+            if not _load_reservation_store():
+                return False, "ไม่สามารถเชื่อมต่อ Google Sheets ได้", None
+            
+            # มี ledger: ตรวจที่ว่างและบันทึกใน transaction เดียวของ ledger (เห็นการจองของทุก worker)
+            # ไม่มี ledger: ตรวจจากตารางที่นั่งของ process นี้
+            if write_buffer.ledger is None:
+                fits = availability_grid.can_fit(reservation.date, reservation.time, reservation.party_size)
+            else:
+                fits = reservation.time in SERVICE_TIMES
+            claim = availability_grid.slot_claim(reservation.date, reservation.time, reservation.party_size)
+            if not fits or not write_buffer.enqueue_append(reservation.booking_id, row_data, claim):
+                logger.info(f"Slot {reservation.date} {reservation.time} is full for party of {reservation.party_size}")
+                return False, SLOT_FULL_MESSAGE, None
+            
+            _submit_writes(reservation.booking_id)
+            
+            # โหมด buffer: ให้ store เห็นการจองทันทีโดยไม่ต้องรอ flush
+            # (โหมดเขียนทันที flush จะเพิ่มลง store พร้อมเลขแถวจริงให้แล้ว)
+            if write_buffer.enabled:
+                reservation_store.add(dict(zip(HEADERS, row_data)))
         
         logger.info(f"Added reservation to sheet: {reservation.booking_id}")
         return True, "จองสำเร็จ! ขอบคุณค่ะ", reservation.booking_id
         
     except Exception as e:
         logger.error(f"Error adding reservation to sheet: {e}")
+        _handle_sheets_error(e)
         return False, "เกิดข้อผิดพลาดในการบันทึกข้อมูล กรุณาลองใหม่อีกครั้ง", None
 
+@sheets_call
 def find_user_reservations(phone: str) -> List[Dict[str, Any]]:
     """ค้นหาการจองของผู้ใช้จากเบอร์โทร"""
     try:
-        worksheet = get_worksheet()
-        if not worksheet:
+        # โหลด store ใหม่เมื่อหมดอายุ (index ตามการแก้ใน sheet / worker อื่นผ่าน listener)
+        loaded = _load_reservation_store()
+        # index ที่สร้างไว้แล้วยังตอบได้แม้โหลด sheet ไม่สำเร็จ
+        if phone_index.is_built():
+            matches = phone_index.find_by_phone(phone)
+        elif loaded:
+            matches = reservation_store.find_by_phone(phone)
+        else:
             return []
         
-        # ดึงข้อมูลทั้งหมด
-        records = worksheet.get_all_records()
-        
-        for i, record in enumerate(records):
-            if record.get('ID การจอง') == booking_id:
-                row_number = i + 2  # +2 เพราะ header และ 0-based index
-                
-                # อัพเดทสถานะ
-                worksheet.update_cell(row_number, 11, new_status)  # คอลัมน์สถานะ
-                
-                # อัพเดทหมายเหตุ
-                if note:
-                    current_note = record.get('หมายเหตุ', '')
-                    timestamp = datetime.now().strftime("%d/%m/%Y %H:%M")
-                    new_note = f"{current_note}\n[{timestamp}] {note}".strip()
-                    worksheet.update_cell(row_number, 12, new_note)  # คอลัมน์หมายเหตุ
-                
-                logger.info(f"Updated reservation {booking_id} status to {new_status}")
-                return True
+        # กรองเฉพาะที่ยังไม่ถูกยกเลิก
+        user_reservations = [
+            _to_user_reservation(row_number, record)
+            for row_number, record in matches
+            if record.get('สถานะ') not in INACTIVE_STATUSES
+        ]
         
-        logger.warning(f"Reservation {booking_id} not found for status update")
-        return False
+        logger.info(f"Found {len(user_reservations)} reservations for phone {phone}")
+        return user_reservations
         
     except Exception as e:
-        logger.error(f"Error updating reservation status for {booking_id}: {e}")
-        return False
+        logger.error(f"Error finding user reservations for {phone}: {e}")
+        _handle_sheets_error(e)
+        return []
 
+@sheets_call
 def get_today_reservations() -> List[Dict[str, Any]]:
     """ดึงการจองของวันนี้"""
     try:
-        worksheet = get_worksheet()
-        if not worksheet:
-            return []
-        
         today = datetime.now().strftime("%d-%m-%Y")
-        records = worksheet.get_all_records()
-        
-        today_reservations = []
-        for record in records:
-            # แปลงรูปแบบวันที่ให้ตรงกัน (อาจต้องปรับตามรูปแบบที่ใช้)
-            reservation_date = record.get('วันที่', '')
-            if reservation_date == today and record.get('สถานะ') not in ['ยกเลิกแล้ว']:
-                today_reservations.append(record)
-        
-        # เรียงตามเวลา
-        today_reservations.sort(key=lambda x: x.get('เวลา', ''))
+        today_reservations = get_reservations_by_date(today)
         
         logger.info(f"Found {len(today_reservations)} reservations for today")
         return today_reservations
@@ -192,20 +390,17 @@ def get_today_reservations() -> List[Dict[str, Any]]:
         logger.error(f"Error getting today's reservations: {e}")
         return []
 
+@sheets_call
 def get_reservations_by_date(date: str) -> List[Dict[str, Any]]:
     """ดึงการจองตามวันที่ที่ระบุ"""
     try:
-        worksheet = get_worksheet()
-        if not worksheet:
+        if not _load_reservation_store():
             return []
         
-        records = worksheet.get_all_records()
-        
-        date_reservations = []
-        for record in records:
-            if (record.get('วันที่') == date and 
-                record.get('สถานะ') not in ['ยกเลิกแล้ว']):
-                date_reservations.append(record)
+        date_reservations = [
+            record for _, record in reservation_store.find_by_date(date)
+            if record.get('สถานะ') not in ['ยกเลิกแล้ว']
+        ]
         
         # เรียงตามเวลา
         date_reservations.sort(key=lambda x: x.get('เวลา', ''))
@@ -214,90 +409,146 @@ def get_reservations_by_date(date: str) -> List[Dict[str, Any]]:
         
     except Exception as e:
         logger.error(f"Error getting reservations for date {date}: {e}")
+        _handle_sheets_error(e)
         return []
 
+@sheets_call
 def get_reservation_statistics(days: int = 7) -> Dict[str, Any]:
-    """ดึงสถิติการจองย้อนหลัง x วัน"""
+    """ดึงสถิติของการจองที่ทำในช่วง x วันล่าสุด รวมการจองล่วงหน้า (คำนวณจาก snapshot ใน memory ไม่ต้องดึงข้อมูลจาก sheet)"""
     try:
-        worksheet = get_worksheet()
-        if not worksheet:
+        if not _load_reservation_store():
             return {}
         
-        records = worksheet.get_all_records()
-        
-        # นับสถิติ
-        total_reservations = len(records)
-        confirmed_count = len([r for r in records if r.get('สถานะ') == 'ยืนยันแล้ว'])
-        cancelled_count = len([r for r in records if r.get('สถานะ') == 'ยกเลิกแล้ว'])
-        completed_count = len([r for r in records if r.get('สถานะ') == 'เสร็จสิ้น'])
-        
-        # สถิติตามวัน
-        date_stats = {}
-        for record in records:
-            date = record.get('วันที่', '')
-            if date:
-                if date not in date_stats:
-                    date_stats[date] = {'total': 0, 'confirmed': 0, 'cancelled': 0}
-                date_stats[date]['total'] += 1
-                if record.get('สถานะ') == 'ยืนยันแล้ว':
-                    date_stats[date]['confirmed'] += 1
-                elif record.get('สถานะ') == 'ยกเลิกแล้ว':
-                    date_stats[date]['cancelled'] += 1
-        
-        # สถิติตามเวลา
-        time_stats = {}
-        for record in records:
-            time = record.get('เวลา', '')
-            if time and record.get('สถานะ') == 'ยืนยันแล้ว':
-                time_stats[time] = time_stats.get(time, 0) + 1
-        
-        return {
-            'total_reservations': total_reservations,
-            'confirmed_reservations': confirmed_count,
-            'cancelled_reservations': cancelled_count,
-            'completed_reservations': completed_count,
-            'cancellation_rate': round((cancelled_count / total_reservations * 100) if total_reservations > 0 else 0, 2),
-            'date_statistics': date_stats,
-            'popular_times': dict(sorted(time_stats.items(), key=lambda x: x[1], reverse=True)[:5])
-        }
+        return get_reservation_snapshot().statistics(days)
         
     except Exception as e:
         logger.error(f"Error getting reservation statistics: {e}")
+        _handle_sheets_error(e)
+        return {}
+
+def _row_fingerprint(record: Dict[str, Any]) -> str:
+    """hash ของค่าในแถว ใช้ตรวจว่าแถวเปลี่ยนไปจาก snapshot ล่าสุดหรือไม่"""
+    values = [str(record.get(header, '')) for header in HEADERS]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+def _record_key(row_number: int, record: Dict[str, Any]) -> str:
+    return str(record.get('ID การจอง') or f"row:{row_number}")
+
+def _load_backup_state() -> Dict[str, Any]:
+    try:
+        with open(BACKUP_STATE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Cannot read backup state, next backup copies all rows: {e}")
         return {}
 
-def backup_reservations() -> bool:
-    """สำรองข้อมูลการจอง"""
+def _save_backup_state(fingerprints: Dict[str, str], sheet_name: str):
+    directory = os.path.dirname(BACKUP_STATE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    tmp_path = f"{BACKUP_STATE_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'last_backup_at': datetime.now().isoformat(timespec='seconds'),
+            'last_backup_sheet': sheet_name,
+            'fingerprints': fingerprints
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, BACKUP_STATE_PATH)
+
+def _get_incremental_backup_worksheet(spreadsheet):
+    """เปิด (หรือสร้าง) worksheet สำหรับ incremental backup"""
+    with _sheets_lock:
+        worksheet = _worksheets.get(INCREMENTAL_BACKUP_SHEET_NAME)
+        if worksheet is None:
+            try:
+                worksheet = spreadsheet.worksheet(INCREMENTAL_BACKUP_SHEET_NAME)
+            except gspread.WorksheetNotFound:
+                logger.info(f"Creating incremental backup worksheet: {INCREMENTAL_BACKUP_SHEET_NAME}")
+                worksheet = spreadsheet.add_worksheet(
+                    title=INCREMENTAL_BACKUP_SHEET_NAME, rows=1000, cols=len(HEADERS) + 1
+                )
+                worksheet.update('A1', [HEADERS + [BACKUP_TIME_HEADER]])
+            _worksheets[INCREMENTAL_BACKUP_SHEET_NAME] = worksheet
+        return worksheet
+
+def backup_reservations(incremental: bool = False) -> bool:
+    """สำรองข้อมูลการจอง (คืนค่า True ถ้าสำเร็จ รายละเอียดดูจาก backup_reservations_report)"""
+    return backup_reservations_report(incremental)['success']
+
+@sheets_call
+def backup_reservations_report(incremental: bool = False) -> Dict[str, Any]:
+    """
+    สำรองข้อมูลการจองและคืนค่ารายงาน
+    
+    - แบบเต็ม: duplicate worksheet ฝั่ง server (request เดียว ไม่ว่าจะมีกี่แถว)
+    - แบบ incremental: append เฉพาะแถวที่เพิ่ม/เปลี่ยนตั้งแต่ snapshot ล่าสุดด้วย append_rows ครั้งเดียว
+    คืนค่ารายงาน (success, mode, sheet_name, rows_copied, duration_ms)
+    """
+    started_at = time.monotonic()
+    mode = 'incremental' if incremental else 'full'
+    report = {'success': False, 'mode': mode, 'sheet_name': None, 'rows_copied': 0, 'duration_ms': 0.0}
+    
     try:
         worksheet = get_worksheet()
-        if not worksheet:
-            return False
-        
-        # สร้าง worksheet สำรอง
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_sheet_name = f"สำรอง_{timestamp}"
-        
-        client = get_google_sheets_client()
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        
-        # Copy ข้อมูลไปยัง worksheet ใหม่
-        backup_worksheet = spreadsheet.add_worksheet(title=backup_sheet_name, rows=1000, cols=20)
-        
-        # Copy headers
-        backup_worksheet.append_row(HEADERS)
+        spreadsheet = get_spreadsheet()
+        if not worksheet or not spreadsheet:
+            return report
+        
+        # เขียนรายการที่ค้างใน buffer แล้วโหลดข้อมูลล่าสุดจาก sheet
+        _flush_pending_writes()
+        reservation_store.invalidate()
+        if not _load_reservation_store(worksheet) or reservation_store.is_stale():
+            return report
+        
+        records = reservation_store.all_records()
+        fingerprints = {_record_key(row, record): _row_fingerprint(record) for row, record in records}
+        
+        if incremental:
+            previous = _load_backup_state().get('fingerprints', {})
+            changed = [
+                record for row, record in records
+                if previous.get(_record_key(row, record)) != fingerprints[_record_key(row, record)]
+            ]
+            
+            backup_worksheet = _get_incremental_backup_worksheet(spreadsheet)
+            if changed:
+                backup_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+                backup_worksheet.append_rows([
+                    [record.get(header, '') for header in HEADERS] + [backup_time]
+                    for record in changed
+                ])
+            
+            report['sheet_name'] = INCREMENTAL_BACKUP_SHEET_NAME
+            report['rows_copied'] = len(changed)
+        else:
+            # สร้าง worksheet สำรองโดย copy ทั้ง sheet ฝั่ง server
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_sheet_name = f"สำรอง_{timestamp}"
+            spreadsheet.duplicate_sheet(worksheet.id, new_sheet_name=backup_sheet_name)
+            
+            report['sheet_name'] = backup_sheet_name
+            report['rows_copied'] = len(records)
         
-        # Copy ข้อมูล
-        records = worksheet.get_all_records()
-        for record in records:
-            row_data = [record.get(header, '') for header in HEADERS]
-            backup_worksheet.append_row(row_data)
+        _save_backup_state(fingerprints, report['sheet_name'])
         
-        logger.info(f"Created backup worksheet: {backup_sheet_name}")
-        return True
+        report['success'] = True
+        report['duration_ms'] = round((time.monotonic() - started_at) * 1000, 2)
+        logger.info(
+            f"Created {mode} backup '{report['sheet_name']}': "
+            f"{report['rows_copied']} rows in {report['duration_ms']}ms"
+        )
+        return report
         
     except Exception as e:
         logger.error(f"Error creating backup: {e}")
-        return False
+        _handle_sheets_error(e)
+        report['duration_ms'] = round((time.monotonic() - started_at) * 1000, 2)
+        return report
 
+@sheets_call
 def validate_sheet_structure() -> bool:
     """ตรวจสอบโครงสร้าง Google Sheets"""
     try:
@@ -326,35 +577,41 @@ def validate_sheet_structure() -> bool:
         
     except Exception as e:
         logger.error(f"Error validating sheet structure: {e}")
+        _handle_sheets_error(e)
         return False
 
+@sheets_call
 def search_reservations(query: str, search_type: str = "all") -> List[Dict[str, Any]]:
     """ค้นหาการจองตามเงื่อนไขต่างๆ"""
     try:
-        worksheet = get_worksheet()
-        if not worksheet:
+        if not _load_reservation_store():
             return []
         
-        records = worksheet.get_all_records()
+        # ค้นหา ID แบบตรงตัวผ่าน index ก่อน
+        if search_type == "booking_id":
+            record = reservation_store.get_by_booking_id(query.strip().upper())
+            if record:
+                return [record]
+        
         results = []
         
-        for record in records:
+        for _, record in reservation_store.all_records():
             match = False
             
             if search_type == "name" or search_type == "all":
-                if query.lower() in record.get('ชื่อผู้จอง', '').lower():
+                if query.lower() in str(record.get('ชื่อผู้จอง', '')).lower():
                     match = True
             
             if search_type == "phone" or search_type == "all":
-                if query in record.get('เบอร์โทร', ''):
+                if query in normalize_phone(record.get('เบอร์โทร', '')):
                     match = True
             
             if search_type == "booking_id" or search_type == "all":
-                if query.upper() in record.get('ID การจอง', '').upper():
+                if query.upper() in str(record.get('ID การจอง', '')).upper():
                     match = True
             
             if search_type == "date" or search_type == "all":
-                if query in record.get('วันที่', ''):
+                if query in str(record.get('วันที่', '')):
                     match = True
             
             if match:
@@ -365,17 +622,17 @@ def search_reservations(query: str, search_type: str = "all") -> List[Dict[str,
         
     except Exception as e:
         logger.error(f"Error searching reservations: {e}")
+        _handle_sheets_error(e)
         return []
 
+@sheets_call
 def get_sheet_info() -> Dict[str, Any]:
     """ดึงข้อมูลเกี่ยวกับ Google Sheets"""
     try:
-        client = get_google_sheets_client()
-        if not client:
+        spreadsheet = get_spreadsheet()
+        if not spreadsheet:
             return {}
         
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        
         worksheets = spreadsheet.worksheets()
         worksheet_info = []
         
@@ -398,6 +655,7 @@ def get_sheet_info() -> Dict[str, Any]:
         
     except Exception as e:
         logger.error(f"Error getting sheet info: {e}")
+        _handle_sheets_error(e)
         return {}
 
 # Utility functions
@@ -409,76 +667,43 @@ def is_sheets_connected() -> bool:
     except Exception:
         return False
 
-def get_available_time_slots(date: str) -> List[str]:
-    """ดึงช่วงเวลาที่ว่างในวันที่ระบุ"""
+@sheets_call
+def get_available_time_slots(date: str, party_size: int = 1) -> List[str]:
+    """ดึงช่วงเวลาที่ยังรับจำนวนคนนี้ได้ในวันที่ระบุ (ตามความจุที่นั่งและโต๊ะ)"""
     try:
-        # เวลาที่เปิดให้บริการ
-        all_times = ["18:30", "19:00", "19:30", "20:00", "20:30", "21:00", "21:30"]
-        
-        # ดึงการจองในวันนั้น
-        reservations = get_reservations_by_date(date)
-        booked_times = [r.get('เวลา') for r in reservations]
-        
-        # หาเวลาที่ว่าง
-        available_times = [time for time in all_times if time not in booked_times]
+        if not _load_reservation_store():
+            # โหลดข้อมูลไม่ได้ แสดงทุกช่วงเวลาไปก่อน (ตรวจสอบอีกครั้งตอนบันทึกการจอง)
+            logger.warning(f"Reservation data unavailable, showing all time slots for {date}")
+            return list(SERVICE_TIMES)
         
-        return available_times
+        return availability_grid.available_times(date, party_size)
         
     except Exception as e:
         logger.error(f"Error getting available time slots for {date}: {e}")
-        return []
-        
-        # กรองเฉพาะของเบอร์โทรที่ระบุ และยังไม่ถูกยกเลิก
-        user_reservations = []
-        for record in records:
-            if (record.get('เบอร์โทร') == phone and 
-                record.get('สถานะ') not in ['ยกเลิกแล้ว', 'ไม่มาใช้บริการ']):
-                
-                # แปลงเป็นรูปแบบที่ flex message ต้องการ
-                reservation_data = {
-                    'data': {
-                        'ID การจอง': record.get('ID การจอง', ''),
-                        'ชื่อผู้จอง': record.get('ชื่อผู้จอง', ''),
-                        'เบอร์โทร': record.get('เบอร์โทร', ''),
-                        'วันที่': record.get('วันที่', ''),
-                        'เวลา': record.get('เวลา', ''),
-                        'จำนวนคน': record.get('จำนวนคน', ''),
-                        'ความต้องการพิเศษ': record.get('ความต้องการพิเศษ', ''),
-                        'สถานะ': record.get('สถานะ', '')
-                    },
-                    'row_number': records.index(record) + 2  # +2 เพราะ header และ 0-based index
-                }
-                user_reservations.append(reservation_data)
-        
-        logger.info(f"Found {len(user_reservations)} reservations for phone {phone}")
-        return user_reservations
-        
-    except Exception as e:
-        logger.error(f"Error finding user reservations for {phone}: {e}")
-        return []
+        return list(SERVICE_TIMES)
 
+@sheets_call
 def cancel_reservation(phone: str, date: str, time: str) -> Tuple[bool, str]:
     """ยกเลิกการจองเฉพาะ"""
     try:
-        worksheet = get_worksheet()
-        if not worksheet:
+        if not _load_reservation_store():
             return False, "ไม่สามารถเชื่อมต่อ Google Sheets ได้"
         
-        # ค้นหาการจองที่ตรงกัน
-        records = worksheet.get_all_records()
-        
-        for i, record in enumerate(records):
-            if (record.get('เบอร์โทร') == phone and 
-                record.get('วันที่') == date and 
-                record.get('เวลา') == time and
-                record.get('สถานะ') not in ['ยกเลิกแล้ว', 'ไม่มาใช้บริการ']):
+        # ค้นหาการจองที่ตรงกันจาก index (วันที่, เวลา)
+        phone = normalize_phone(phone)
+        for row_number, record in reservation_store.find_by_slot(date, time):
+            if (normalize_phone(record.get('เบอร์โทร')) == phone and 
+                record.get('สถานะ') not in INACTIVE_STATUSES):
                 
                 # อัพเดทสถานะเป็นยกเลิก
-                row_number = i + 2  # +2 เพราะ header และ 0-based index
-                worksheet.update_cell(row_number, 11, 'ยกเลิกแล้ว')  # คอลัมน์สถานะ
-                worksheet.update_cell(row_number, 12, f'ยกเลิกเมื่อ {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}')  # หมายเหตุ
-                
                 booking_id = record.get('ID การจอง', '')
+                note = f'ยกเลิกเมื่อ {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}'
+                write_buffer.enqueue_update(booking_id, 11, 'ยกเลิกแล้ว')  # คอลัมน์สถานะ
+                write_buffer.enqueue_update(booking_id, 12, note)  # หมายเหตุ
+                _submit_writes(booking_id)
+                write_buffer.set_booking_active(booking_id, False)
+                reservation_store.update(row_number, {'สถานะ': 'ยกเลิกแล้ว', 'หมายเหตุ': note})
+                
                 logger.info(f"Cancelled reservation {booking_id} for phone {phone}")
                 
                 return True, f"ยกเลิกการจองเรียบร้อยแล้ว\nID การจอง: {booking_id}\nวันที่: {date} เวลา: {time}"
@@ -487,56 +712,77 @@ def cancel_reservation(phone: str, date: str, time: str) -> Tuple[bool, str]:
         
     except Exception as e:
         logger.error(f"Error cancelling reservation: {e}")
+        _handle_sheets_error(e)
         return False, "เกิดข้อผิดพลาดในการยกเลิกการจอง กรุณาลองใหม่อีกครั้ง"
 
+@sheets_call
 def get_reservation_by_id(booking_id: str) -> Optional[Dict[str, Any]]:
     """ค้นหาการจองจาก ID"""
     try:
-        worksheet = get_worksheet()
-        if not worksheet:
+        if not _load_reservation_store():
             return None
         
-        records = worksheet.get_all_records()
-        
-        for record in records:
-            if record.get('ID การจอง') == booking_id:
-                return record
-        
-        return None
+        return reservation_store.get_by_booking_id(booking_id)
         
     except Exception as e:
         logger.error(f"Error getting reservation by ID {booking_id}: {e}")
+        _handle_sheets_error(e)
         return None
 
+def _reactivate_booking(record: Dict[str, Any]) -> bool:
+    """จองที่นั่งคืนให้การจองที่ถูกยกเลิก (False = ช่วงเวลานั้นเต็มแล้ว)"""
+    usage = booking_usage(record)
+    if usage is None:
+        # เวลาไม่ตรงกับช่วงเวลาที่รับจอง ตรวจที่ว่างไม่ได้
+        return False
+
+    booking_id, date, time_str, party_size = usage[:4]
+    with slot_locks.hold(date, time_str):
+        if write_buffer.ledger is None:
+            return availability_grid.can_fit(date, time_str, party_size)
+        claim = availability_grid.slot_claim(date, time_str, party_size)
+        return write_buffer.set_booking_active(booking_id, True, claim)
+
+@sheets_call
 def update_reservation_status(booking_id: str, new_status: str, note: str = "") -> bool:
     """อัพเดทสถานะการจอง"""
     try:
-        worksheet = get_worksheet()
-        if not worksheet:
+        if not _load_reservation_store():
             return False
 
-        records = worksheet.get_all_records()
+        record = reservation_store.get_by_booking_id(booking_id)
+        if not record:
+            logger.warning(f"Reservation {booking_id} not found for status update")
+            return False
 
-        for i, record in enumerate(records):
-            if record.get('ID การจอง') == booking_id:
-                row_number = i + 2  # +2 เพราะ header และ 0-based index
+        row_number = reservation_store.get_row_number(booking_id)
+        changes = {'สถานะ': new_status}
+        active = new_status not in INACTIVE_STATUSES
 
-                # อัพเดทสถานะ
-                worksheet.update_cell(row_number, 11, new_status)  # คอลัมน์สถานะ
+        # เปิดใช้การจองที่ยกเลิกไปแล้ว: ที่นั่งอาจถูกจองไปแล้ว ตรวจที่ว่างแบบเดียวกับการจองใหม่
+        if active and record.get('สถานะ') in INACTIVE_STATUSES and not _reactivate_booking(record):
+            logger.info(f"Cannot reactivate {booking_id}: {SLOT_FULL_MESSAGE}")
+            return False
 
-                # อัพเดทหมายเหตุ
-                if note:
-                    current_note = record.get('หมายเหตุ', '')
-                    timestamp = datetime.now().strftime("%d/%m/%Y %H:%M")
-                    new_note = f"{current_note}\n[{timestamp}] {note}".strip()
-                    worksheet.update_cell(row_number, 12, new_note)  # คอลัมน์หมายเหตุ
+        # อัพเดทสถานะ
+        write_buffer.enqueue_update(booking_id, 11, new_status)  # คอลัมน์สถานะ
 
-                logger.info(f"Updated reservation {booking_id} status to {new_status}")
-                return True
+        # อัพเดทหมายเหตุ
+        if note:
+            current_note = record.get('หมายเหตุ', '')
+            timestamp = datetime.now().strftime("%d/%m/%Y %H:%M")
+            new_note = f"{current_note}\n[{timestamp}] {note}".strip()
+            write_buffer.enqueue_update(booking_id, 12, new_note)  # คอลัมน์หมายเหตุ
+            changes['หมายเหตุ'] = new_note
 
-        logger.warning(f"Reservation {booking_id} not found for status update")
-        return False
+        _submit_writes(booking_id)
+        write_buffer.set_booking_active(booking_id, active)
+        reservation_store.update(row_number, changes)
+
+        logger.info(f"Updated reservation {booking_id} status to {new_status}")
+        return True
 
     except Exception as e:
         logger.error(f"Error updating reservation status for {booking_id}: {e}")
-        return False
\ No newline at end of file
+        _handle_sheets_error(e)
+        return False
@@ -0,0 +1,323 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Tuple, Iterable, NamedTuple, Optional
+
+from config import LEDGER_PATH, LEDGER_LEASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# สถานะของ event ใน ledger
+STATE_PENDING = 'pending'
+STATE_REPLICATED = 'replicated'
+STATE_DISCARDED = 'discarded'
+
+class SlotClaim(NamedTuple):
+    """ที่นั่ง/โต๊ะที่การจองใหม่ต้องการ และความจุของช่วงเวลานั้น (ตรวจใน transaction เดียวกับการบันทึก)"""
+    date: str
+    time: str
+    seats: int
+    tables: int
+    seat_capacity: int
+    table_capacity: int
+
+def _owner_is_dead(owner: str) -> bool:
+    """ตรวจว่า process เจ้าของ event (host:pid:nonce) บนเครื่องนี้ตายไปแล้วหรือไม่ (ไม่แน่ใจ = ยังไม่ตาย)"""
+    try:
+        host, pid, _ = owner.rsplit(':', 2)
+        if host != socket.gethostname():
+            return False
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except (ValueError, OSError):
+        return False
+    return False
+
+class ReservationLedger:
+    """
+    Ledger การเปลี่ยนแปลงการจองแบบ append-only (SQLite WAL)
+
+    ทุกการเขียน (เพิ่มการจอง / แก้สถานะ / หมายเหตุ) ถูก commit ลง ledger ก่อน
+    แล้ว replicator จึงนำไปเขียนลง Google Sheets ภายหลัง
+    event ไม่ถูกลบหรือแก้ไข มีแค่สถานะการ replicate ที่เปลี่ยน จึงดูประวัติย้อนหลังได้
+
+    หลาย worker ใช้ไฟล์เดียวกันได้: event ที่ยังค้างมีเจ้าของ (owner) และ lease
+    worker รับ event ของคนอื่นไปเขียนต่อได้เฉพาะเมื่อ lease หมดอายุหรือเจ้าของตายแล้ว
+
+    ตาราง slot_bookings เก็บที่นั่งที่ใช้ของทุกการจอง (ทั้งที่อยู่ใน sheet แล้วและที่ยังค้าง)
+    เป็นตัวตัดสินว่าช่วงเวลาเต็มหรือไม่สำหรับทุก worker บนเครื่องเดียวกัน
+    """
+
+    def __init__(self, path: str = LEDGER_PATH, lease_seconds: float = LEDGER_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        # เจ้าของ event ของ ledger นี้ (ไม่ซ้ำกันแม้ process ใหม่ได้ pid เดิม)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._lock = threading.Lock()
+        # เปิดไฟล์ตอนใช้ครั้งแรก (import โมดูลหรือสร้าง object ไม่เขียนไฟล์)
+        self._open_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            with self._open_lock:
+                if self._db is None:
+                    self._db = self._open()
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        if self.path != ":memory:" and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # FULL = fsync ทุก commit (ยืนยันการจองได้ทันทีที่ commit สำเร็จ)
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "booking_id TEXT NOT NULL, "
+            "op TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "state TEXT NOT NULL DEFAULT 'pending', "
+            "replicated_at REAL, "
+            "owner TEXT, "
+            "lease_until REAL)"
+        )
+        # ledger ที่สร้างก่อนมี lease: เพิ่มคอลัมน์ (event เดิมไม่มีเจ้าของ ใครก็รับไปได้)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+        for column, column_type in (('owner', 'TEXT'), ('lease_until', 'REAL')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE events ADD COLUMN {column} {column_type}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS slot_bookings ("
+            "booking_id TEXT PRIMARY KEY, "
+            "date TEXT NOT NULL, "
+            "time TEXT NOT NULL, "
+            "seats INTEGER NOT NULL, "
+            "tables INTEGER NOT NULL, "
+            "active INTEGER NOT NULL DEFAULT 1, "
+            "updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_slot_bookings_slot ON slot_bookings (date, time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_state ON events (state, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_booking ON events (booking_id, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_replicated ON events (replicated_at)")
+        return conn
+
+    def append(self, op: Dict[str, Any], claim: Optional[SlotClaim] = None) -> Optional[int]:
+        """
+        บันทึก event ใหม่ (คืนค่าเลข seq)
+
+        ถ้าระบุ claim จะจองที่นั่งใน slot_bookings ใน transaction เดียวกัน
+        และคืนค่า None โดยไม่บันทึกอะไรเลยถ้าช่วงเวลานั้นรับไม่ได้แล้ว
+        """
+        booking_id = str(op['booking_id'])
+        payload = json.dumps(op, ensure_ascii=False, separators=(',', ':'))
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE: ถือ write lock ตั้งแต่ตอนอ่านยอดที่นั่ง worker อื่นจึงจองแทรกไม่ได้
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if claim is not None and not self._claim_seats(booking_id, claim, now):
+                    self._conn.execute("ROLLBACK")
+                    return None
+                cursor = self._conn.execute(
+                    "INSERT INTO events (booking_id, op, payload, created_at, owner, lease_until) VALUES (?, ?, ?, ?, ?, ?)",
+                    (booking_id, op['op'], payload, now, self.owner, now + self.lease_seconds)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.lastrowid
+
+    def _claim_seats(self, booking_id: str, claim: SlotClaim, now: float) -> bool:
+        """จองที่นั่งของ booking_id ใน slot_bookings ถ้ายังว่างพอ (เรียกภายใน transaction แบบ IMMEDIATE)"""
+        seats, tables = self._conn.execute(
+            "SELECT COALESCE(SUM(seats), 0), COALESCE(SUM(tables), 0) FROM slot_bookings "
+            "WHERE date = ? AND time = ? AND active = 1 AND booking_id != ?",
+            (claim.date, claim.time, booking_id)
+        ).fetchone()
+        if seats + claim.seats > claim.seat_capacity or tables + claim.tables > claim.table_capacity:
+            return False
+        self._conn.execute(
+            "INSERT OR REPLACE INTO slot_bookings (booking_id, date, time, seats, tables, active, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 1, ?)",
+            (booking_id, claim.date, claim.time, claim.seats, claim.tables, now)
+        )
+        return True
+
+    def set_booking_active(self, booking_id: str, active: bool, claim: Optional[SlotClaim] = None) -> bool:
+        """
+        เปลี่ยนว่าการจองนี้ยังใช้ที่นั่งอยู่หรือไม่ (ยกเลิก / ไม่มาใช้บริการ = คืนที่นั่ง)
+
+        การเปิดใช้การจองที่ยกเลิกไปแล้วพร้อม claim ตรวจที่ว่างแบบเดียวกับการจองใหม่
+        คืนค่า False โดยไม่เปลี่ยนอะไรถ้าช่วงเวลานั้นเต็มแล้ว
+        """
+        booking_id = str(booking_id)
+        now = time.time()
+        with self._lock:
+            if active and claim is not None:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    claimed = self._claim_seats(booking_id, claim, now)
+                    self._conn.execute("COMMIT" if claimed else "ROLLBACK")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                return claimed
+            self._conn.execute(
+                "UPDATE slot_bookings SET active = ?, updated_at = ? WHERE booking_id = ?",
+                (1 if active else 0, now, booking_id)
+            )
+        return True
+
+    def sync_bookings(self, entries: List[Tuple[str, str, str, int, int, bool]], snapshot_started: float):
+        """
+        ปรับ slot_bookings ให้ตรงกับข้อมูลทั้ง sheet (booking_id, date, time, seats, tables, active)
+
+        snapshot_started = เวลาที่เริ่มอ่าน sheet แถวที่ถูกแก้หลังจากนั้นไม่ถูกทับด้วยข้อมูลที่เก่ากว่า
+        การจองที่ไม่มีใน sheet จะถูกลบ ยกเว้นที่ยังค้างใน ledger หรือเพิ่งเขียนลง sheet หลังเริ่มอ่าน
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO slot_bookings (booking_id, date, time, seats, tables, active, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (booking_id) DO UPDATE SET "
+                    "date = excluded.date, time = excluded.time, seats = excluded.seats, "
+                    "tables = excluded.tables, active = excluded.active, updated_at = excluded.updated_at "
+                    "WHERE slot_bookings.updated_at < ?",
+                    [
+                        (str(booking_id), date, time_str, seats, tables, 1 if active else 0, snapshot_started, snapshot_started)
+                        for booking_id, date, time_str, seats, tables, active in entries
+                    ]
+                )
+                in_sheet = {str(entry[0]) for entry in entries}
+                known = self._conn.execute(
+                    "SELECT booking_id FROM slot_bookings WHERE updated_at < ? AND booking_id NOT IN ("
+                    "SELECT booking_id FROM events WHERE op = 'append' AND (state = ? OR replicated_at >= ?))",
+                    (snapshot_started, STATE_PENDING, snapshot_started)
+                ).fetchall()
+                self._conn.executemany(
+                    "DELETE FROM slot_bookings WHERE booking_id = ?",
+                    [(booking_id,) for (booking_id,) in known if booking_id not in in_sheet]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def claim(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """รับ event ที่ค้างของ worker อื่นที่ lease หมดอายุ / เจ้าของตายแล้ว มาเป็นของ ledger นี้"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT seq, payload, owner, lease_until FROM events "
+                    "WHERE state = ? AND (owner IS NULL OR owner != ?) ORDER BY seq",
+                    (STATE_PENDING, self.owner)
+                ).fetchall()
+                dead_owners = {}
+                claimed = []
+                for seq, payload, owner, lease_until in rows:
+                    if owner and lease_until and lease_until > now:
+                        if owner not in dead_owners:
+                            dead_owners[owner] = _owner_is_dead(owner)
+                        if not dead_owners[owner]:
+                            continue
+                    claimed.append((seq, payload))
+                self._conn.executemany(
+                    "UPDATE events SET owner = ?, lease_until = ? WHERE seq = ?",
+                    [(self.owner, now + self.lease_seconds, seq) for seq, _ in claimed]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(seq, json.loads(payload)) for seq, payload in claimed]
+
+    def renew(self):
+        """ต่ออายุ lease ของ event ที่ค้างของ ledger นี้"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE events SET lease_until = ? WHERE owner = ? AND state = ?",
+                (time.time() + self.lease_seconds, self.owner, STATE_PENDING)
+            )
+
+    def release(self):
+        """ปล่อย event ที่ค้างให้ worker อื่นรับไปได้ทันที (ใช้ตอนหยุด process)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE events SET lease_until = 0 WHERE owner = ? AND state = ?",
+                (self.owner, STATE_PENDING)
+            )
+
+    def pending(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """event ที่ยังไม่ได้ replicate ไป sheet (ของทุก worker) เรียงตามลำดับ"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, payload FROM events WHERE state = ? ORDER BY seq", (STATE_PENDING,)
+            ).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def mark(self, seqs: Iterable[int], state: str):
+        """เปลี่ยนสถานะของ event (replicated / discarded)"""
+        seqs = list(seqs)
+        if not seqs:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            if state == STATE_DISCARDED:
+                # การจองที่ถูกทิ้ง (แจ้งผู้ใช้ว่าไม่สำเร็จแล้ว) ต้องคืนที่นั่ง
+                self._conn.executemany(
+                    "DELETE FROM slot_bookings WHERE booking_id IN ("
+                    "SELECT booking_id FROM events WHERE seq = ? AND op = 'append' AND state = ?)",
+                    [(seq, STATE_PENDING) for seq in seqs]
+                )
+            self._conn.executemany(
+                "UPDATE events SET state = ?, replicated_at = ? WHERE seq = ? AND state = ?",
+                [(state, now, seq, STATE_PENDING) for seq in seqs]
+            )
+            self._conn.execute("COMMIT")
+
+    def history(self, booking_id: str) -> List[Dict[str, Any]]:
+        """ประวัติการเปลี่ยนแปลงทั้งหมดของการจอง"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, payload, created_at, state FROM events WHERE booking_id = ? ORDER BY seq",
+                (str(booking_id),)
+            ).fetchall()
+        return [
+            {'seq': seq, 'event': json.loads(payload), 'created_at': created_at, 'state': state}
+            for seq, payload, created_at, state in rows
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """จำนวน event แยกตามสถานะ และอายุของ event ที่ค้างนานที่สุด"""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM events GROUP BY state").fetchall())
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) FROM events WHERE state = ?", (STATE_PENDING,)
+            ).fetchone()[0]
+            active_bookings = self._conn.execute("SELECT COUNT(*) FROM slot_bookings WHERE active = 1").fetchone()[0]
+        return {
+            'active_slot_bookings': active_bookings,
+            'pending': counts.get(STATE_PENDING, 0),
+            'replicated': counts.get(STATE_REPLICATED, 0),
+            'discarded': counts.get(STATE_DISCARDED, 0),
+            'oldest_pending_seconds': round(time.time() - oldest, 1) if oldest else 0.0
+        }
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Optional, List
+
+import httpx
+
+from config import (
+    LINE_API_BASE_URL,
+    LINE_HEADERS,
+    LINE_HTTP_TIMEOUT_SECONDS,
+    LINE_HTTP_MAX_CONNECTIONS,
+    LINE_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    LINE_MAX_CONCURRENT_REQUESTS
+)
+from metrics import observe_line_api
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# LINE Messaging API endpoints
+REPLY_PATH = "/v2/bot/message/reply"
+PUSH_PATH = "/v2/bot/message/push"
+PROFILE_PATH = "/v2/bot/profile/{user_id}"
+
+class LineClient:
+    """
+    Async client สำหรับ LINE Messaging API
+
+    ใช้ httpx.AsyncClient ตัวเดียวทั้ง process (connection pool + HTTP keep-alive)
+    มี timeout ทุก request และจำกัดจำนวน request ที่ส่งพร้อมกันด้วย semaphore
+    การเรียก API จึงไม่ block event loop และ TLS handshake เกิดขึ้นแค่ครั้งแรก
+    """
+
+    def __init__(
+        self,
+        base_url: str = LINE_API_BASE_URL,
+        headers: Dict[str, str] = None,
+        timeout: float = LINE_HTTP_TIMEOUT_SECONDS,
+        max_connections: int = LINE_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = LINE_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        max_concurrency: int = LINE_MAX_CONCURRENT_REQUESTS,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.base_url = base_url
+        self.headers = dict(headers or LINE_HEADERS)
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.max_concurrency = max_concurrency
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """สร้าง httpx client ครั้งแรกที่ใช้งาน (ต้องอยู่ใน event loop)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections
+                ),
+                transport=self.transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        json_body: Any = None,
+        content: Optional[bytes] = None,
+        endpoint: Optional[str] = None
+    ) -> Optional[httpx.Response]:
+        """ส่ง request ไปยัง LINE API (คืนค่า None ถ้าเชื่อมต่อไม่สำเร็จ, endpoint = path แบบ template สำหรับ metrics)"""
+        client = self._get_client()
+        started = time.perf_counter()
+        try:
+            with span("line_api", method=method, endpoint=endpoint or path) as current:
+                async with self._semaphore:
+                    response = await client.request(method, path, json=json_body, content=content)
+                if current is not None:
+                    current.set(status=response.status_code)
+
+            if response.status_code >= 400:
+                logger.warning(f"LINE API {method} {path} returned {response.status_code}: {response.text[:200]}")
+            return response
+
+        except httpx.TimeoutException:
+            logger.warning(f"LINE API {method} {path} timed out after {self.timeout}s")
+            return None
+        except httpx.HTTPError as e:
+            logger.error(f"LINE API {method} {path} error: {e}")
+            return None
+        finally:
+            observe_line_api(method, endpoint or path, time.perf_counter() - started)
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> Optional[httpx.Response]:
+        """POST JSON payload"""
+        return await self.request("POST", path, json_body=payload)
+
+    async def post_raw(self, path: str, body: bytes) -> Optional[httpx.Response]:
+        """POST body ที่ encode เป็น JSON แล้ว (เช่น จาก flex template)"""
+        return await self.request("POST", path, content=body)
+
+    async def reply(self, reply_token: str, messages: List[Dict[str, Any]]) -> Optional[httpx.Response]:
+        """ตอบกลับด้วย reply token"""
+        return await self.post(REPLY_PATH, {"replyToken": reply_token, "messages": messages})
+
+    async def push(self, to: str, messages: List[Dict[str, Any]]) -> Optional[httpx.Response]:
+        """ส่ง push message"""
+        return await self.post(PUSH_PATH, {"to": to, "messages": messages})
+
+    async def get_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """ดึงข้อมูล profile ของผู้ใช้"""
+        response = await self.request("GET", PROFILE_PATH.format(user_id=user_id), endpoint=PROFILE_PATH)
+        if response is None or response.status_code != 200:
+            return None
+        return response.json()
+
+    async def aclose(self):
+        """ปิด connection pool (เรียกตอน shutdown)"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._semaphore = None
+
+# Client ที่ใช้ร่วมกันทั้ง process
+line_client = LineClient()
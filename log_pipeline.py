@@ -0,0 +1,147 @@
+import atexit
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import Dict, Any, List, Optional
+
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler ที่ไม่ flush ทุก record (listener เรียก flush_batch ครั้งเดียวต่อ batch)"""
+
+    # False = flush ทุก record เหมือน RotatingFileHandler ปกติ (ใช้เมื่อไม่ได้อยู่หลังคิว)
+    batched = True
+
+    def flush(self):
+        if not self.batched:
+            super().flush()
+
+    def flush_batch(self):
+        super().flush()
+
+    def close(self):
+        self.flush_batch()
+        super().close()
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler ที่ไม่รอเมื่อคิวเต็ม (ทิ้ง record และนับจำนวนไว้)"""
+
+    def __init__(self, log_queue: queue.Queue, pipeline: "LogPipeline"):
+        super().__init__(log_queue)
+        self.pipeline = pipeline
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.record_drop(record)
+
+class LogPipeline:
+    """
+    ส่ง log ผ่านคิวไปเขียนใน thread แยก
+
+    logger ใน request path แค่ใส่ record ลงคิว (ไม่รอ disk / การหมุนไฟล์)
+    thread ของ pipeline ดึง record ออกทีละ batch ส่งให้ handler ตามชื่อ logger
+    แล้ว flush ไฟล์ครั้งเดียวต่อ batch ถ้าคิวเต็ม record ใหม่จะถูกทิ้งและนับไว้
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 256):
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self.batch_size = max(1, batch_size)
+        self._routes: Dict[str, List[logging.Handler]] = {}
+        self._default: List[logging.Handler] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._sentinel = object()
+        self._stats = {
+            'written': 0,
+            'dropped': 0,
+            'batches': 0,
+            'max_batch': 0
+        }
+        self._dropped_by_level: Dict[str, int] = {}
+
+    def route(self, logger_name: Optional[str], handlers: List[logging.Handler]):
+        """กำหนด handler ของ logger (None = root และ logger อื่นทั้งหมด)"""
+        if logger_name is None:
+            self._default = list(handlers)
+        else:
+            self._routes[logger_name] = list(handlers)
+
+    def handler(self) -> DroppingQueueHandler:
+        """handler สำหรับใส่ให้ logger (ทุก logger ใช้คิวเดียวกัน)"""
+        return DroppingQueueHandler(self.queue, self)
+
+    def record_drop(self, record: logging.LogRecord):
+        with self._lock:
+            self._stats['dropped'] += 1
+            self._dropped_by_level[record.levelname] = self._dropped_by_level.get(record.levelname, 0) + 1
+
+    # === Listener thread ===
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="log-pipeline", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """เขียน record ที่เหลือในคิวแล้วหยุด thread"""
+        if self._thread is None:
+            return
+        # ใส่ sentinel แบบรอได้ (ต้องไม่ถูกทิ้งแม้คิวเต็ม)
+        self.queue.put(self._sentinel)
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = self._write(batch)
+            if stopping:
+                break
+
+    def _write(self, batch: List[Any]) -> bool:
+        stopping = False
+        touched = set()
+        written = 0
+        for record in batch:
+            if record is self._sentinel:
+                stopping = True
+                continue
+            handlers = self._routes.get(record.name.split('.', 1)[0], self._default)
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+                    touched.add(handler)
+            written += 1
+
+        for handler in touched:
+            try:
+                if isinstance(handler, BatchedRotatingFileHandler):
+                    handler.flush_batch()
+                else:
+                    handler.flush()
+            except Exception:
+                # เขียนไฟล์ไม่ได้ (เช่น disk เต็ม) ไม่ให้ thread ของ pipeline หยุด
+                pass
+
+        with self._lock:
+            self._stats['written'] += written
+            self._stats['batches'] += 1
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+        return stopping
+
+    def get_stats(self) -> Dict[str, Any]:
+        """สถิติของ pipeline (รวมจำนวน record ที่ถูกทิ้ง)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['dropped_by_level'] = dict(self._dropped_by_level)
+        stats['queued'] = self.queue.qsize()
+        stats['max_queue'] = self.queue.maxsize
+        return stats
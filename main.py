@@ -1,16 +1,66 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
+import asyncio
+import hmac
 import json
 import logging
 
 # Import config ที่มี logging setup
-from config import log_booking_event, log_webhook_request, log_error_with_context, APP_TITLE, APP_VERSION
-from webhook_handler import handle_webhook_request
+from config import (
+    log_booking_event, log_webhook_request, log_error_with_context, get_logging_stats, get_log_volume_report,
+    APP_TITLE, APP_VERSION, WEBHOOK_ASYNC_PROCESSING, ADMIN_API_TOKEN
+)
+from webhook_handler import handle_webhook_request, get_dispatch_stats
+from event_queue import event_queue
+from timer_wheel import timer_wheel
 from utils import verify_line_signature
+from line_client import line_client
+from sheets_io import sheets_io, get_sheets_io_metrics
+from sheets_write_buffer import write_buffer
+from sheets_api import sheets_api
+from phone_index import phone_index
+from google_sheets import flush_pending_writes
+from session_manager import count_active_sessions
+from metrics import timed, add_gauge, render_metrics, WEBHOOK_SECONDS
+from profiler import profiler, ProfilerBusyError
+from tracing import span_recorder
 
 app = FastAPI(title=APP_TITLE, version=APP_VERSION)
 logger = logging.getLogger(__name__)
 
+# จำนวน session ล่าสุด (session store เป็น async จึงนับใน /metrics ก่อน render แล้วให้ gauge อ่านค่านี้)
+_active_sessions = 0
+
+# gauge อ่านค่าตอน scrape /metrics
+add_gauge('linebot_active_sessions', 'Active booking / cancellation sessions', lambda: _active_sessions)
+add_gauge('linebot_session_timers', 'Pending session timeout timers', lambda: len(timer_wheel))
+add_gauge('linebot_webhook_queue_depth', 'Webhook events waiting in the queue', lambda: event_queue.get_metrics()['depth'])
+add_gauge('linebot_in_flight_events', 'Webhook events being processed', lambda: get_dispatch_stats()['in_flight_events'])
+add_gauge('linebot_sheets_io_queue_depth', 'Jobs waiting for the Sheets I/O pool', lambda: get_sheets_io_metrics()['queue_depth'])
+add_gauge(
+    'linebot_sheets_pending_writes', 'Buffered writes not yet replicated to Sheets',
+    lambda: sum(write_buffer.get_stats()[key] for key in ('pending_appends', 'pending_updates'))
+)
+add_gauge('linebot_log_queue_depth', 'Log records waiting to be written', lambda: get_logging_stats().get('queued', 0))
+
+@app.on_event("startup")
+async def startup():
+    """เริ่ม background worker เมื่อเปิดแอป"""
+    timer_wheel.start()
+    write_buffer.start(flush_pending_writes)
+    if WEBHOOK_ASYNC_PROCESSING:
+        await event_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """ปิด resource ที่ใช้ร่วมกันเมื่อปิดแอป"""
+    await event_queue.stop()
+    await timer_wheel.stop()
+    await line_client.aclose()
+    # flush การเขียนที่ค้างอยู่ใน buffer ลง sheet แล้วรองาน Sheets ที่ค้างให้เสร็จ (ใน thread ไม่บล็อก event loop)
+    await asyncio.to_thread(write_buffer.stop)
+    await asyncio.to_thread(sheets_io.shutdown, True)
+
 @app.get("/")
 async def health_check():
     """Health check endpoint"""
@@ -18,6 +68,7 @@ async def health_check():
     return {"status": "OK", "message": "Bot is running"}
 
 @app.post("/webhook")
+@timed(WEBHOOK_SECONDS)
 async def webhook(request: Request):
     """Webhook endpoint สำหรับรับข้อความจาก LINE"""
     try:
@@ -56,7 +107,21 @@ async def webhook(request: Request):
             logger.warning("Empty request body")
             raise HTTPException(status_code=400, detail="Empty body")
         
-        logger.info(f"Received webhook: {json.dumps(payload, ensure_ascii=False)}")
+        # payload ถูกบันทึกใน webhook.log แล้ว ไม่ต้อง dump ซ้ำ
+        logger.info(f"Received webhook: {len(payload.get('events', []))} events")
+        
+        # นำ event เข้าคิวแล้วตอบกลับทันที (worker จะประมวลผลเบื้องหลัง)
+        if event_queue.is_running:
+            if not await event_queue.enqueue_events(payload.get('events', [])):
+                logger.error("Webhook queue is full")
+                raise HTTPException(status_code=503, detail="Server busy, please retry")
+            
+            log_webhook_request(
+                method="POST",
+                headers=headers,
+                response_status=200
+            )
+            return {"status": "ok"}
         
         # ส่งต่อไปยัง handler
         result = await handle_webhook_request(payload, headers)
@@ -66,7 +131,6 @@ async def webhook(request: Request):
         log_webhook_request(
             method="POST",
             headers=headers,
-            body=payload,
             response_status=status_code
         )
         
@@ -111,9 +175,57 @@ async def health_detail():
         "status": "healthy",
         "timestamp": time.time(),
         "version": APP_VERSION,
-        "service": "LINE Bot Restaurant Booking"
+        "service": "LINE Bot Restaurant Booking",
+        "webhook_queue": event_queue.get_metrics(),
+        "event_dispatch": get_dispatch_stats(),
+        "session_timers": timer_wheel.get_stats(),
+        "sheets_write_buffer": write_buffer.get_stats(),
+        "sheets_api": sheets_api.get_stats(),
+        "phone_index": phone_index.get_stats(),
+        "logging": get_logging_stats(),
+        "tracing": span_recorder.get_stats(),
+        "profiler": profiler.get_stats(),
+        "log_volume": get_log_volume_report(),
+        "sheets_io": get_sheets_io_metrics()
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint"""
+    global _active_sessions
+    _active_sessions = await count_active_sessions()
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+def _require_admin(request: Request):
+    """ตรวจ header X-Admin-Token (ไม่ได้ตั้ง ADMIN_API_TOKEN = ไม่มี endpoint นี้)"""
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/admin/profile")
+async def admin_profile(request: Request, seconds: float = 10.0, interval_ms: float = 5.0):
+    """เปิด sampling profiler seconds วินาที คืนค่า collapsed stacks (flamegraph.pl / speedscope)"""
+    _require_admin(request)
+    logger.info(f"Profiling for {seconds}s (interval {interval_ms}ms)")
+    try:
+        # sample ใน thread แยก event loop ยังทำงานตามปกติระหว่าง profile
+        stacks = await asyncio.get_running_loop().run_in_executor(
+            None, profiler.profile, seconds, interval_ms / 1000
+        )
+    except ProfilerBusyError:
+        raise HTTPException(status_code=409, detail="Profiler is already running")
+    return PlainTextResponse(stacks, headers={"Content-Disposition": "attachment; filename=profile.folded"})
+
+@app.get("/admin/traces")
+async def admin_traces(request: Request, limit: int = 200, trace_id: str = None, min_duration_ms: float = 0.0):
+    """span ล่าสุดเป็น JSON lines (กรองด้วย trace_id / min_duration_ms ได้)"""
+    _require_admin(request)
+    body = span_recorder.export_jsonl(limit=limit, trace_id=trace_id, min_duration_ms=min_duration_ms)
+    return Response(content=body, media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -129,5 +241,5 @@ if __name__ == "__main__":
         log_level="info"
     )
     
-    # สำหรับ production ใช้คำสั่ง:
+    # สำหรับ production ใช้คำสั่ง (ต้องตั้ง SESSION_STORE=redis หรือ sqlite เมื่อใช้หลาย worker):
     # uvicorn main:app --host 0.0.0.0 --port 8000 --workers 4
\ No newline at end of file
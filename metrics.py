@@ -0,0 +1,139 @@
+import asyncio
+import functools
+import logging
+import time
+from typing import Callable, List, Tuple
+
+from config import METRICS_ENABLED
+from tracing import traced
+
+try:
+    from prometheus_client import CollectorRegistry, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:  # ไม่มี prometheus_client: metric ทุกตัวเป็น no-op
+    CollectorRegistry = None
+
+logger = logging.getLogger(__name__)
+
+# bucket ของเวลา (วินาที) สำหรับ request / ขั้นตอนการจอง และสำหรับการเรียก API ภายนอก
+HANDLER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+API_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class _NoopMetric:
+    """metric ที่ไม่ทำอะไร (ใช้เมื่อปิด metrics หรือไม่มี prometheus_client)"""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def observe(self, value: float):
+        pass
+
+class _GaugeCollector:
+    """gauge ที่อ่านค่าตอน scrape (ไม่มีต้นทุนใน request path)"""
+
+    def __init__(self):
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+
+    def add(self, name: str, documentation: str, read: Callable[[], float]):
+        self._gauges.append((name, documentation, read))
+
+    def collect(self):
+        for name, documentation, read in self._gauges:
+            try:
+                value = float(read())
+            except Exception as e:
+                logger.warning(f"Error reading metric {name}: {e}")
+                continue
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+enabled = METRICS_ENABLED and CollectorRegistry is not None
+
+if enabled:
+    # Registry ที่ใช้ร่วมกันทั้ง process
+    registry = CollectorRegistry()
+    _gauges = _GaugeCollector()
+    registry.register(_gauges)
+
+    WEBHOOK_SECONDS = Histogram(
+        'linebot_webhook_request_seconds', 'Time spent handling POST /webhook',
+        buckets=HANDLER_BUCKETS, registry=registry
+    )
+    BOOKING_STEP_SECONDS = Histogram(
+        'linebot_booking_step_seconds', 'Time spent handling one booking step',
+        ['step'], buckets=HANDLER_BUCKETS, registry=registry
+    )
+    SHEETS_CALL_SECONDS = Histogram(
+        'linebot_sheets_call_seconds', 'Time spent in google_sheets functions',
+        ['function'], buckets=API_BUCKETS, registry=registry
+    )
+    FLEX_SEND_SECONDS = Histogram(
+        'linebot_flex_send_seconds', 'Time spent building and sending LINE messages',
+        ['function'], buckets=API_BUCKETS, registry=registry
+    )
+    LINE_API_SECONDS = Histogram(
+        'linebot_line_api_seconds', 'LINE Messaging API request latency',
+        ['method', 'endpoint'], buckets=API_BUCKETS, registry=registry
+    )
+else:
+    registry = None
+    _gauges = None
+    WEBHOOK_SECONDS = BOOKING_STEP_SECONDS = SHEETS_CALL_SECONDS = FLEX_SEND_SECONDS = LINE_API_SECONDS = _NoopMetric()
+
+def timed(metric, **labels):
+    """decorator จับเวลาฟังก์ชัน (sync หรือ async) ลง histogram"""
+    def decorator(func):
+        if not enabled:
+            return func
+
+        # ผูก label ครั้งเดียวตอน decorate (ตอนเรียกแค่ perf_counter + observe)
+        child = metric.labels(**labels) if labels else metric
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def sheets_call(func):
+    """จับเวลาฟังก์ชันใน google_sheets.py (label = ชื่อฟังก์ชัน) และครอบด้วย trace span"""
+    name = func.__name__.lstrip('_')
+    return traced(f"sheets.{name}")(timed(SHEETS_CALL_SECONDS, function=name)(func))
+
+def flex_send(func):
+    """จับเวลาฟังก์ชันส่งข้อความใน flex_messages.py (label = ชื่อฟังก์ชัน)"""
+    return timed(FLEX_SEND_SECONDS, function=func.__name__)(func)
+
+def booking_step(step: str):
+    """จับเวลาขั้นตอนการจอง (name, phone, date, time, party_size, special_requests, ...) และครอบด้วย trace span"""
+    def decorator(func):
+        return traced(f"booking_step.{step}")(timed(BOOKING_STEP_SECONDS, step=step)(func))
+    return decorator
+
+def observe_line_api(method: str, endpoint: str, seconds: float):
+    """บันทึกเวลาของ LINE API (endpoint ต้องเป็น path แบบ template ไม่ใช่ path ที่มี user ID)"""
+    LINE_API_SECONDS.labels(method, endpoint).observe(seconds)
+
+def add_gauge(name: str, documentation: str, read: Callable[[], float]):
+    """เพิ่ม gauge ที่อ่านค่าจาก read() ทุกครั้งที่ scrape /metrics"""
+    if enabled:
+        _gauges.add(name, documentation, read)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """ข้อมูลสำหรับ /metrics (body, content type)"""
+    if not enabled:
+        return b"# metrics disabled (METRICS_ENABLED=false or prometheus_client not installed)\n", "text/plain; charset=utf-8"
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,232 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple, Set, Iterable
+
+from config import PHONE_INDEX_PATH
+from reservation_store import (
+    reservation_store,
+    RESERVATION_SHEET_NAME,
+    COLUMN_BOOKING_ID,
+    COLUMN_PHONE,
+    COLUMN_DATE,
+    COLUMN_TIME,
+    COLUMN_STATUS,
+    COLUMN_PARTY_SIZE,
+    FIRST_DATA_ROW
+)
+from utils import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# คอลัมน์ที่เก็บใน index (พอสำหรับแสดงรายการการจองของผู้ใช้)
+INDEXED_COLUMNS = (COLUMN_BOOKING_ID, COLUMN_PHONE, COLUMN_DATE, COLUMN_TIME, COLUMN_PARTY_SIZE, COLUMN_STATUS)
+
+def _entry(row_number: int, record: Dict[str, Any]) -> Optional[Tuple]:
+    booking_id = str(record.get(COLUMN_BOOKING_ID) or '')
+    phone = normalize_phone(record.get(COLUMN_PHONE))
+    if not booking_id or not phone:
+        return None
+    return (
+        booking_id,
+        phone,
+        str(record.get(COLUMN_DATE, '')),
+        str(record.get(COLUMN_TIME, '')),
+        str(record.get(COLUMN_PARTY_SIZE, '')),
+        str(record.get(COLUMN_STATUS, '')),
+        row_number
+    )
+
+class PhoneIndex:
+    """
+    Index เบอร์โทร -> การจอง เก็บในไฟล์ SQLite (อยู่รอดข้าม restart)
+
+    ลงทะเบียนเป็น listener ของ reservation store จึงถูกอัพเดททุกครั้งที่มีการจอง /
+    ยกเลิก / เปลี่ยนสถานะ การโหลด sheet ใหม่เขียนเฉพาะแถวที่เปลี่ยน และลบการจอง
+    ที่ไม่มีใน sheet แล้วใน transaction เดียว การค้นหาจากเบอร์โทรจึงไม่ต้องโหลดข้อมูลทั้ง sheet
+    """
+
+    def __init__(self, path: str = PHONE_INDEX_PATH, store=reservation_store):
+        self.path = path
+        self._store = store
+        self._lock = threading.Lock()
+        # เปิดไฟล์ตอนใช้ครั้งแรก (import โมดูลหรือรัน CLI / test ไม่สร้างไฟล์ใน repo)
+        self._open_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        # ค่าที่เขียนลงไฟล์ล่าสุด (ข้ามการเขียนซ้ำเมื่อโหลด sheet ใหม่แล้วข้อมูลไม่เปลี่ยน)
+        self._written: Dict[str, Tuple] = {}
+        self._bulk: Optional[List[Tuple]] = None
+        # booking ID ที่พบระหว่างโหลด sheet ใหม่ (ที่เหลือใน index ถูกลบออกจาก sheet แล้ว)
+        self._seen: Set[str] = set()
+        self._built = False
+
+    def _open(self):
+        """เปิดไฟล์ index และโหลดรายการที่เขียนไว้ (ครั้งแรกที่ใช้เท่านั้น)"""
+        if self._conn is not None:
+            return
+        with self._open_lock:
+            if self._conn is not None:
+                return
+            if self.path != ":memory:" and os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS phone_index ("
+                "booking_id TEXT PRIMARY KEY, phone TEXT NOT NULL, date TEXT, time TEXT, "
+                "party_size TEXT, status TEXT, row_number INTEGER, updated_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_phone_index_phone ON phone_index (phone)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+            self._written = {
+                row[0]: tuple(row) for row in conn.execute(
+                    "SELECT booking_id, phone, date, time, party_size, status, row_number FROM phone_index"
+                )
+            }
+            self._built = conn.execute("SELECT 1 FROM meta WHERE key = 'built_at'").fetchone() is not None
+            self._conn = conn
+
+    # === Store listener ===
+    def on_clear(self):
+        # โหลด sheet ใหม่: เก็บรายการไว้เขียนรวดเดียวตอน on_loaded (ไม่ลบข้อมูลเดิมใน index)
+        self._bulk = []
+        self._seen = set()
+
+    def on_insert(self, record: Dict[str, Any]):
+        self._open()
+        row_number = self._store.get_row_number(record.get(COLUMN_BOOKING_ID, ''))
+        entry = _entry(row_number, record) if row_number is not None else None
+        if entry is not None and self._bulk is not None:
+            self._seen.add(entry[0])
+        if entry is None or self._written.get(entry[0]) == entry:
+            return
+
+        if self._bulk is not None:
+            self._bulk.append(entry)
+        else:
+            self._write([entry])
+
+    def on_remove(self, record: Dict[str, Any]):
+        # การแก้ไขเรียก on_remove แล้ว on_insert ทันที เขียนทับด้วย booking ID ใน on_insert
+        pass
+
+    def on_loaded(self):
+        self._open()
+        entries, self._bulk = self._bulk or [], None
+        removed, self._seen = set(self._written) - self._seen, set()
+        self._write(entries, mark_built=True, removed=removed)
+
+    # === Writes ===
+    def _write(self, entries: List[Tuple], mark_built: bool = False, removed: Iterable[str] = ()):
+        self._open()
+        removed = list(removed)
+        if not entries and not removed and (self._built or not mark_built):
+            return
+
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO phone_index "
+                    "(booking_id, phone, date, time, party_size, status, row_number, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [entry + (now,) for entry in entries]
+                )
+                self._conn.executemany("DELETE FROM phone_index WHERE booking_id = ?", [(booking_id,) for booking_id in removed])
+                if mark_built:
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)", (str(now),))
+                self._conn.execute("COMMIT")
+
+                for entry in entries:
+                    self._written[entry[0]] = entry
+                for booking_id in removed:
+                    self._written.pop(booking_id, None)
+                self._built = self._built or mark_built
+        except Exception as e:
+            logger.error(f"Error writing phone index: {e}")
+            try:
+                self._conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+        if len(entries) > 1 or removed:
+            logger.info(f"Wrote {len(entries)} entries to phone index, removed {len(removed)}")
+
+    def rebuild(self, records: List[Dict[str, Any]]) -> int:
+        """สร้าง index ใหม่ทั้งหมดจากข้อมูลใน sheet (get_all_records)"""
+        self._open()
+        entries = [
+            entry for entry in (_entry(i + FIRST_DATA_ROW, record) for i, record in enumerate(records))
+            if entry is not None
+        ]
+        # เขียนทับและลบรายการที่ไม่มีใน sheet ใน transaction เดียว (index ไม่ว่างระหว่างสร้างใหม่)
+        removed = set(self._written) - {entry[0] for entry in entries}
+        self._write([entry for entry in entries if self._written.get(entry[0]) != entry], mark_built=True, removed=removed)
+        return len(entries)
+
+    # === Lookups ===
+    def is_built(self) -> bool:
+        """index เคยถูกสร้างจากข้อมูลทั้ง sheet แล้วหรือยัง"""
+        self._open()
+        return self._built
+
+    def find_by_phone(self, phone: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """ค้นหาการจองจากเบอร์โทร คืนค่า (row_number, record) เหมือน reservation store"""
+        self._open()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT booking_id, phone, date, time, party_size, status, row_number "
+                "FROM phone_index WHERE phone = ? ORDER BY row_number",
+                (normalize_phone(phone),)
+            ).fetchall()
+        return [(row[6], dict(zip(INDEXED_COLUMNS, row[:6]))) for row in rows]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """จำนวนรายการใน index"""
+        return {'built': self._built, 'entries': len(self._written)}
+
+# Index ที่ใช้ร่วมกันทั้ง process (ผูกกับ reservation store)
+phone_index = PhoneIndex()
+reservation_store.add_listener(phone_index)
+
+def _read_sheet_records() -> List[Dict[str, Any]]:
+    """
+    อ่านการจองทั้ง sheet ด้วย gspread client ธรรมดา
+
+    ไม่ import google_sheets เพราะจะสร้าง write buffer / ledger และ listener ของแอปใน process ของ CLI ด้วย
+    """
+    import gspread
+    from config import GOOGLE_SHEETS_CREDENTIALS, SPREADSHEET_ID
+
+    if not GOOGLE_SHEETS_CREDENTIALS or not SPREADSHEET_ID:
+        raise SystemExit("GOOGLE_SHEETS_CREDENTIALS / SPREADSHEET_ID not configured")
+
+    client = gspread.service_account_from_dict(json.loads(GOOGLE_SHEETS_CREDENTIALS))
+    return client.open_by_key(SPREADSHEET_ID).worksheet(RESERVATION_SHEET_NAME).get_all_records()
+
+def main():
+    """CLI: python phone_index.py rebuild"""
+    parser = argparse.ArgumentParser(description="Phone number index for reservations")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    try:
+        records = _read_sheet_records()
+    except Exception as e:
+        raise SystemExit(f"ไม่สามารถอ่านข้อมูลจาก Google Sheets ได้: {e}")
+
+    started_at = time.monotonic()
+    count = phone_index.rebuild(records)
+    print(f"Rebuilt phone index: {count} reservations in {time.monotonic() - started_at:.2f}s ({phone_index.path})")
+
+if __name__ == "__main__":
+    main()
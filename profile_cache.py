@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from config import (
+    PROFILE_CACHE_MAX_SIZE,
+    PROFILE_CACHE_TTL_SECONDS,
+    PROFILE_CACHE_NEGATIVE_TTL_SECONDS
+)
+from line_client import line_client
+
+logger = logging.getLogger(__name__)
+
+def fallback_display_name(user_id: str) -> str:
+    """ชื่อที่ใช้แทนเมื่อดึง profile ไม่ได้"""
+    if not user_id:
+        return "Unknown User"
+    return f"User_{user_id[:8]}"
+
+class ProfileCache:
+    """
+    Cache ชื่อแสดงของผู้ใช้ LINE (TTL + LRU)
+
+    - เก็บได้ไม่เกิน max_size รายการ เกินแล้วลบรายการที่ใช้ล่าสุดนานที่สุดออก
+    - ดึงไม่สำเร็จจะ cache ชื่อ fallback ไว้สั้นๆ (negative caching)
+    - ข้อความจากผู้ใช้คนเดียวกันที่เข้ามาพร้อมกันจะรอผลจากการดึงครั้งเดียว
+    """
+
+    def __init__(
+        self,
+        max_size: int = PROFILE_CACHE_MAX_SIZE,
+        ttl_seconds: int = PROFILE_CACHE_TTL_SECONDS,
+        negative_ttl_seconds: int = PROFILE_CACHE_NEGATIVE_TTL_SECONDS
+    ):
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'failures': 0}
+
+    def get_cached(self, user_id: str) -> Optional[str]:
+        """ดึงชื่อจาก cache (None ถ้าไม่มีหรือหมดอายุ)"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            display_name, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[user_id]
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self._stats['hits'] += 1
+            return display_name
+
+    def set(self, user_id: str, display_name: str, negative: bool = False):
+        """บันทึกชื่อลง cache"""
+        ttl = self.negative_ttl_seconds if negative else self.ttl_seconds
+        with self._lock:
+            self._entries[user_id] = (display_name, time.monotonic() + ttl)
+            self._entries.move_to_end(user_id)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, user_id: str = None):
+        """ลบชื่อออกจาก cache (ไม่ระบุ user_id = ล้างทั้งหมด)"""
+        with self._lock:
+            if user_id:
+                self._entries.pop(user_id, None)
+            else:
+                self._entries.clear()
+
+    async def get_display_name(self, user_id: str) -> str:
+        """ดึงชื่อแสดงของผู้ใช้ (ดึงจาก LINE API เฉพาะเมื่อไม่มีใน cache)"""
+        if not user_id:
+            return fallback_display_name(user_id)
+
+        cached = self.get_cached(user_id)
+        if cached is not None:
+            return cached
+
+        # มีการดึงของผู้ใช้คนนี้อยู่แล้ว รอผลเดียวกัน
+        inflight = self._inflight.get(user_id)
+        if inflight is not None:
+            with self._lock:
+                self._stats['coalesced'] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            display_name = await self._fetch(user_id)
+            future.set_result(display_name)
+            return display_name
+        except BaseException:
+            # ให้ผู้ที่รออยู่ได้ชื่อ fallback แทน (เช่นกรณี task ถูกยกเลิก)
+            if not future.done():
+                future.set_result(fallback_display_name(user_id))
+            raise
+        finally:
+            self._inflight.pop(user_id, None)
+
+    async def _fetch(self, user_id: str) -> str:
+        try:
+            profile = await line_client.get_profile(user_id)
+        except Exception as e:
+            logger.error(f"Error getting user profile for {user_id}: {e}")
+            profile = None
+
+        if profile and profile.get('displayName'):
+            display_name = profile['displayName']
+            self.set(user_id, display_name)
+            return display_name
+
+        with self._lock:
+            self._stats['failures'] += 1
+        logger.warning(f"Failed to get user profile for {user_id}, using fallback name")
+        display_name = fallback_display_name(user_id)
+        self.set(user_id, display_name, negative=True)
+        return display_name
+
+    def get_stats(self) -> Dict[str, Any]:
+        """สถิติของ cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['inflight'] = len(self._inflight)
+            return stats
+
+# Cache ที่ใช้ร่วมกันทั้ง process
+profile_cache = ProfileCache()
+
+async def get_cached_display_name(user_id: str) -> str:
+    """ดึงชื่อแสดงของผู้ใช้ผ่าน cache"""
+    return await profile_cache.get_display_name(user_id)
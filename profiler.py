@@ -0,0 +1,82 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, Optional
+
+from config import PROFILER_MAX_SECONDS
+
+class ProfilerBusyError(RuntimeError):
+    """มีการ profile อื่นทำงานอยู่แล้ว"""
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class SamplingProfiler:
+    """
+    Sampling profiler ที่เปิดได้ขณะ process ทำงาน (ไม่ต้อง attach จากภายนอก)
+
+    thread แยกอ่าน stack ของทุก thread (sys._current_frames) ทุก interval
+    แล้วนับ stack ที่เจอเป็น collapsed stack (flamegraph.pl / speedscope อ่านได้)
+    ระหว่างไม่ได้ profile ไม่มีต้นทุนเลย ระหว่าง profile ต้นทุนขึ้นกับ interval
+    """
+
+    def __init__(self, max_seconds: float = PROFILER_MAX_SECONDS):
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._running = False
+        self._last_run: Optional[Dict[str, Any]] = None
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def profile(self, seconds: float, interval: float = 0.005) -> str:
+        """sample stack เป็นเวลา seconds วินาที คืนค่า collapsed stacks ("a;b;c count" ต่อบรรทัด)"""
+        seconds = min(max(0.1, seconds), self.max_seconds)
+        interval = max(0.001, interval)
+
+        with self._lock:
+            if self._running:
+                raise ProfilerBusyError("profiler is already running")
+            self._running = True
+
+        stacks: Counter = Counter()
+        samples = 0
+        own_ident = threading.get_ident()
+        started = time.monotonic()
+        try:
+            deadline = started + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame))
+                        frame = frame.f_back
+                    labels.append(names.get(ident, f"thread-{ident}"))
+                    stacks[";".join(reversed(labels))] += 1
+                samples += 1
+                time.sleep(interval)
+        finally:
+            with self._lock:
+                self._running = False
+                self._last_run = {
+                    'seconds': round(time.monotonic() - started, 2),
+                    'interval_ms': interval * 1000,
+                    'samples': samples,
+                    'unique_stacks': len(stacks),
+                    'finished_at': time.time()
+                }
+
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """สถานะของ profiler และผลการ profile ครั้งล่าสุด"""
+        return {'running': self._running, 'last_run': self._last_run}
+
+# Profiler ที่ใช้ร่วมกันทั้ง process
+profiler = SamplingProfiler()
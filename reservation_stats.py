@@ -0,0 +1,155 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from reservation_store import (
+    reservation_store,
+    COLUMN_BOOKED_AT,
+    COLUMN_DATE,
+    COLUMN_TIME,
+    COLUMN_STATUS
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_CONFIRMED = 'ยืนยันแล้ว'
+STATUS_CANCELLED = 'ยกเลิกแล้ว'
+STATUS_COMPLETED = 'เสร็จสิ้น'
+
+# ค่าแทนวันที่ที่อ่านไม่ได้ (ไม่ถูกนับเมื่อกรองตามช่วงวัน)
+INVALID_ORDINAL = -1
+
+def _encode(values: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """แปลงค่าเป็น categorical (รายการค่าที่ไม่ซ้ำ, code ของแต่ละแถว)"""
+    index: Dict[str, int] = {}
+    codes = np.fromiter(
+        (index.setdefault(str(v), len(index)) for v in values), dtype=np.int32, count=len(values)
+    )
+    categories = np.array(list(index), dtype=object)
+    return categories, codes
+
+def _thai_date_ordinal(date_str: str) -> int:
+    """แปลงวันที่ dd-mm-yyyy (พ.ศ.) เป็น ordinal ของปฏิทิน"""
+    try:
+        day, month, year = date_str.split('-')
+        return date(int(year) - 543, int(month), int(day)).toordinal()
+    except (ValueError, AttributeError):
+        return INVALID_ORDINAL
+
+def _booked_at_ordinal(timestamp: str) -> int:
+    """แปลงเวลาที่จอง dd/mm/yyyy HH:MM:SS (ค.ศ. หรือ พ.ศ.) เป็น ordinal ของปฏิทิน"""
+    try:
+        day, month, year = str(timestamp).split(' ')[0].split('/')
+        year = int(year)
+        if year > 2500:
+            year -= 543
+        return date(year, int(month), int(day)).toordinal()
+    except (ValueError, AttributeError):
+        return INVALID_ORDINAL
+
+class ReservationSnapshot:
+    """
+    ตารางการจองแบบ columnar (numpy) สำหรับคำนวณสถิติ
+
+    สถานะ / วันที่ / เวลา เก็บเป็น categorical code (int32) ของแต่ละแถว
+    สถิติคำนวณด้วย bincount / mask แทนการวนลูปผ่าน list ของ dict
+    """
+
+    def __init__(self, version: int, columns: Dict[str, List[Any]]):
+        self.version = version
+        self.size = len(columns[COLUMN_STATUS])
+
+        self.status_values, self.status_codes = _encode(columns[COLUMN_STATUS])
+        self.date_values, self.date_codes = _encode(columns[COLUMN_DATE])
+        self.time_values, self.time_codes = _encode(columns[COLUMN_TIME])
+        booked_at = columns[COLUMN_BOOKED_AT]
+        self.booked_ordinals = np.fromiter(
+            (_booked_at_ordinal(value) for value in booked_at), dtype=np.int32, count=len(booked_at)
+        )
+
+        # แปลงวันที่ครั้งเดียวต่อค่าที่ไม่ซ้ำ แล้วกระจายไปทุกแถวด้วย code
+        self.date_value_ordinals = np.array(
+            [_thai_date_ordinal(d) for d in self.date_values], dtype=np.int32
+        )
+        self.date_ordinals = self.date_value_ordinals[self.date_codes] if self.size else np.zeros(0, dtype=np.int32)
+
+    def _status_mask(self, status: str) -> np.ndarray:
+        matches = np.nonzero(self.status_values == status)[0]
+        if not len(matches):
+            return np.zeros(self.size, dtype=bool)
+        return self.status_codes == matches[0]
+
+    def statistics(self, days: Optional[int] = None, today: Optional[date] = None) -> Dict[str, Any]:
+        """
+        สถิติของการจองที่ทำภายใน days วันล่าสุด (None หรือ <= 0 = ทั้งหมด)
+
+        กรองตามวันที่จอง (วันที่จอง) ไม่ใช่วันที่มาใช้บริการ การจองล่วงหน้าจึงถูกนับด้วย
+        """
+        today = today or datetime.now().date()
+
+        if days and days > 0:
+            start = today - timedelta(days=days - 1)
+            window = (self.booked_ordinals >= start.toordinal()) & (self.booked_ordinals <= today.toordinal())
+        else:
+            start = None
+            window = np.ones(self.size, dtype=bool)
+
+        confirmed = self._status_mask(STATUS_CONFIRMED) & window
+        cancelled = self._status_mask(STATUS_CANCELLED) & window
+        completed = self._status_mask(STATUS_COMPLETED) & window
+
+        total_count = int(window.sum())
+        confirmed_count = int(confirmed.sum())
+        cancelled_count = int(cancelled.sum())
+        completed_count = int(completed.sum())
+
+        # สถิติตามวัน (group by date code)
+        n_dates = len(self.date_values)
+        date_totals = np.bincount(self.date_codes[window], minlength=n_dates)
+        date_confirmed = np.bincount(self.date_codes[confirmed], minlength=n_dates)
+        date_cancelled = np.bincount(self.date_codes[cancelled], minlength=n_dates)
+
+        date_stats = {}
+        for code in np.argsort(self.date_value_ordinals, kind='stable'):
+            if date_totals[code] and self.date_values[code]:
+                date_stats[self.date_values[code]] = {
+                    'total': int(date_totals[code]),
+                    'confirmed': int(date_confirmed[code]),
+                    'cancelled': int(date_cancelled[code])
+                }
+
+        # สถิติตามเวลา (เฉพาะที่ยืนยันแล้ว)
+        time_counts = np.bincount(self.time_codes[confirmed], minlength=len(self.time_values))
+        popular_times = {}
+        for code in np.argsort(-time_counts, kind='stable')[:5]:
+            if time_counts[code] and self.time_values[code]:
+                popular_times[self.time_values[code]] = int(time_counts[code])
+
+        return {
+            'days': days,
+            'from_date': start.strftime('%d-%m-') + str(start.year + 543) if start else None,
+            'to_date': today.strftime('%d-%m-') + str(today.year + 543) if start else None,
+            'total_reservations': total_count,
+            'confirmed_reservations': confirmed_count,
+            'cancelled_reservations': cancelled_count,
+            'completed_reservations': completed_count,
+            'cancellation_rate': round((cancelled_count / total_count * 100) if total_count > 0 else 0, 2),
+            'date_statistics': date_stats,
+            'popular_times': popular_times
+        }
+
+_snapshot_lock = threading.Lock()
+_snapshot: Optional[ReservationSnapshot] = None
+
+def get_reservation_snapshot() -> ReservationSnapshot:
+    """ดึง snapshot ล่าสุด (สร้างใหม่เฉพาะเมื่อข้อมูลใน store เปลี่ยน)"""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != reservation_store.version:
+            version, columns = reservation_store.columns([COLUMN_STATUS, COLUMN_DATE, COLUMN_TIME, COLUMN_BOOKED_AT])
+            _snapshot = ReservationSnapshot(version, columns)
+            logger.debug(f"Built reservation snapshot v{version} ({_snapshot.size} rows)")
+        return _snapshot
@@ -0,0 +1,281 @@
+import logging
+import threading
+import time
+from typing import Dict, Any, Optional, List, Set, Tuple, Callable
+
+from config import RESERVATION_STORE_TTL_SECONDS
+from utils import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# worksheet ที่เก็บการจอง
+RESERVATION_SHEET_NAME = "การจอง"
+
+# ชื่อคอลัมน์ที่ใช้ทำ index (ต้องตรงกับ HEADERS ใน google_sheets.py)
+COLUMN_BOOKING_ID = 'ID การจอง'
+COLUMN_BOOKED_AT = 'วันที่จอง'
+COLUMN_PHONE = 'เบอร์โทร'
+COLUMN_DATE = 'วันที่'
+COLUMN_TIME = 'เวลา'
+COLUMN_STATUS = 'สถานะ'
+COLUMN_PARTY_SIZE = 'จำนวนคน'
+
+# แถวแรกของข้อมูล (แถวที่ 1 เป็น header)
+FIRST_DATA_ROW = 2
+
+class ReservationStore:
+    """
+    เก็บข้อมูลการจองไว้ใน memory พร้อม hash index
+
+    โหลดข้อมูลจาก sheet ครั้งเดียว แล้วให้ฝั่งที่เขียนข้อมูล (add / cancel / update)
+    อัพเดท store ตามไปด้วย การค้นหาจึงไม่ต้องดึงข้อมูลทั้ง sheet ทุกครั้ง
+    แต่ละ record อ้างอิงด้วยเลขแถวใน sheet (row_number)
+    """
+
+    def __init__(self, ttl_seconds: int = RESERVATION_STORE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+        # ข้อมูลอาจไม่ตรงกับ sheet (เลขแถวเลื่อน / worksheet ถูกสร้างใหม่) ต้องโหลดใหม่เมื่อทำได้
+        self._stale = False
+        self._records: Dict[int, Dict[str, Any]] = {}
+        self._by_booking_id: Dict[str, int] = {}
+        self._by_phone: Dict[str, Set[int]] = {}
+        self._by_date: Dict[str, Set[int]] = {}
+        self._by_slot: Dict[Tuple[str, str], Set[int]] = {}
+        self._last_row = FIRST_DATA_ROW - 1
+        self._version = 0
+        self._listeners: List[Any] = []
+
+    def add_listener(self, listener):
+        """
+        ลงทะเบียน listener ที่ต้องการรู้ทุกการเปลี่ยนแปลงของ record
+        (ต้องมี on_insert(record), on_remove(record) และ on_clear() ถูกเรียกภายใต้ lock ของ store
+        ถ้ามี on_loaded() จะถูกเรียกหลังโหลดข้อมูลทั้ง sheet เสร็จ)
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            for record in self._records.values():
+                listener.on_insert(record)
+
+    # === Loading ===
+    def is_loaded(self) -> bool:
+        """ตรวจสอบว่าโหลดข้อมูลแล้วหรือยัง (ข้อมูลที่รอโหลดใหม่ยังนับว่าโหลดแล้ว)"""
+        return self._loaded_at is not None
+
+    def is_stale(self) -> bool:
+        """ตรวจสอบว่าข้อมูลถูกสั่งให้โหลดใหม่แต่ยังโหลดไม่สำเร็จหรือไม่"""
+        return self._stale
+
+    @property
+    def version(self) -> int:
+        """เลขที่เพิ่มขึ้นทุกครั้งที่ข้อมูลเปลี่ยน (ใช้ตรวจว่า snapshot ที่สร้างไว้ยังใช้ได้หรือไม่)"""
+        return self._version
+
+    def needs_reload(self) -> bool:
+        """ตรวจสอบว่าต้องโหลดข้อมูลจาก sheet ใหม่หรือไม่"""
+        if self._loaded_at is None or self._stale:
+            return True
+        if self.ttl_seconds <= 0:
+            return False
+        return time.monotonic() - self._loaded_at > self.ttl_seconds
+
+    def ensure_loaded(
+        self,
+        loader: Callable[[], Optional[List[Dict[str, Any]]]],
+        pending: Optional[Callable[[], List[Dict[str, Any]]]] = None
+    ) -> bool:
+        """
+        โหลดข้อมูลผ่าน loader ถ้ายังไม่เคยโหลดหรือข้อมูลหมดอายุ
+
+        pending คืนค่าการจองที่ยังไม่ได้เขียนลง sheet (ถูกเรียกภายใต้ lock หลัง loader)
+        เพื่อไม่ให้การจองที่เพิ่มเข้ามาระหว่างโหลดหายไปจาก store
+        """
+        if not self.needs_reload():
+            return True
+
+        with self._lock:
+            # อาจมี thread อื่นโหลดไปแล้วระหว่างรอ lock
+            if not self.needs_reload():
+                return True
+
+            records = loader()
+            if records is None:
+                return self.is_loaded()
+
+            self.load(records, pending() if pending else ())
+            return True
+
+    def load(self, records: List[Dict[str, Any]], pending: List[Dict[str, Any]] = ()):
+        """แทนที่ข้อมูลทั้งหมดด้วยผลลัพธ์จาก get_all_records() (ตามด้วยการจองที่ยังไม่อยู่ใน sheet)"""
+        with self._lock:
+            self._clear_indexes()
+
+            for i, record in enumerate(records):
+                self._insert(i + FIRST_DATA_ROW, dict(record))
+            self._last_row = len(records) + FIRST_DATA_ROW - 1
+
+            # การจองที่ค้างอยู่ต่อท้ายตามลำดับที่จะถูก append (ข้ามรายการที่เขียนลง sheet ทันแล้ว)
+            for record in pending:
+                if str(record.get(COLUMN_BOOKING_ID)) not in self._by_booking_id:
+                    self._last_row += 1
+                    self._insert(self._last_row, dict(record))
+
+            self._loaded_at = time.monotonic()
+            self._stale = False
+            self._version += 1
+
+            for listener in self._listeners:
+                on_loaded = getattr(listener, 'on_loaded', None)
+                if on_loaded:
+                    on_loaded()
+
+        logger.info(f"Loaded {len(records)} reservations into reservation store")
+
+    def invalidate(self):
+        """
+        บังคับให้โหลดข้อมูลใหม่ในการเรียกครั้งถัดไป
+
+        ข้อมูลเดิมยังอยู่ ถ้าโหลดใหม่ไม่ได้ (เช่น sheet ล่ม) การจอง / ค้นหา / ยกเลิก
+        ยังใช้ข้อมูลเดิมได้จนกว่าจะโหลดสำเร็จ
+        """
+        with self._lock:
+            self._stale = True
+
+    # === Write paths ===
+    def add(self, record: Dict[str, Any], row_number: Optional[int] = None):
+        """เพิ่ม record ใหม่ (row_number = แถวที่ append ลง sheet)"""
+        with self._lock:
+            if not self.is_loaded():
+                return
+
+            # ถูกโหลดเข้ามาพร้อมรายการที่ค้างใน buffer แล้ว
+            if str(record.get(COLUMN_BOOKING_ID)) in self._by_booking_id:
+                return
+
+            if row_number is None:
+                row_number = self._last_row + 1
+
+            self._insert(row_number, dict(record))
+            self._last_row = max(self._last_row, row_number)
+            self._version += 1
+
+    def update(self, row_number: int, changes: Dict[str, Any]) -> bool:
+        """อัพเดทค่าใน record และ index ที่เกี่ยวข้อง"""
+        with self._lock:
+            record = self._records.get(row_number)
+            if record is None:
+                return False
+
+            self._remove(row_number)
+            record.update(changes)
+            self._insert(row_number, record)
+            self._version += 1
+            return True
+
+    # === Lookups ===
+    def get_row_number(self, booking_id: str) -> Optional[int]:
+        """ดึงเลขแถวจาก booking ID"""
+        return self._by_booking_id.get(str(booking_id))
+
+    def get_by_booking_id(self, booking_id: str) -> Optional[Dict[str, Any]]:
+        """ค้นหาการจองจาก booking ID"""
+        with self._lock:
+            row_number = self._by_booking_id.get(str(booking_id))
+            if row_number is None:
+                return None
+            return dict(self._records[row_number])
+
+    def find_by_phone(self, phone: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """ค้นหาการจองจากเบอร์โทร คืนค่า (row_number, record)"""
+        return self._lookup(self._by_phone, normalize_phone(phone))
+
+    def find_by_date(self, date: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """ค้นหาการจองตามวันที่"""
+        return self._lookup(self._by_date, str(date))
+
+    def find_by_slot(self, date: str, time_str: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """ค้นหาการจองตามวันที่และเวลา"""
+        return self._lookup(self._by_slot, (str(date), str(time_str)))
+
+    def all_records(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """ดึงการจองทั้งหมดเรียงตามแถว"""
+        with self._lock:
+            return [(row, dict(self._records[row])) for row in sorted(self._records)]
+
+    def columns(self, names: List[str]) -> Tuple[int, Dict[str, List[Any]]]:
+        """ดึงค่าทีละคอลัมน์ของทุกแถว พร้อม version ที่ตรงกัน (ใช้สร้าง columnar snapshot)"""
+        with self._lock:
+            records = [self._records[row] for row in sorted(self._records)]
+            return self._version, {name: [record.get(name, '') for record in records] for name in names}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    # === Internal ===
+    def _lookup(self, index: Dict[Any, Set[int]], key: Any) -> List[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            rows = index.get(key)
+            if not rows:
+                return []
+            return [(row, dict(self._records[row])) for row in sorted(rows)]
+
+    def _clear_indexes(self):
+        self._records = {}
+        self._by_booking_id = {}
+        self._by_phone = {}
+        self._by_date = {}
+        self._by_slot = {}
+        self._last_row = FIRST_DATA_ROW - 1
+
+        for listener in self._listeners:
+            listener.on_clear()
+
+    def _insert(self, row_number: int, record: Dict[str, Any]):
+        if row_number in self._records:
+            self._remove(row_number)
+
+        self._records[row_number] = record
+
+        booking_id = record.get(COLUMN_BOOKING_ID)
+        if booking_id:
+            self._by_booking_id[str(booking_id)] = row_number
+
+        phone = normalize_phone(record.get(COLUMN_PHONE))
+        if phone:
+            self._by_phone.setdefault(phone, set()).add(row_number)
+
+        date = str(record.get(COLUMN_DATE, ''))
+        if date:
+            self._by_date.setdefault(date, set()).add(row_number)
+            slot = (date, str(record.get(COLUMN_TIME, '')))
+            self._by_slot.setdefault(slot, set()).add(row_number)
+
+        for listener in self._listeners:
+            listener.on_insert(record)
+
+    def _remove(self, row_number: int):
+        record = self._records.pop(row_number, None)
+        if record is None:
+            return
+
+        for listener in self._listeners:
+            listener.on_remove(record)
+
+        booking_id = record.get(COLUMN_BOOKING_ID)
+        if booking_id and self._by_booking_id.get(str(booking_id)) == row_number:
+            del self._by_booking_id[str(booking_id)]
+
+        phone = normalize_phone(record.get(COLUMN_PHONE))
+        date = str(record.get(COLUMN_DATE, ''))
+        slot = (date, str(record.get(COLUMN_TIME, '')))
+
+        for index, key in ((self._by_phone, phone), (self._by_date, date), (self._by_slot, slot)):
+            rows = index.get(key)
+            if rows is not None:
+                rows.discard(row_number)
+                if not rows:
+                    del index[key]
+
+# Store ที่ใช้ร่วมกันทั้ง process
+reservation_store = ReservationStore()
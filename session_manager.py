@@ -1,33 +1,44 @@
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
-import asyncio
-from threading import Timer
 
-logger = logging.getLogger(__name__)
+from session_store import session_store
+from timer_wheel import timer_wheel
 
-# In-memory storage สำหรับ sessions (ใน production ควรใช้ Redis)
-user_sessions: Dict[str, Dict[str, Any]] = {}
-timeout_tasks: Dict[str, Timer] = {}
+logger = logging.getLogger(__name__)
 
 # Session timeout (นาที)
 SESSION_TIMEOUT_MINUTES = 10
 WARNING_TIMEOUT_MINUTES = 8
 
-def start_reservation_session(user_id: str):
+# เก็บ session ใน store ต่อจากเวลาหมดอายุอีกเล็กน้อย ให้ timeout handler ยังอ่าน session ได้
+SESSION_STORE_GRACE_SECONDS = 60
+
+def _session_ttl_seconds() -> int:
+    return SESSION_TIMEOUT_MINUTES * 60 + SESSION_STORE_GRACE_SECONDS
+
+async def _save_session(user_id: str, session: Dict[str, Any]):
+    """บันทึก session ลง store (ต้องเรียกทุกครั้งหลังแก้ไข session)"""
+    await session_store.set(user_id, session, _session_ttl_seconds())
+
+def _new_session(session_type: str, step: str) -> Dict[str, Any]:
+    now = datetime.now()
+    return {
+        'type': session_type,
+        'step': step,
+        'data': {},
+        'created_at': now,
+        'updated_at': now,
+        'expires_at': now + timedelta(minutes=SESSION_TIMEOUT_MINUTES)
+    }
+
+async def start_reservation_session(user_id: str):
     """เริ่ม session สำหรับการจอง"""
     try:
         # ล้าง session เก่า (ถ้ามี)
-        clear_reservation_session(user_id)
-        
-        user_sessions[user_id] = {
-            'type': 'reservation',
-            'step': 'name',
-            'data': {},
-            'created_at': datetime.now(),
-            'updated_at': datetime.now(),
-            'expires_at': datetime.now() + timedelta(minutes=SESSION_TIMEOUT_MINUTES)
-        }
+        await clear_reservation_session(user_id)
+        
+        await _save_session(user_id, _new_session('reservation', 'name'))
         
         # เริ่ม timeout task
         start_timeout_task(user_id)
@@ -37,20 +48,13 @@ def start_reservation_session(user_id: str):
     except Exception as e:
         logger.error(f"Error starting reservation session for {user_id}: {e}")
 
-def start_cancellation_session(user_id: str):
+async def start_cancellation_session(user_id: str):
     """เริ่ม session สำหรับการยกเลิกการจอง"""
     try:
         # ล้าง session เก่า (ถ้ามี)
-        clear_reservation_session(user_id)
-        
-        user_sessions[user_id] = {
-            'type': 'cancellation',
-            'step': 'cancel_phone',
-            'data': {},
-            'created_at': datetime.now(),
-            'updated_at': datetime.now(),
-            'expires_at': datetime.now() + timedelta(minutes=SESSION_TIMEOUT_MINUTES)
-        }
+        await clear_reservation_session(user_id)
+        
+        await _save_session(user_id, _new_session('cancellation', 'cancel_phone'))
         
         # เริ่ม timeout task
         start_timeout_task(user_id)
@@ -60,10 +64,10 @@ def start_cancellation_session(user_id: str):
     except Exception as e:
         logger.error(f"Error starting cancellation session for {user_id}: {e}")
 
-def get_user_session(user_id: str) -> Optional[Dict[str, Any]]:
+async def get_user_session(user_id: str) -> Optional[Dict[str, Any]]:
     """ดึงข้อมูล session ของผู้ใช้"""
     try:
-        session = user_sessions.get(user_id)
+        session = await session_store.get(user_id)
         
         if not session:
             return None
@@ -71,7 +75,7 @@ def get_user_session(user_id: str) -> Optional[Dict[str, Any]]:
         # ตรวจสอบว่า session หมดอายุหรือไม่
         if datetime.now() > session.get('expires_at', datetime.now()):
             logger.info(f"Session expired for user {user_id}")
-            clear_reservation_session(user_id)
+            await clear_reservation_session(user_id)
             return None
         
         return session
@@ -80,10 +84,10 @@ def get_user_session(user_id: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Error getting session for {user_id}: {e}")
         return None
 
-def update_user_session(user_id: str, step: str = None, data: Dict[str, Any] = None):
+async def update_user_session(user_id: str, step: str = None, data: Dict[str, Any] = None):
     """อัพเดท session ของผู้ใช้"""
     try:
-        session = get_user_session(user_id)
+        session = await get_user_session(user_id)
         if not session:
             logger.warning(f"No session found for user {user_id} to update")
             return False
@@ -99,6 +103,7 @@ def update_user_session(user_id: str, step: str = None, data: Dict[str, Any] = N
         # อัพเดทเวลา
         session['updated_at'] = datetime.now()
         session['expires_at'] = datetime.now() + timedelta(minutes=SESSION_TIMEOUT_MINUTES)
+        await _save_session(user_id, session)
         
         # รีเซ็ต timeout task
         reset_timeout_task(user_id)
@@ -110,24 +115,24 @@ def update_user_session(user_id: str, step: str = None, data: Dict[str, Any] = N
         logger.error(f"Error updating session for {user_id}: {e}")
         return False
 
-def update_last_activity(user_id: str):
+async def update_last_activity(user_id: str):
     """อัพเดทเวลาการใช้งานล่าสุด"""
     try:
-        session = get_user_session(user_id)
+        session = await get_user_session(user_id)
         if session:
             session['updated_at'] = datetime.now()
             session['expires_at'] = datetime.now() + timedelta(minutes=SESSION_TIMEOUT_MINUTES)
+            await _save_session(user_id, session)
             reset_timeout_task(user_id)
             
     except Exception as e:
         logger.error(f"Error updating last activity for {user_id}: {e}")
 
-def clear_reservation_session(user_id: str):
+async def clear_reservation_session(user_id: str):
     """ล้าง session ของผู้ใช้"""
     try:
         # ล้าง session data
-        if user_id in user_sessions:
-            del user_sessions[user_id]
+        if await session_store.delete(user_id):
             logger.info(f"Cleared session for user {user_id}")
         
         # ยกเลิก timeout task
@@ -136,13 +141,13 @@ def clear_reservation_session(user_id: str):
     except Exception as e:
         logger.error(f"Error clearing session for {user_id}: {e}")
 
-def get_all_active_sessions() -> List[Dict[str, Any]]:
+async def get_all_active_sessions() -> List[Dict[str, Any]]:
     """ดึง session ทั้งหมดที่ active"""
     try:
         active_sessions = []
         current_time = datetime.now()
         
-        for user_id, session in user_sessions.items():
+        async for user_id, session in session_store.items():
             if current_time <= session.get('expires_at', current_time):
                 session_info = session.copy()
                 session_info['user_id'] = user_id
@@ -154,18 +159,26 @@ def get_all_active_sessions() -> List[Dict[str, Any]]:
         logger.error(f"Error getting all active sessions: {e}")
         return []
 
-def cleanup_expired_sessions():
+async def count_active_sessions() -> int:
+    """จำนวน session ใน store (นับจาก backend โดยไม่โหลดข้อมูล session รวมช่วง grace หลังหมดเวลา)"""
+    try:
+        return await session_store.count()
+    except Exception as e:
+        logger.error(f"Error counting active sessions: {e}")
+        return 0
+
+async def cleanup_expired_sessions():
     """ล้าง session ที่หมดอายุ"""
     try:
         current_time = datetime.now()
         expired_users = []
         
-        for user_id, session in user_sessions.items():
+        async for user_id, session in session_store.items():
             if current_time > session.get('expires_at', current_time):
                 expired_users.append(user_id)
         
         for user_id in expired_users:
-            clear_reservation_session(user_id)
+            await clear_reservation_session(user_id)
             logger.info(f"Cleaned up expired session for user {user_id}")
         
         return len(expired_users)
@@ -174,33 +187,20 @@ def cleanup_expired_sessions():
         logger.error(f"Error cleaning up expired sessions: {e}")
         return 0
 
-# Timeout Management
+# Timeout Management (ใช้ timer wheel บน event loop แทน threading.Timer)
+def _warning_key(user_id: str):
+    return (user_id, 'warning')
+
+def _timeout_key(user_id: str):
+    return (user_id, 'timeout')
+
 def start_timeout_task(user_id: str):
     """เริ่ม timeout task สำหรับผู้ใช้"""
     try:
-        # ยกเลิก task เก่า (ถ้ามี)
-        cancel_timeout_task(user_id)
-        
-        # สร้าง warning task (เตือนก่อนหมดเวลา)
-        warning_timer = Timer(
-            WARNING_TIMEOUT_MINUTES * 60,
-            _send_timeout_warning,
-            args=[user_id]
-        )
-        warning_timer.start()
-        
-        # สร้าง timeout task (ล้าง session เมื่อหมดเวลา)
-        timeout_timer = Timer(
-            SESSION_TIMEOUT_MINUTES * 60,
-            _handle_session_timeout,
-            args=[user_id]
-        )
-        timeout_timer.start()
-        
-        timeout_tasks[user_id] = {
-            'warning': warning_timer,
-            'timeout': timeout_timer
-        }
+        # ตั้ง timer เตือนก่อนหมดเวลา และ timer ล้าง session เมื่อหมดเวลา
+        # (key เดิมจะถูกแทนที่ จึงไม่ต้องยกเลิกของเก่าก่อน)
+        timer_wheel.schedule(_warning_key(user_id), WARNING_TIMEOUT_MINUTES * 60, _send_timeout_warning, user_id)
+        timer_wheel.schedule(_timeout_key(user_id), SESSION_TIMEOUT_MINUTES * 60, _handle_session_timeout, user_id)
         
         logger.debug(f"Started timeout tasks for user {user_id}")
         
@@ -210,10 +210,6 @@ def start_timeout_task(user_id: str):
 def reset_timeout_task(user_id: str):
     """รีเซ็ต timeout task (เมื่อมีการตอบสนองจากผู้ใช้)"""
     try:
-        # ยกเลิก task เก่า
-        cancel_timeout_task(user_id)
-        
-        # เริ่ม task ใหม่
         start_timeout_task(user_id)
         
         logger.debug(f"Reset timeout tasks for user {user_id}")
@@ -224,58 +220,55 @@ def reset_timeout_task(user_id: str):
 def cancel_timeout_task(user_id: str):
     """ยกเลิก timeout task"""
     try:
-        if user_id in timeout_tasks:
-            tasks = timeout_tasks[user_id]
-            
-            if 'warning' in tasks and tasks['warning'].is_alive():
-                tasks['warning'].cancel()
-            
-            if 'timeout' in tasks and tasks['timeout'].is_alive():
-                tasks['timeout'].cancel()
-            
-            del timeout_tasks[user_id]
+        warning_cancelled = timer_wheel.cancel(_warning_key(user_id))
+        timeout_cancelled = timer_wheel.cancel(_timeout_key(user_id))
+        
+        if warning_cancelled or timeout_cancelled:
             logger.debug(f"Cancelled timeout tasks for user {user_id}")
         
     except Exception as e:
         logger.error(f"Error cancelling timeout task for {user_id}: {e}")
 
-def _send_timeout_warning(user_id: str):
+async def _send_timeout_warning(user_id: str):
     """ส่งข้อความเตือนก่อนหมดเวลา (internal function)"""
     try:
-        session = get_user_session(user_id)
-        if session:
+        session = await get_user_session(user_id)
+        # session อาจถูกต่ออายุจาก worker อื่น (timer อยู่ใน process นี้แต่ session อยู่ใน store กลาง)
+        warn_at = session['updated_at'] + timedelta(minutes=WARNING_TIMEOUT_MINUTES) if session else None
+        if session and datetime.now() >= warn_at - timedelta(seconds=5):
             from booking_logic import handle_booking_timeout
-            asyncio.create_task(handle_booking_timeout(user_id))
+            await handle_booking_timeout(user_id)
             logger.info(f"Sent timeout warning to user {user_id}")
         
     except Exception as e:
         logger.error(f"Error sending timeout warning to {user_id}: {e}")
 
-def _handle_session_timeout(user_id: str):
+async def _handle_session_timeout(user_id: str):
     """จัดการเมื่อ session หมดเวลา (internal function)"""
     try:
-        session = get_user_session(user_id)
-        if session:
+        # อ่านจาก store โดยตรง (get_user_session จะล้าง session ที่หมดอายุทิ้งก่อน)
+        session = await session_store.get(user_id)
+        if session and datetime.now() >= session['expires_at'] - timedelta(seconds=5):
             from config import log_booking_event
-            from utils import get_line_display_name
+            from profile_cache import get_cached_display_name
             
             log_booking_event(
                 event_type="SESSION_TIMEOUT",
                 user_id=user_id,
-                user_name=get_line_display_name(user_id)
+                user_name=await get_cached_display_name(user_id)
             )
             
-            clear_reservation_session(user_id)
+            await clear_reservation_session(user_id)
             logger.info(f"Session timeout handled for user {user_id}")
         
     except Exception as e:
         logger.error(f"Error handling session timeout for {user_id}: {e}")
 
 # Statistics และ Monitoring
-def get_session_statistics() -> Dict[str, Any]:
+async def get_session_statistics() -> Dict[str, Any]:
     """ดึงสถิติการใช้งาน session"""
     try:
-        active_sessions = get_all_active_sessions()
+        active_sessions = await get_all_active_sessions()
         
         reservation_count = len([s for s in active_sessions if s.get('type') == 'reservation'])
         cancellation_count = len([s for s in active_sessions if s.get('type') == 'cancellation'])
@@ -290,24 +283,24 @@ def get_session_statistics() -> Dict[str, Any]:
             'reservation_sessions': reservation_count,
             'cancellation_sessions': cancellation_count,
             'step_distribution': step_distribution,
-            'timeout_tasks_count': len(timeout_tasks)
+            'timeout_tasks_count': len(timer_wheel)
         }
         
     except Exception as e:
         logger.error(f"Error getting session statistics: {e}")
         return {}
 
-def is_session_healthy() -> bool:
+async def is_session_healthy() -> bool:
     """ตรวจสอบสถานะความปกติของ session system"""
     try:
         # ตรวจสอบจำนวน session ที่มากเกินไป
-        active_count = len(get_all_active_sessions())
+        active_count = await count_active_sessions()
         if active_count > 100:  # threshold
             logger.warning(f"Too many active sessions: {active_count}")
             return False
         
         # ตรวจสอบ memory usage
-        timeout_count = len(timeout_tasks)
+        timeout_count = len(timer_wheel)
         if timeout_count > active_count * 2:  # แต่ละ session ควรมี timeout task 2 ตัว
             logger.warning(f"Timeout tasks mismatch: {timeout_count} tasks for {active_count} sessions")
             return False
@@ -0,0 +1,257 @@
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional, AsyncIterator, List, Tuple
+
+from config import (
+    SESSION_STORE,
+    SESSION_REDIS_URL,
+    SESSION_REDIS_PREFIX,
+    SESSION_SQLITE_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+# ฟิลด์เวลาใน session (เก็บเป็น epoch seconds เพื่อให้ serialize ได้สั้น)
+DATETIME_FIELDS = ('created_at', 'updated_at', 'expires_at')
+
+def serialize_session(session: Dict[str, Any]) -> str:
+    """แปลง session เป็น JSON แบบกระชับ"""
+    payload = dict(session)
+    for field in DATETIME_FIELDS:
+        value = payload.get(field)
+        if isinstance(value, datetime):
+            payload[field] = round(value.timestamp(), 3)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+def deserialize_session(raw) -> Dict[str, Any]:
+    """แปลง JSON กลับเป็น session"""
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8')
+    session = json.loads(raw)
+    for field in DATETIME_FIELDS:
+        value = session.get(field)
+        if isinstance(value, (int, float)):
+            session[field] = datetime.fromtimestamp(value)
+    return session
+
+class SessionStore(abc.ABC):
+    """
+    Interface ของที่เก็บ session (ทุก method เป็น async ไม่บล็อก event loop)
+
+    ทุก backend เก็บ session พร้อม TTL (หมดอายุเองโดยไม่ต้องมีงานล้าง)
+    ค่าที่ get() คืนมาเป็นสำเนา ต้องเรียก set() ทุกครั้งที่แก้ไข
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """ดึง session (None ถ้าไม่มีหรือหมดอายุแล้ว)"""
+
+    @abc.abstractmethod
+    async def set(self, user_id: str, session: Dict[str, Any], ttl_seconds: int):
+        """บันทึก session พร้อมอายุ"""
+
+    @abc.abstractmethod
+    async def delete(self, user_id: str) -> bool:
+        """ลบ session (คืนค่า True ถ้ามี session อยู่)"""
+
+    @abc.abstractmethod
+    def items(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """session ทั้งหมดที่ยังไม่หมดอายุ (async iterator ของ (user_id, session))"""
+
+    @abc.abstractmethod
+    async def count(self) -> int:
+        """จำนวน session ที่ยังไม่หมดอายุ (ไม่ต้องอ่านข้อมูล session)"""
+
+class MemorySessionStore(SessionStore):
+    """เก็บ session ใน memory ของ process (ใช้ได้เฉพาะกรณีรัน worker เดียว)"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Tuple[str, float]] = {}
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            raw, expires_at = entry
+            if time.time() >= expires_at:
+                del self._sessions[user_id]
+                return None
+        return deserialize_session(raw)
+
+    async def set(self, user_id: str, session: Dict[str, Any], ttl_seconds: int):
+        raw = serialize_session(session)
+        with self._lock:
+            self._sessions[user_id] = (raw, time.time() + ttl_seconds)
+
+    async def delete(self, user_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(user_id, None) is not None
+
+    async def items(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        now = time.time()
+        with self._lock:
+            entries = [(user_id, raw) for user_id, (raw, expires_at) in self._sessions.items() if now < expires_at]
+        for user_id, raw in entries:
+            yield user_id, deserialize_session(raw)
+
+    async def count(self) -> int:
+        now = time.time()
+        with self._lock:
+            return sum(1 for _, expires_at in self._sessions.values() if now < expires_at)
+
+class RedisSessionStore(SessionStore):
+    """
+    เก็บ session ใน Redis (ใช้ร่วมกันได้ทุก worker / ทุกเครื่อง)
+
+    ใช้ redis.asyncio บน event loop โดยตรง และ SET ... EX ให้ Redis ลบ session ที่หมดอายุเอง
+    รับ client ที่สร้างไว้แล้วได้ (เช่น fakeredis.FakeAsyncRedis สำหรับทดสอบ)
+    """
+
+    name = "redis"
+
+    # จำนวน key ต่อรอบของ SCAN / MGET
+    BATCH_SIZE = 500
+
+    def __init__(self, client=None, url: str = SESSION_REDIS_URL, prefix: str = SESSION_REDIS_PREFIX):
+        if client is None:
+            import redis.asyncio
+            client = redis.asyncio.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.prefix}{user_id}"
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.client.get(self._key(user_id))
+        if raw is None:
+            return None
+        return deserialize_session(raw)
+
+    async def set(self, user_id: str, session: Dict[str, Any], ttl_seconds: int):
+        await self.client.set(self._key(user_id), serialize_session(session), ex=max(1, int(ttl_seconds)))
+
+    async def delete(self, user_id: str) -> bool:
+        return bool(await self.client.delete(self._key(user_id)))
+
+    async def _scan_keys(self) -> AsyncIterator[List[Any]]:
+        batch = []
+        async for key in self.client.scan_iter(match=f"{self.prefix}*", count=self.BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= self.BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def items(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        async for keys in self._scan_keys():
+            for key, raw in zip(keys, await self.client.mget(keys)):
+                if raw is None:
+                    continue
+                if isinstance(key, bytes):
+                    key = key.decode('utf-8')
+                yield key[len(self.prefix):], deserialize_session(raw)
+
+    async def count(self) -> int:
+        total = 0
+        async for keys in self._scan_keys():
+            total += len(keys)
+        return total
+
+class SQLiteSessionStore(SessionStore):
+    """
+    เก็บ session ในไฟล์ SQLite (ใช้ร่วมกันได้ทุก worker บนเครื่องเดียวกัน)
+
+    เปิด WAL mode เพื่อให้หลาย process อ่าน/เขียนพร้อมกันได้
+    query รันใน thread แยก (asyncio.to_thread) เพราะอาจรอ lock ของ worker อื่นได้ถึง 5 วินาที
+    แถวที่หมดอายุจะถูกกรองออกตอนอ่าน และลบทิ้งตอน items()
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _execute(self, sql: str, params: Tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._query, "SELECT data FROM sessions WHERE user_id = ? AND expires_at > ?", (user_id, time.time())
+        )
+        if not rows:
+            return None
+        return deserialize_session(rows[0][0])
+
+    async def set(self, user_id: str, session: Dict[str, Any], ttl_seconds: int):
+        raw = serialize_session(session)
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO sessions (user_id, data, expires_at) VALUES (?, ?, ?)",
+            (user_id, raw, time.time() + ttl_seconds)
+        )
+
+    async def delete(self, user_id: str) -> bool:
+        cursor = await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+    def _purge_and_list(self) -> List[Tuple]:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+            return self._conn.execute("SELECT user_id, data FROM sessions").fetchall()
+
+    async def items(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        for user_id, raw in await asyncio.to_thread(self._purge_and_list):
+            yield user_id, deserialize_session(raw)
+
+    async def count(self) -> int:
+        rows = await asyncio.to_thread(
+            self._query, "SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)
+        )
+        return rows[0][0]
+
+def create_session_store(backend: str = SESSION_STORE) -> SessionStore:
+    """สร้าง session store ตามที่ตั้งค่าไว้ (ถ้าสร้างไม่ได้จะใช้ memory แทน)"""
+    try:
+        if backend == "redis":
+            return RedisSessionStore()
+        if backend == "sqlite":
+            return SQLiteSessionStore()
+        if backend != "memory":
+            logger.warning(f"Unknown SESSION_STORE '{backend}', using memory")
+    except Exception as e:
+        logger.error(f"Error creating {backend} session store, falling back to memory: {e}")
+    return MemorySessionStore()
+
+# Session store ที่ใช้ร่วมกันทั้ง process
+session_store = create_session_store()
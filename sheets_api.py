@@ -0,0 +1,243 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import gspread
+import requests
+
+from config import (
+    SHEETS_RATE_LIMIT_PER_MINUTE,
+    SHEETS_RATE_LIMIT_BURST,
+    SHEETS_MAX_RETRIES,
+    SHEETS_BACKOFF_BASE_SECONDS,
+    SHEETS_BACKOFF_MAX_SECONDS,
+    SHEETS_CIRCUIT_FAILURE_THRESHOLD,
+    SHEETS_CIRCUIT_RESET_SECONDS
+)
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# HTTP status ที่เป็นปัญหาชั่วคราว (โควต้าเต็ม / server ขัดข้อง)
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """Google Sheets ขัดข้องต่อเนื่อง ไม่เรียก API จนกว่าจะครบเวลาพัก"""
+
+def _error_status(error: Exception) -> Optional[int]:
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def _is_idempotent(method: str, endpoint: str) -> bool:
+    """request ที่เรียกซ้ำได้โดยไม่เกิดข้อมูลซ้ำ (อ่าน / เขียนทับ cell)"""
+    return method.lower() in ('get', 'put') or endpoint.endswith('values:batchUpdate')
+
+class TokenBucket:
+    """Rate limiter แบบ token bucket (ผู้เรียกที่เกินโควต้าจะรอตามลำดับ)"""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = max(rate_per_minute, 1) / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """ใช้ 1 token (คืนค่าเวลาที่ต้องรอเป็นวินาที)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # จอง token ล่วงหน้า (ติดลบได้) ผู้เรียกถัดไปจึงรอต่อคิวกัน
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+class SheetsApiGuard:
+    """
+    ตัวกลางสำหรับทุก request ที่ส่งไป Google Sheets API
+
+    - จำกัดอัตราการเรียกตามโควต้าต่อนาที (token bucket)
+    - error ชั่วคราว (429 / 5xx / network) ลองใหม่แบบ exponential backoff + jitter
+    - ล้มเหลวต่อเนื่องครบจำนวน = เปิด circuit และ fail ทันทีจนครบเวลาพัก
+      แล้วจึงให้ request ทดลองผ่านไป 1 ครั้ง
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float = SHEETS_RATE_LIMIT_PER_MINUTE,
+        burst: int = SHEETS_RATE_LIMIT_BURST,
+        max_retries: int = SHEETS_MAX_RETRIES,
+        backoff_base: float = SHEETS_BACKOFF_BASE_SECONDS,
+        backoff_max: float = SHEETS_BACKOFF_MAX_SECONDS,
+        failure_threshold: int = SHEETS_CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = SHEETS_CIRCUIT_RESET_SECONDS
+    ):
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._stats = {
+            'requests': 0,
+            'failures': 0,
+            'retries': 0,
+            'quota_errors': 0,
+            'throttled': 0,
+            'throttle_wait_seconds': 0.0,
+            'circuit_opened': 0,
+            'rejected': 0
+        }
+
+    def call(self, method: str, endpoint: str, send):
+        """ส่ง request ผ่าน rate limiter / retry / circuit breaker"""
+        attempt = 0
+        while True:
+            self._before_request()
+
+            waited = self.bucket.acquire()
+            if waited:
+                self._count('throttled')
+                self._count('throttle_wait_seconds', waited)
+
+            self._count('requests')
+            try:
+                response = send()
+            except Exception as e:
+                status = _error_status(e)
+                if status == 429:
+                    self._count('quota_errors')
+
+                transient = self._is_transient(e, status)
+                # request ที่ไม่ idempotent (เช่น append) ลองใหม่เฉพาะ 429 ที่ server ไม่ได้ทำงานแน่นอน
+                retryable = transient and (status == 429 or _is_idempotent(method, endpoint))
+                if retryable and attempt < self.max_retries:
+                    attempt += 1
+                    delay = self._backoff_delay(attempt, e)
+                    self._count('retries')
+                    logger.warning(
+                        f"Sheets API {method.upper()} failed ({status or type(e).__name__}), "
+                        f"retry {attempt}/{self.max_retries} in {delay:.2f}s"
+                    )
+                    self._release_trial()
+                    time.sleep(delay)
+                    continue
+
+                self._record_failure(transient)
+                raise
+
+            self._record_success()
+            return response
+
+    def _is_transient(self, error: Exception, status: Optional[int]) -> bool:
+        """error ชั่วคราวจากฝั่ง Sheets / network (ไม่ใช่ error จากข้อมูลหรือสิทธิ์)"""
+        if status in RETRYABLE_STATUSES:
+            return True
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """เวลารอก่อนลองใหม่ (full jitter หรือตาม Retry-After ที่ server กำหนด)"""
+        response = getattr(error, 'response', None)
+        retry_after = getattr(response, 'headers', {}).get('Retry-After') if response is not None else None
+        try:
+            if retry_after:
+                return min(float(retry_after), self.backoff_max)
+        except ValueError:
+            pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    # === Circuit breaker ===
+    def _before_request(self):
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return
+
+            if self._state == CIRCUIT_OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError("Google Sheets circuit is open")
+                self._state = CIRCUIT_HALF_OPEN
+                logger.info("Sheets API circuit half-open, sending trial request")
+
+            # half-open: ให้ผ่านทีละ request
+            if self._trial_in_flight:
+                self._stats['rejected'] += 1
+                raise CircuitOpenError("Google Sheets circuit is half-open")
+            self._trial_in_flight = True
+
+    def _release_trial(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _record_success(self):
+        with self._lock:
+            if self._state != CIRCUIT_CLOSED:
+                logger.info("Sheets API circuit closed")
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def _record_failure(self, transient: bool):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._trial_in_flight = False
+            # error จากข้อมูล / สิทธิ์ (4xx) ไม่ได้แปลว่า Sheets ขัดข้อง
+            if not transient:
+                if self._state == CIRCUIT_HALF_OPEN:
+                    self._state = CIRCUIT_CLOSED
+                    self._failures = 0
+                return
+
+            self._failures += 1
+            if self._state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != CIRCUIT_OPEN:
+                    self._stats['circuit_opened'] += 1
+                    logger.error(f"Sheets API circuit opened after {self._failures} failures")
+                self._state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+
+    def is_open(self) -> bool:
+        """circuit เปิดอยู่ (ยังไม่ครบเวลาพัก)"""
+        with self._lock:
+            return (self._state == CIRCUIT_OPEN and
+                    time.monotonic() - self._opened_at < self.reset_seconds)
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """สถิติการเรียก Sheets API"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['throttle_wait_seconds'] = round(stats['throttle_wait_seconds'], 2)
+            stats['circuit_state'] = self._state
+            stats['consecutive_failures'] = self._failures
+            return stats
+
+# ตัวกลางที่ใช้ร่วมกันทั้ง process (โควต้าเป็นของ service account เดียวกัน)
+sheets_api = SheetsApiGuard()
+
+class GuardedClient(gspread.Client):
+    """gspread client ที่ส่งทุก request ผ่าน sheets_api"""
+
+    def request(self, method, endpoint, *args, **kwargs):
+        send = lambda: super(GuardedClient, self).request(method, endpoint, *args, **kwargs)
+        # span รวมเวลารอ rate limit และการ retry (เห็นว่า request ช้าเพราะ API ครั้งไหน)
+        with span("sheets_api", method=method, endpoint=endpoint):
+            return sheets_api.call(method, endpoint, send)
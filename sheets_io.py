@@ -0,0 +1,135 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple, Optional, Callable
+
+import google_sheets
+from config import SHEETS_IO_POOL_SIZE
+from models import ReservationData
+
+logger = logging.getLogger(__name__)
+
+class SheetsIOExecutor:
+    """
+    รันงาน Google Sheets (blocking) บน thread pool ที่จำกัดขนาด
+
+    event loop จึงรับ webhook ต่อได้ระหว่างรอ Sheets API
+    เก็บสถิติจำนวนงานที่รอคิว / กำลังทำ / เวลารอคิว เพื่อดูว่า pool เล็กเกินไปหรือไม่
+    """
+
+    def __init__(self, max_workers: int = SHEETS_IO_POOL_SIZE):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sheets-io")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._max_queue_depth = 0
+        self._total_wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def _job(self, func: Callable, args: Tuple, kwargs: Dict[str, Any]) -> Callable[[], Any]:
+        """ครอบ func ให้นับสถิติคิว / เวลารอ (เรียกตอนส่งงานเข้า pool)"""
+        submitted_at = time.monotonic()
+
+        with self._lock:
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+
+        def job():
+            wait_seconds = time.monotonic() - submitted_at
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._total_wait_seconds += wait_seconds
+                self._max_wait_seconds = max(self._max_wait_seconds, wait_seconds)
+
+            failed = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    if failed:
+                        self._failed += 1
+
+        # executor ไม่ส่ง contextvars ไปด้วย (trace span ของ request ต้องตามไปใน thread)
+        context = contextvars.copy_context()
+        return functools.partial(context.run, job)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """รัน func บน thread pool แล้วรอผลลัพธ์แบบ non-blocking"""
+        # ผ่าน submit: request ที่ถูกยกเลิกก่อนงานเริ่มจะเอางานออกจากคิวด้วย
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """ส่ง func เข้า pool คืนค่า Future (ห้ามรอผลจากในงานของ pool เอง เพราะ pool จำกัดขนาดอาจ deadlock)"""
+        future = self._executor.submit(self._job(func, args, kwargs))
+        future.add_done_callback(self._on_cancelled)
+        return future
+
+    def _on_cancelled(self, future: Future):
+        # งานที่ถูก cancel ก่อนเริ่มไม่ได้รัน job จึงต้องเอาออกจากคิวเอง
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """สถิติของ thread pool"""
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                'pool_size': self.max_workers,
+                'queue_depth': self._queued,
+                'max_queue_depth': self._max_queue_depth,
+                'in_flight': self._running,
+                'completed': self._completed,
+                'failed': self._failed,
+                'avg_wait_ms': round(self._total_wait_seconds / started * 1000, 2) if started else 0.0,
+                'max_wait_ms': round(self._max_wait_seconds * 1000, 2)
+            }
+
+    def shutdown(self, wait: bool = True):
+        """ปิด thread pool (รองานที่ค้างอยู่ให้เสร็จก่อน)"""
+        self._executor.shutdown(wait=wait)
+
+# Executor ที่ใช้ร่วมกันทั้ง process
+sheets_io = SheetsIOExecutor()
+
+def get_sheets_io_metrics() -> Dict[str, Any]:
+    """สถิติของ Sheets I/O pool (ใช้ใน /health)"""
+    return sheets_io.get_metrics()
+
+# === Async facade ของ google_sheets.py ===
+async def add_reservation_to_sheet_async(reservation: ReservationData) -> Tuple[bool, str, Optional[str]]:
+    """เพิ่มการจองลง Google Sheets (non-blocking)"""
+    return await sheets_io.run(google_sheets.add_reservation_to_sheet, reservation)
+
+async def find_user_reservations_async(phone: str) -> List[Dict[str, Any]]:
+    """ค้นหาการจองของผู้ใช้จากเบอร์โทร (non-blocking)"""
+    return await sheets_io.run(google_sheets.find_user_reservations, phone)
+
+async def cancel_reservation_async(phone: str, date: str, time_str: str) -> Tuple[bool, str]:
+    """ยกเลิกการจองเฉพาะ (non-blocking)"""
+    return await sheets_io.run(google_sheets.cancel_reservation, phone, date, time_str)
+
+async def get_reservation_by_id_async(booking_id: str) -> Optional[Dict[str, Any]]:
+    """ค้นหาการจองจาก ID (non-blocking)"""
+    return await sheets_io.run(google_sheets.get_reservation_by_id, booking_id)
+
+async def update_reservation_status_async(booking_id: str, new_status: str, note: str = "") -> bool:
+    """อัพเดทสถานะการจอง (non-blocking)"""
+    return await sheets_io.run(google_sheets.update_reservation_status, booking_id, new_status, note)
+
+async def get_available_time_slots_async(date: str, party_size: int = 1) -> List[str]:
+    """ดึงช่วงเวลาที่ยังรับจำนวนคนนี้ได้ในวันที่ระบุ (non-blocking)"""
+    return await sheets_io.run(google_sheets.get_available_time_slots, date, party_size)
@@ -0,0 +1,430 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple, Optional, Callable
+
+from gspread.utils import rowcol_to_a1
+
+from config import (
+    WRITE_BUFFER_ENABLED,
+    WRITE_BUFFER_MAX_OPS,
+    WRITE_BUFFER_FLUSH_INTERVAL_SECONDS,
+    LEDGER_PATH,
+    LEDGER_LEASE_SECONDS,
+    REPLICATION_MAX_BACKOFF_SECONDS
+)
+from ledger import ReservationLedger, SlotClaim, STATE_REPLICATED, STATE_DISCARDED
+from reservation_store import reservation_store
+
+logger = logging.getLogger(__name__)
+
+def parse_start_row(append_response: Any) -> Optional[int]:
+    """ดึงเลขแถวแรกจากผลลัพธ์ของ append (updates.updatedRange เช่น 'การจอง'!A5:L7)"""
+    try:
+        updated_range = append_response['updates']['updatedRange']
+        match = re.search(r'![A-Z]+(\d+)', updated_range)
+        return int(match.group(1)) if match else None
+    except (KeyError, TypeError):
+        return None
+
+class SheetsWriteBuffer:
+    """
+    Write-behind buffer สำหรับ Google Sheets (replicator ของ ledger การจอง)
+
+    - ทุกรายการถูก commit ลง ledger ก่อนตอบกลับ sheet เป็นเพียงสำเนาที่เขียนตามภายหลัง
+    - การเพิ่มแถวรวมเป็น append_rows ครั้งเดียว
+    - การแก้ไข cell รวมเป็น batch_update ครั้งเดียว (cell เดิมเก็บเฉพาะค่าล่าสุด)
+    - การแก้ไขอ้างอิงด้วย booking ID และหาเลขแถวตอน flush
+    - เขียนไม่สำเร็จจะลองใหม่โดยเว้นระยะเพิ่มขึ้นเรื่อยๆ รายการที่ค้างใน ledger ของ worker
+      ที่ตายไปแล้ว (lease หมดอายุ) จะถูก worker ที่ยังทำงานอยู่รับไปเขียนต่อ
+    - แถวที่ไม่แน่ใจว่าเขียนสำเร็จหรือไม่ (append ที่ error / รายการจาก ledger)
+      จะตรวจ booking ID ในคอลัมน์ ID ของ sheet ก่อน จึงไม่ถูกเพิ่มซ้ำ
+    """
+
+    def __init__(
+        self,
+        enabled: bool = WRITE_BUFFER_ENABLED,
+        max_ops: int = WRITE_BUFFER_MAX_OPS,
+        flush_interval: float = WRITE_BUFFER_FLUSH_INTERVAL_SECONDS,
+        ledger_path: Optional[str] = LEDGER_PATH,
+        max_backoff: float = REPLICATION_MAX_BACKOFF_SECONDS,
+        lease_seconds: float = LEDGER_LEASE_SECONDS
+    ):
+        self.enabled = enabled
+        self.max_ops = max(1, max_ops)
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.ledger = ReservationLedger(ledger_path, lease_seconds) if ledger_path else None
+        # ต่ออายุ lease / ตรวจหา event ของ worker ที่ตายทุก 1/3 ของอายุ lease
+        self._lease_interval = max(0.1, lease_seconds / 3)
+        self._next_lease_check = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._appends: "OrderedDict[str, List[Any]]" = OrderedDict()
+        # แถวที่กำลังถูก append อยู่ใน flush (ยังไม่อยู่ใน sheet และไม่อยู่ใน _appends แล้ว)
+        self._flushing: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self._updates: "OrderedDict[Tuple[str, int], Any]" = OrderedDict()
+        # เลข seq ใน ledger ของแต่ละรายการที่ค้าง (key เดียวกับ _appends / _updates)
+        self._seqs: Dict[Any, List[int]] = {}
+        self._unconfirmed_ids = set()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._flush_func: Optional[Callable[[], bool]] = None
+        self._stats = {
+            'flushes': 0,
+            'failed_flushes': 0,
+            'rows_appended': 0,
+            'cells_updated': 0,
+            'replayed_ops': 0,
+            'duplicate_appends_skipped': 0,
+            'last_flush_ms': 0.0
+        }
+
+    # === Enqueue ===
+    def enqueue_append(self, booking_id: str, row: List[Any], claim: Optional[SlotClaim] = None) -> bool:
+        """เพิ่มแถวใหม่เข้าคิว (มี claim = จองที่นั่งใน ledger ด้วย คืนค่า False ถ้าช่วงเวลาเต็ม)"""
+        return self._enqueue({'op': 'append', 'booking_id': booking_id, 'row': row}, claim)
+
+    def enqueue_update(self, booking_id: str, column: int, value: Any):
+        """เพิ่มการแก้ไข cell เข้าคิว (column เริ่มที่ 1)"""
+        self._enqueue({'op': 'update', 'booking_id': booking_id, 'column': column, 'value': value})
+
+    def set_booking_active(self, booking_id: str, active: bool, claim: Optional[SlotClaim] = None) -> bool:
+        """บันทึกว่าการจองยังใช้ที่นั่งอยู่หรือไม่ (False = ช่วงเวลาเต็มแล้ว เปิดใช้การจองตาม claim ไม่ได้)"""
+        if self.ledger:
+            return self.ledger.set_booking_active(booking_id, active, claim)
+        return True
+
+    def sync_bookings(self, entries: List[Tuple[str, str, str, int, int, bool]], snapshot_started: float):
+        """ปรับที่นั่งใน ledger ให้ตรงกับข้อมูลที่เพิ่งอ่านจาก sheet"""
+        if self.ledger:
+            self.ledger.sync_bookings(entries, snapshot_started)
+
+    def pending_rows(self) -> List[List[Any]]:
+        """แถวที่ยังไม่อยู่ใน sheet (รวมที่กำลัง flush) ตามลำดับที่จะถูก append"""
+        with self._lock:
+            rows = OrderedDict(self._flushing)
+            rows.update(self._appends)
+            return [list(row) for row in rows.values()]
+
+    def has_pending(self) -> bool:
+        return bool(self._appends or self._updates)
+
+    def pending_count(self) -> int:
+        return len(self._appends) + len(self._updates)
+
+    def is_backing_off(self) -> bool:
+        """เขียน sheet ไม่สำเร็จล่าสุดและยังไม่ถึงเวลาลองใหม่"""
+        return time.monotonic() < self._retry_at
+
+    def discard(self, booking_id: str):
+        """ทิ้งรายการที่ค้างอยู่ของ booking นี้ (ใช้เมื่อเขียนทันทีไม่สำเร็จและแจ้งผู้ใช้แล้ว)"""
+        booking_id = str(booking_id)
+        with self._lock:
+            keys = [key for key in self._updates if key[0] == booking_id]
+            if self._appends.pop(booking_id, None) is not None:
+                keys.append(booking_id)
+            for key in keys:
+                self._updates.pop(key, None)
+            seqs = [seq for key in keys for seq in self._seqs.pop(key, [])]
+
+        if self.ledger:
+            self.ledger.mark(seqs, STATE_DISCARDED)
+
+    def _enqueue(self, op: Dict[str, Any], claim: Optional[SlotClaim] = None) -> bool:
+        with self._lock:
+            # commit ลง ledger ก่อน (ถ้า process ตายหลังจากนี้ รายการจะถูกเขียนต่อตอนเริ่มใหม่)
+            seq = self.ledger.append(op, claim) if self.ledger else None
+            if self.ledger and seq is None:
+                return False
+            self._apply(op, seq)
+            pending = len(self._appends) + len(self._updates)
+
+        if pending >= self.max_ops:
+            self._wakeup.set()
+        return True
+
+    def _apply(self, op: Dict[str, Any], seq: Optional[int] = None):
+        booking_id = str(op['booking_id'])
+        if op['op'] == 'append':
+            self._appends[booking_id] = list(op['row'])
+            key = booking_id
+        elif booking_id in self._appends and booking_id not in self._unconfirmed_ids:
+            # แถวยังไม่ถูกเขียนลง sheet แก้ค่าในแถวที่รออยู่เลย
+            # (ยกเว้นแถวที่อาจอยู่ใน sheet แล้ว ต้องแก้ผ่าน cell update)
+            self._appends[booking_id][op['column'] - 1] = op['value']
+            key = booking_id
+        else:
+            key = (booking_id, op['column'])
+            self._updates.pop(key, None)
+            self._updates[key] = op['value']
+
+        if seq is not None:
+            self._seqs.setdefault(key, []).append(seq)
+
+    # === Flush ===
+    def flush(self, worksheet, headers: List[str], ensure_store_loaded: Callable[[], bool]) -> bool:
+        """เขียนรายการที่ค้างอยู่ลง sheet (ถ้าไม่สำเร็จจะ raise และรายการยังอยู่ในคิว)"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._appends and not self._updates:
+                    return True
+                appends, self._appends = self._appends, OrderedDict()
+                updates, self._updates = self._updates, OrderedDict()
+                seqs, self._seqs = self._seqs, {}
+                self._flushing = appends
+
+            started_at = time.monotonic()
+            try:
+                if not ensure_store_loaded():
+                    raise RuntimeError("reservation store is not loaded")
+                rows_appended = self._flush_appends(worksheet, headers, appends)
+            except Exception:
+                with self._lock:
+                    # append อาจสำเร็จที่ฝั่ง sheet แม้จะได้ error ต้องตรวจ ID ก่อนเขียนซ้ำ
+                    self._unconfirmed_ids.update(appends.keys())
+                self._restore(appends, updates, seqs)
+                self._record_failure()
+                raise
+
+            self._mark(seqs, appends.keys(), STATE_REPLICATED)
+            with self._lock:
+                self._unconfirmed_ids.difference_update(appends.keys())
+                self._flushing = OrderedDict()
+
+            try:
+                # store อาจถูกล้างหลัง append (เลขแถวไม่ตรง) ต้องโหลดใหม่ก่อนหาเลขแถว
+                if not ensure_store_loaded():
+                    raise RuntimeError("reservation store is not loaded")
+                cells_updated, dropped = self._flush_updates(worksheet, headers, updates)
+            except Exception:
+                # แถวใหม่เขียนสำเร็จแล้ว คืนเฉพาะการแก้ไข cell เข้าคิว
+                self._restore(OrderedDict(), updates, seqs)
+                self._record_failure()
+                raise
+
+            self._mark(seqs, dropped, STATE_DISCARDED)
+            self._mark(seqs, [key for key in updates if key not in dropped], STATE_REPLICATED)
+
+            self._failures = 0
+            self._retry_at = 0.0
+            self._stats['flushes'] += 1
+            self._stats['rows_appended'] += rows_appended
+            self._stats['cells_updated'] += cells_updated
+            self._stats['last_flush_ms'] = round((time.monotonic() - started_at) * 1000, 2)
+            logger.info(f"Flushed sheet writes: {rows_appended} rows, {cells_updated} cells")
+            return True
+
+    def _flush_appends(self, worksheet, headers: List[str], appends: "OrderedDict[str, List[Any]]") -> int:
+        # booking ID ที่มีอยู่ใน sheet แล้ว (อ่านคอลัมน์ ID เฉพาะเมื่อมีแถวที่ไม่แน่ใจ)
+        existing_ids = set()
+        if any(booking_id in self._unconfirmed_ids for booking_id in appends):
+            existing_ids = set(worksheet.col_values(1))
+
+        rows = []
+        booking_ids = []
+        stale = False
+        for booking_id, row in appends.items():
+            if booking_id in self._unconfirmed_ids and booking_id in existing_ids:
+                logger.info(f"Skipped append for {booking_id}, already in sheet")
+                self._stats['duplicate_appends_skipped'] += 1
+                # เลขแถวใน store อาจไม่ตรงกับแถวที่เขียนไปแล้ว
+                stale = True
+                continue
+            rows.append(row)
+            booking_ids.append(booking_id)
+
+        if not rows:
+            if stale:
+                reservation_store.invalidate()
+            return 0
+
+        response = worksheet.append_rows(rows)
+        start_row = parse_start_row(response)
+
+        stale = stale or start_row is None
+        for i, (booking_id, row) in enumerate(zip(booking_ids, rows)):
+            if start_row is None:
+                break
+            actual_row = start_row + i
+            expected_row = reservation_store.get_row_number(booking_id)
+            if expected_row is None:
+                reservation_store.add(dict(zip(headers, row)), actual_row)
+            elif expected_row != actual_row:
+                stale = True
+
+        if stale:
+            # เลขแถวที่ store คาดไว้ไม่ตรงกับ sheet (มีคนเพิ่มแถวใน sheet เอง) ให้โหลดใหม่
+            reservation_store.invalidate()
+
+        return len(rows)
+
+    def _flush_updates(
+        self, worksheet, headers: List[str], updates: "OrderedDict[Tuple[str, int], Any]"
+    ) -> Tuple[int, List[Tuple[str, int]]]:
+        """เขียนการแก้ไข cell (คืนค่าจำนวน cell และรายการที่ถูกทิ้งเพราะหาแถวไม่พบ)"""
+        if not updates:
+            return 0, []
+
+        data = []
+        dropped = []
+        changes: Dict[int, Dict[str, Any]] = {}
+        for (booking_id, column), value in updates.items():
+            row_number = reservation_store.get_row_number(booking_id)
+            if row_number is None:
+                logger.warning(f"Dropped buffered update for unknown reservation {booking_id}")
+                dropped.append((booking_id, column))
+                continue
+            data.append({'range': rowcol_to_a1(row_number, column), 'values': [[value]]})
+            changes.setdefault(row_number, {})[headers[column - 1]] = value
+
+        if data:
+            worksheet.batch_update(data)
+
+        # store อาจถูกโหลดใหม่จาก sheet ก่อนการแก้ไขเหล่านี้จะถูกเขียน ให้ตรงกับ sheet อีกครั้ง
+        for row_number, row_changes in changes.items():
+            reservation_store.update(row_number, row_changes)
+
+        return len(data), dropped
+
+    def _mark(self, seqs: Dict[Any, List[int]], keys, state: str):
+        """บันทึกผลการเขียนของรายการเหล่านี้ลง ledger"""
+        if self.ledger:
+            self.ledger.mark([seq for key in keys for seq in seqs.get(key, [])], state)
+
+    def _record_failure(self):
+        """นับการเขียนที่ไม่สำเร็จและกำหนดเวลาลองใหม่ (เว้นระยะเพิ่มเป็นเท่าตัว)"""
+        self._failures += 1
+        delay = min(self.flush_interval * (2 ** min(self._failures, 16)), self.max_backoff)
+        self._retry_at = time.monotonic() + delay
+        self._stats['failed_flushes'] += 1
+        logger.warning(f"Sheet replication failed {self._failures} time(s), retrying in {delay:.1f}s")
+
+    def _restore(self, appends, updates, seqs):
+        """นำรายการที่ flush ไม่สำเร็จกลับเข้าคิว (รายการใหม่กว่ามาก่อนเสมอ)"""
+        with self._lock:
+            self._flushing = OrderedDict()
+            for key in list(appends.keys()) + list(updates.keys()):
+                if key in seqs:
+                    self._seqs[key] = seqs[key] + self._seqs.get(key, [])
+
+            for booking_id, row in reversed(appends.items()):
+                if booking_id not in self._appends:
+                    self._appends[booking_id] = row
+                    self._appends.move_to_end(booking_id, last=False)
+
+            newer_updates = self._updates
+            self._updates = OrderedDict(updates)
+            for key, value in newer_updates.items():
+                self._updates.pop(key, None)
+                self._updates[key] = value
+
+    # === Ledger ===
+    def claim_orphaned(self) -> int:
+        """รับรายการที่ยังไม่ได้เขียนลง sheet ของ worker ที่ตายแล้วจาก ledger (process ตายก่อน flush)"""
+        if not self.ledger:
+            return 0
+
+        claimed = self.ledger.claim()
+        with self._lock:
+            for seq, op in claimed:
+                if op['op'] == 'append':
+                    # อาจเขียนลง sheet สำเร็จแล้วแต่ยังไม่ได้บันทึกผล
+                    self._unconfirmed_ids.add(str(op['booking_id']))
+                self._apply(op, seq)
+
+        if claimed:
+            self._stats['replayed_ops'] += len(claimed)
+            logger.warning(f"Replayed {len(claimed)} unreplicated sheet writes from {self.ledger.path}")
+            self._wakeup.set()
+        return len(claimed)
+
+    def _maintain_leases(self):
+        """ต่ออายุ lease ของรายการที่ค้าง และรับรายการของ worker ที่ตายแล้ว (ทุก _lease_interval)"""
+        if not self.ledger or time.monotonic() < self._next_lease_check:
+            return
+        self._next_lease_check = time.monotonic() + self._lease_interval
+        try:
+            self.ledger.renew()
+            self.claim_orphaned()
+        except Exception as e:
+            logger.error(f"Error maintaining ledger leases: {e}")
+
+    # === Background flusher ===
+    def start(self, flush_func: Callable[[], bool]):
+        """รับรายการค้างจาก ledger แล้วเริ่ม thread ที่ flush ตามเวลา / เมื่อครบจำนวน"""
+        self._flush_func = flush_func
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._next_lease_check = 0.0
+        self._maintain_leases()
+        # ปิด buffer และไม่มี ledger ไม่ต้องมี thread (ปิด buffer แต่มี ledger: thread มีไว้ต่ออายุ lease)
+        if not self.enabled and not self.ledger:
+            return
+
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="sheets-write-buffer", daemon=True)
+        self._thread.start()
+        if self.has_pending():
+            self._wakeup.set()
+
+    def stop(self):
+        """หยุด thread และ flush รายการที่เหลือ"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+        elif self._flush_func and self.has_pending():
+            try:
+                self._flush_func()
+            except Exception as e:
+                logger.error(f"Final sheet flush failed: {e}")
+
+        if self.ledger and self.has_pending():
+            # เขียนไม่สำเร็จ ให้ worker อื่นรับไปเขียนต่อได้ทันทีโดยไม่ต้องรอ lease หมดอายุ
+            self.ledger.release()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+
+            # เขียนไม่สำเร็จล่าสุด รอจนถึงเวลาลองใหม่ (ยกเว้นตอนหยุด) ระหว่างรอต้องต่ออายุ lease ด้วย
+            while self.is_backing_off() and not self._stopping:
+                self._maintain_leases()
+                self._wakeup.wait(min(self._retry_at - time.monotonic(), self._lease_interval))
+                self._wakeup.clear()
+
+            self._maintain_leases()
+            # ปิด buffer: ไม่ flush ตามเวลา (การเขียนแต่ละครั้ง flush เอง) แต่ยัง flush รอบสุดท้ายตอนหยุด
+            if (self.enabled or self._stopping) and self.has_pending() and self._flush_func:
+                try:
+                    self._flush_func()
+                except Exception as e:
+                    logger.error(f"Background sheet flush failed: {e}")
+
+            if self._stopping:
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """สถิติของ write buffer"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['enabled'] = self.enabled
+            stats['pending_appends'] = len(self._appends)
+            stats['pending_updates'] = len(self._updates)
+            stats['consecutive_failures'] = self._failures
+            stats['retry_in_seconds'] = round(max(0.0, self._retry_at - time.monotonic()), 1)
+        if self.ledger:
+            stats['ledger'] = self.ledger.get_stats()
+        return stats
+
+# Buffer ที่ใช้ร่วมกันทั้ง process
+write_buffer = SheetsWriteBuffer()
@@ -0,0 +1,55 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+class SlotLocks:
+    """
+    Lock แยกตามช่วงเวลา (วันที่, เวลา)
+
+    การจองช่วงเวลาเดียวกันต้องต่อคิวกัน แต่ช่วงเวลาอื่นทำพร้อมกันได้
+    lock ที่ไม่มีใครใช้แล้วจะถูกลบทิ้ง จึงไม่สะสมตามจำนวนวัน
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._refs: Dict[Tuple[str, str], int] = {}
+        self._stats = {'acquired': 0, 'contended': 0}
+
+    @contextmanager
+    def hold(self, date: str, time_str: str):
+        """ถือ lock ของช่วงเวลานี้จนจบ block"""
+        key = (str(date), str(time_str))
+        with self._lock:
+            slot_lock = self._locks.get(key)
+            if slot_lock is None:
+                slot_lock = self._locks[key] = threading.Lock()
+            self._refs[key] = self._refs.get(key, 0) + 1
+
+        if not slot_lock.acquire(blocking=False):
+            self._stats['contended'] += 1
+            slot_lock.acquire()
+        self._stats['acquired'] += 1
+
+        try:
+            yield
+        finally:
+            slot_lock.release()
+            with self._lock:
+                self._refs[key] -= 1
+                if not self._refs[key]:
+                    del self._refs[key]
+                    del self._locks[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """สถิติของ lock"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active_slots'] = len(self._locks)
+            return stats
+
+# Lock ที่ใช้ร่วมกันทั้ง process
+slot_locks = SlotLocks()
@@ -0,0 +1,83 @@
+import json
+import math
+import threading
+from typing import Dict, Any, Optional
+
+try:
+    import orjson
+except ImportError:  # ไม่มี orjson ใช้ json มาตรฐาน
+    orjson = None
+
+def encode_log_line(data: Dict[str, Any]) -> str:
+    """แปลง event เป็น JSON หนึ่งบรรทัด (ค่าที่ encode ไม่ได้ใช้ str แทน)"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """แปลง "MESSAGE_RECEIVED=0.1,GREETING=0.5" เป็น dict (ค่าอยู่ระหว่าง 0 - 1)"""
+    rates = {}
+    for item in (spec or '').split(','):
+        name, sep, value = item.partition('=')
+        if not sep or not name.strip():
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+class EventSampler:
+    """
+    สุ่มเก็บ log ตามชนิด event (แบบนับ ไม่ใช้ random)
+
+    rate 0.1 = เก็บ 1 ใน 10 รายการ, ไม่ได้กำหนด = เก็บทุกรายการ
+    นับจำนวนครั้งและจำนวน bytes ที่เขียนของแต่ละชนิด สำหรับรายงานปริมาณ log
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        self.rates = dict(rates or {})
+        self._lock = threading.Lock()
+        self._seen: Dict[str, int] = {}
+        self._logged: Dict[str, int] = {}
+        self._bytes: Dict[str, int] = {}
+
+    def rate(self, event_type: str) -> float:
+        return self.rates.get(event_type, 1.0)
+
+    def should_log(self, event_type: str) -> bool:
+        """นับ event และตอบว่าครั้งนี้ต้องเขียน log หรือไม่"""
+        rate = self.rate(event_type)
+        with self._lock:
+            seen = self._seen.get(event_type, 0) + 1
+            self._seen[event_type] = seen
+        if rate >= 1.0:
+            return True
+        # เขียนเมื่อผลคูณข้ามจำนวนเต็ม (กระจายเท่าๆ กัน เช่น rate 0.25 = ครั้งที่ 4, 8, 12, ...)
+        return math.floor(seen * rate) > math.floor((seen - 1) * rate)
+
+    def record(self, event_type: str, size: int):
+        """บันทึกว่าเขียน log ไปแล้ว size bytes"""
+        with self._lock:
+            self._logged[event_type] = self._logged.get(event_type, 0) + 1
+            self._bytes[event_type] = self._bytes.get(event_type, 0) + size
+
+    def report(self) -> Dict[str, Any]:
+        """ปริมาณ log ของแต่ละชนิด event เรียงตามจำนวน bytes"""
+        with self._lock:
+            total_bytes = sum(self._bytes.values())
+            events = {
+                event_type: {
+                    'seen': seen,
+                    'logged': self._logged.get(event_type, 0),
+                    'sample_rate': self.rate(event_type),
+                    'bytes': self._bytes.get(event_type, 0),
+                    'avg_bytes': round(self._bytes.get(event_type, 0) / max(1, self._logged.get(event_type, 0)), 1),
+                    'share_percent': round(self._bytes.get(event_type, 0) / total_bytes * 100, 2) if total_bytes else 0.0
+                }
+                for event_type, seen in self._seen.items()
+            }
+        return {
+            'total_bytes': total_bytes,
+            'events': dict(sorted(events.items(), key=lambda item: item[1]['bytes'], reverse=True))
+        }
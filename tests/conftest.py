@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# ตั้งค่าก่อน import โมดูลของแอป (ledger / index / session แยกจากของจริง)
+_work_dir = tempfile.mkdtemp(prefix="linebot-tests-")
+os.environ["LINE_CHANNEL_SECRET"] = "test-secret"
+os.environ["LINE_CHANNEL_ACCESS_TOKEN"] = "test-token"
+os.environ["LEDGER_PATH"] = os.path.join(_work_dir, "ledger.db")
+os.environ["PHONE_INDEX_PATH"] = ":memory:"
+os.environ["SESSION_STORE"] = "memory"
+os.environ["WRITE_BUFFER_ENABLED"] = "true"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import FakeWorksheet  # noqa: E402
+
+@pytest.fixture
+def worksheet():
+    """worksheet จำลองที่ว่างเปล่า และ reservation store ที่โหลดจาก worksheet นั้นแล้ว"""
+    from google_sheets import HEADERS, DEFAULT_SHEET_NAME
+    from reservation_store import reservation_store
+
+    sheet = FakeWorksheet(HEADERS, DEFAULT_SHEET_NAME)
+    reservation_store.load(sheet.get_all_records())
+    return sheet
+
+def make_row(
+    booking_id: str, date: str = "01-01-2570", time: str = "19:00", party_size: int = 2, phone: str = "0812345678"
+):
+    """แถวการจองในรูปแบบเดียวกับที่ add_reservation_to_sheet เขียน"""
+    return [
+        booking_id, "01/01/2026 12:00:00", "ลูกค้าทดสอบ", phone, date, time,
+        party_size, "", "", "", "ยืนยันแล้ว", ""
+    ]
+
+@pytest.fixture
+def sheets(monkeypatch, tmp_path, worksheet):
+    """google_sheets ที่ต่อกับ worksheet จำลอง และ write buffer ที่มี ledger แยกของแต่ละ test"""
+    import google_sheets
+    from sheets_write_buffer import SheetsWriteBuffer
+
+    monkeypatch.setattr(google_sheets, 'write_buffer', SheetsWriteBuffer(ledger_path=str(tmp_path / "ledger.db")))
+    monkeypatch.setattr(google_sheets, 'get_worksheet', lambda sheet_name=google_sheets.DEFAULT_SHEET_NAME: worksheet)
+    return google_sheets
@@ -0,0 +1,37 @@
+import asyncio
+
+import booking_logic
+from availability import SERVICE_TIMES
+from session_manager import start_reservation_session, update_user_session, get_user_session, clear_reservation_session
+
+USER_ID = "Utest000001"
+
+def _select_time(monkeypatch, time_text: str):
+    replies = []
+
+    async def reply(reply_token, text):
+        replies.append(text)
+
+    async def run():
+        await start_reservation_session(USER_ID)
+        await update_user_session(USER_ID, step="time", data={"date": "01-01-2570"})
+        try:
+            await booking_logic.handle_time_selection("token", USER_ID, time_text, "ลูกค้าทดสอบ")
+            return replies, await get_user_session(USER_ID)
+        finally:
+            await clear_reservation_session(USER_ID)
+
+    monkeypatch.setattr(booking_logic, 'reply_to_user', reply)
+    return asyncio.run(run())
+
+def test_off_grid_time_is_rejected_with_valid_choices(monkeypatch):
+    replies, session = _select_time(monkeypatch, "19:15")
+    assert len(replies) == 1
+    assert ", ".join(SERVICE_TIMES) in replies[0]
+    assert session['step'] == "time"
+    assert 'time' not in session['data']
+
+def test_service_time_moves_to_party_size(monkeypatch):
+    replies, session = _select_time(monkeypatch, "19:30")
+    assert session['step'] == "party_size"
+    assert session['data']['time'] == "19:30"
@@ -0,0 +1,115 @@
+import threading
+import time
+
+from conftest import make_row
+from google_sheets import SLOT_FULL_MESSAGE
+from ledger import ReservationLedger, SlotClaim
+from models import ReservationData
+from reservation_store import reservation_store
+from sheets_write_buffer import SheetsWriteBuffer
+
+DATE = "01-01-2570"
+TIME = "19:00"
+
+def _reservation(party_size: int = 2) -> ReservationData:
+    return ReservationData(customer_name="ลูกค้าทดสอบ", phone="0812345678", date=DATE, time=TIME, party_size=party_size)
+
+def _fill_slot(sheets, worksheet, bookings: int = 9, party_size: int = 4):
+    """ช่วงเวลาที่เหลือโต๊ะเดียว (9 โต๊ะจาก 10) แล้วโหลด store ให้ ledger รู้จักการจองเหล่านี้"""
+    worksheet.rows.extend(make_row(f"S{i:03d}", DATE, TIME, party_size) for i in range(bookings))
+    reservation_store.invalidate()
+    assert sheets._load_reservation_store()
+
+def test_ledger_claims_last_seats_once_across_workers(tmp_path):
+    path = str(tmp_path / "ledger.db")
+    workers = [ReservationLedger(path), ReservationLedger(path)]
+    claim = SlotClaim(DATE, TIME, seats=2, tables=1, seat_capacity=4, table_capacity=10)
+    results = []
+
+    def book(i):
+        op = {'op': 'append', 'booking_id': f"B{i:03d}", 'row': []}
+        results.append(workers[i % 2].append(op, claim))
+
+    threads = [threading.Thread(target=book, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len([seq for seq in results if seq is not None]) == 2
+    assert workers[0].get_stats()['pending'] == 2
+
+def test_concurrent_bookings_for_last_table(sheets, worksheet):
+    _fill_slot(sheets, worksheet)
+    results = []
+
+    def book():
+        results.append(sheets.add_reservation_to_sheet(_reservation()))
+
+    threads = [threading.Thread(target=book) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [success for success, _, _ in results].count(True) == 1
+    assert [message for success, message, _ in results if not success] == [SLOT_FULL_MESSAGE] * 5
+
+def test_other_worker_sees_unflushed_booking(sheets, worksheet):
+    _fill_slot(sheets, worksheet)
+    assert sheets.add_reservation_to_sheet(_reservation())[0]
+
+    # worker อื่นที่ใช้ ledger เดียวกัน (ยังไม่มีอะไรถูกเขียนลง sheet)
+    other = SheetsWriteBuffer(ledger_path=sheets.write_buffer.ledger.path)
+    claim = SlotClaim(DATE, TIME, seats=2, tables=1, seat_capacity=40, table_capacity=10)
+    assert not other.enqueue_append("B999", make_row("B999", DATE, TIME), claim)
+    assert len(worksheet.rows) == 9
+
+def test_cancel_releases_seats(sheets, worksheet):
+    _fill_slot(sheets, worksheet)
+    assert sheets.add_reservation_to_sheet(_reservation())[0]
+    assert not sheets.add_reservation_to_sheet(_reservation())[0]
+
+    success, _ = sheets.cancel_reservation("0812345678", DATE, TIME)
+    assert success
+    assert sheets.add_reservation_to_sheet(_reservation())[0]
+
+def test_reload_keeps_unflushed_bookings(sheets, worksheet):
+    _fill_slot(sheets, worksheet, bookings=2)
+    success, _, booking_id = sheets.add_reservation_to_sheet(_reservation())
+    assert success
+
+    # โหลด sheet ใหม่ก่อน flush: การจองที่ยังค้างต้องไม่หายจาก store และ ledger
+    reservation_store.invalidate()
+    assert reservation_store.ensure_loaded(lambda: sheets._fetch_records(worksheet), sheets._pending_records)
+    assert reservation_store.get_by_booking_id(booking_id) is not None
+    assert sheets.write_buffer.ledger.get_stats()['active_slot_bookings'] == 3
+
+    assert sheets.flush_pending_writes()
+    assert [row[0] for row in worksheet.rows][-1] == booking_id
+    assert reservation_store.get_row_number(booking_id) == 4
+
+def test_sync_drops_bookings_removed_from_sheet(sheets, worksheet):
+    _fill_slot(sheets, worksheet, bookings=3)
+    del worksheet.rows[0]
+    time.sleep(0.01)
+    reservation_store.invalidate()
+    assert sheets._load_reservation_store()
+    assert sheets.write_buffer.ledger.get_stats()['active_slot_bookings'] == 2
+
+def test_reactivating_cancelled_booking_rechecks_capacity(sheets, worksheet):
+    _fill_slot(sheets, worksheet)
+    success, _, booking_id = sheets.add_reservation_to_sheet(_reservation())
+    assert success
+    assert sheets.update_reservation_status(booking_id, "ยกเลิกแล้ว")
+
+    # ที่นั่งที่คืนไปถูกจองต่อแล้ว: เปิดใช้การจองเดิมไม่ได้
+    success, _, other_id = sheets.add_reservation_to_sheet(_reservation())
+    assert success
+    assert not sheets.update_reservation_status(booking_id, "ยืนยันแล้ว")
+    assert reservation_store.get_by_booking_id(booking_id)['สถานะ'] == "ยกเลิกแล้ว"
+
+    # ยกเลิกการจองใหม่แล้วจึงเปิดใช้การจองเดิมได้
+    assert sheets.update_reservation_status(other_id, "ยกเลิกแล้ว")
+    assert sheets.update_reservation_status(booking_id, "ยืนยันแล้ว")
+    assert sheets.write_buffer.ledger.get_stats()['active_slot_bookings'] == 10
@@ -0,0 +1,66 @@
+import json
+
+import gspread
+import requests
+
+from conftest import make_row
+from models import ReservationData
+from reservation_store import reservation_store
+
+def _api_error(status: int) -> gspread.exceptions.APIError:
+    response = requests.models.Response()
+    response.status_code = status
+    response._content = json.dumps({'error': {'code': status, 'message': 'unavailable'}}).encode()
+    return gspread.exceptions.APIError(response)
+
+PHONE = "0861234567"
+
+def _reservation(name: str = "ลูกค้าทดสอบ", time: str = "19:00", party_size: int = 2) -> ReservationData:
+    return ReservationData(
+        customer_name=name, phone=PHONE, date="01-01-2570", time=time, party_size=party_size
+    )
+
+def _fail_with(worksheet, status: int):
+    def fail(name):
+        raise _api_error(status)
+    worksheet._call = fail
+
+def test_booking_succeeds_while_sheets_returns_503(sheets, worksheet, monkeypatch):
+    worksheet.rows.append(make_row("B001", phone=PHONE))
+    reservation_store.load(worksheet.get_all_records())
+    sheets.write_buffer.enqueue_update("B001", 12, "โทรยืนยันแล้ว")
+
+    # store ถูกสั่งให้โหลดใหม่ (เช่น worksheet ถูก invalidate) แล้ว sheet ล่ม
+    reservation_store.invalidate()
+    _fail_with(worksheet, 503)
+
+    success, _, booking_id = sheets.add_reservation_to_sheet(_reservation())
+    assert success
+    assert reservation_store.get_by_booking_id(booking_id) is not None
+    assert [r['data']['ID การจอง'] for r in sheets.find_user_reservations(PHONE)] == ["B001", booking_id]
+
+    # sheet กลับมาใช้ได้ รายการที่ค้างถูกเขียนตามลง sheet
+    monkeypatch.delattr(worksheet, '_call')
+    sheets.write_buffer._retry_at = 0.0
+    assert sheets.flush_pending_writes()
+    assert [row[0] for row in worksheet.rows] == ["B001", booking_id]
+    assert worksheet.rows[0][11] == "โทรยืนยันแล้ว"
+    assert not reservation_store.is_stale()
+
+def test_find_user_reservations_sees_rows_deleted_in_sheet(sheets, worksheet):
+    phone = "0869876543"
+    worksheet.rows.extend([make_row("B101", phone=phone), make_row("B102", phone=phone)])
+    reservation_store.invalidate()
+    assert [r['data']['ID การจอง'] for r in sheets.find_user_reservations(phone)] == ["B101", "B102"]
+
+    # ลบแถวใน sheet โดยตรง แล้วข้อมูลใน store หมดอายุ
+    del worksheet.rows[0]
+    reservation_store.invalidate()
+    reservations = sheets.find_user_reservations(phone)
+    assert [(r['data']['ID การจอง'], r['row_number']) for r in reservations] == [("B102", 2)]
+
+def test_failed_backup_returns_false(sheets, monkeypatch):
+    monkeypatch.setattr(sheets, 'get_spreadsheet', lambda: None)
+
+    assert sheets.backup_reservations() is False
+    assert sheets.backup_reservations_report()['success'] is False
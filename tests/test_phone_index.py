@@ -0,0 +1,37 @@
+from conftest import make_row
+from google_sheets import HEADERS
+from phone_index import PhoneIndex
+from reservation_store import ReservationStore
+
+def _records(*booking_ids):
+    return [dict(zip(HEADERS, make_row(booking_id))) for booking_id in booking_ids]
+
+def test_reload_removes_bookings_deleted_from_sheet():
+    store = ReservationStore()
+    index = PhoneIndex(":memory:", store)
+    store.add_listener(index)
+
+    store.load(_records("B001", "B002", "B003"))
+    assert [record['ID การจอง'] for _, record in index.find_by_phone("0812345678")] == ["B001", "B002", "B003"]
+
+    # แถว B002 ถูกลบใน sheet: แถวหลังจากนั้นเลื่อนขึ้น
+    store.load(_records("B001", "B003"))
+    assert [(row, record['ID การจอง']) for row, record in index.find_by_phone("0812345678")] == [(2, "B001"), (3, "B003")]
+    assert index.get_stats()['entries'] == 2
+
+def test_rebuild_replaces_index_contents():
+    store = ReservationStore()
+    index = PhoneIndex(":memory:", store)
+    store.add_listener(index)
+    store.load(_records("B001", "B002"))
+
+    assert index.rebuild(_records("B002")) == 1
+    assert [(row, record['ID การจอง']) for row, record in index.find_by_phone("0812345678")] == [(2, "B002")]
+
+def test_index_file_is_created_on_first_use(tmp_path):
+    path = tmp_path / "index" / "phone_index.db"
+    index = PhoneIndex(str(path), ReservationStore())
+    assert not path.parent.exists()
+
+    assert index.find_by_phone("0812345678") == []
+    assert path.exists()
@@ -0,0 +1,33 @@
+from datetime import date
+
+from reservation_stats import ReservationSnapshot
+
+TODAY = date(2026, 10, 16)
+
+def _snapshot(rows):
+    booked_at, dates, times, statuses = zip(*rows)
+    return ReservationSnapshot(1, {
+        'วันที่จอง': list(booked_at), 'วันที่': list(dates), 'เวลา': list(times), 'สถานะ': list(statuses)
+    })
+
+def test_window_counts_upcoming_bookings_made_recently():
+    snapshot = _snapshot([
+        ("15/10/2026 10:00:00", "20-11-2569", "19:00", "ยืนยันแล้ว"),  # จองเมื่อวาน มาใช้บริการเดือนหน้า
+        ("16/10/2026 09:00:00", "16-10-2569", "18:00", "ยกเลิกแล้ว"),
+        ("01/09/2026 12:00:00", "16-10-2569", "19:00", "ยืนยันแล้ว"),  # จองก่อนช่วง 7 วัน
+    ])
+
+    stats = snapshot.statistics(days=7, today=TODAY)
+    assert stats['total_reservations'] == 2
+    assert stats['confirmed_reservations'] == 1
+    assert stats['cancelled_reservations'] == 1
+    assert list(stats['date_statistics']) == ["16-10-2569", "20-11-2569"]
+    assert stats['popular_times'] == {"19:00": 1}
+
+def test_no_window_counts_every_booking():
+    snapshot = _snapshot([
+        ("01/09/2026 12:00:00", "16-10-2569", "19:00", "ยืนยันแล้ว"),
+        ("", "20-11-2569", "19:00", "ยืนยันแล้ว"),
+    ])
+
+    assert snapshot.statistics(days=None, today=TODAY)['total_reservations'] == 2
@@ -0,0 +1,69 @@
+import asyncio
+from datetime import datetime
+
+import fakeredis
+import pytest
+
+from session_store import MemorySessionStore, RedisSessionStore, SQLiteSessionStore
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request):
+    if request.param == "memory":
+        return MemorySessionStore()
+    if request.param == "sqlite":
+        return SQLiteSessionStore(":memory:")
+    return RedisSessionStore(client=fakeredis.FakeAsyncRedis())
+
+async def _items(store):
+    return {user_id: session async for user_id, session in store.items()}
+
+def test_round_trip_keeps_datetimes(store):
+    created_at = datetime(2026, 1, 1, 12, 30)
+
+    async def run():
+        await store.set("U1", {"step": "name", "created_at": created_at, "data": {}}, 60)
+        return await store.get("U1")
+
+    session = asyncio.run(run())
+    assert session == {"step": "name", "created_at": created_at, "data": {}}
+
+def test_count_and_items_skip_expired_sessions(store):
+    async def run():
+        await store.set("U1", {"step": "name"}, 60)
+        await store.set("U2", {"step": "phone"}, 60)
+        await store.set("U3", {"step": "date"}, 1)
+        await asyncio.sleep(1.1)
+        return await store.count(), await _items(store), await store.get("U3")
+
+    count, items, expired = asyncio.run(run())
+    assert count == 2
+    assert set(items) == {"U1", "U2"}
+    assert expired is None
+
+def test_delete(store):
+    async def run():
+        await store.set("U1", {"step": "name"}, 60)
+        deleted = await store.delete("U1")
+        return deleted, await store.delete("U1"), await store.count()
+
+    assert asyncio.run(run()) == (True, False, 0)
+
+def test_redis_items_reads_in_batches():
+    store = RedisSessionStore(client=fakeredis.FakeAsyncRedis())
+    store.BATCH_SIZE = 3
+
+    async def run():
+        for i in range(7):
+            await store.set(f"U{i}", {"index": i}, 60)
+        await store.client.set("other:key", "x")
+        return await _items(store), await store.count()
+
+    items, count = asyncio.run(run())
+    assert items == {f"U{i}": {"index": i} for i in range(7)}
+    assert count == 7
+
+def test_base_store_is_abstract():
+    from session_store import SessionStore
+
+    with pytest.raises(TypeError):
+        SessionStore()
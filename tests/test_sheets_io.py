@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+
+from sheets_io import SheetsIOExecutor
+
+def test_submit_counts_jobs_and_cancelled_jobs_leave_the_queue():
+    executor = SheetsIOExecutor(max_workers=1)
+    release = threading.Event()
+    try:
+        blocker = executor.submit(release.wait)
+        while executor.get_metrics()['in_flight'] == 0:
+            time.sleep(0.001)
+        queued = executor.submit(sum, [1, 2])
+        assert executor.get_metrics()['queue_depth'] == 1
+        assert queued.cancel()
+        assert executor.get_metrics()['queue_depth'] == 0
+
+        release.set()
+        assert blocker.result(timeout=5) is True
+        assert executor.submit(sum, [1, 2]).result(timeout=5) == 3
+    finally:
+        release.set()
+        executor.shutdown()
+
+    metrics = executor.get_metrics()
+    assert metrics['completed'] == 2
+    assert metrics['queue_depth'] == 0
+
+def test_cancelled_run_leaves_the_queue():
+    executor = SheetsIOExecutor(max_workers=1)
+    release = threading.Event()
+
+    async def run():
+        blocker = asyncio.ensure_future(executor.run(release.wait))
+        while executor.get_metrics()['in_flight'] == 0:
+            await asyncio.sleep(0.001)
+
+        # request ถูกยกเลิกระหว่างรอคิว (เช่น client ตัดการเชื่อมต่อ)
+        waiting = asyncio.ensure_future(executor.run(sum, [1, 2]))
+        await asyncio.sleep(0)
+        assert executor.get_metrics()['queue_depth'] == 1
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert executor.get_metrics()['queue_depth'] == 0
+
+        release.set()
+        return await blocker
+
+    try:
+        assert asyncio.run(run()) is True
+    finally:
+        release.set()
+        executor.shutdown()
+    assert executor.get_metrics()['queue_depth'] == 0
@@ -0,0 +1,71 @@
+import time
+
+from conftest import make_row
+from google_sheets import HEADERS
+from reservation_store import reservation_store
+from sheets_write_buffer import SheetsWriteBuffer
+
+def _flush(buffer, worksheet):
+    return buffer.flush(worksheet, HEADERS, lambda: reservation_store.ensure_loaded(worksheet.get_all_records))
+
+def test_live_worker_does_not_replay_other_workers_writes(tmp_path, worksheet):
+    path = str(tmp_path / "ledger.db")
+    first = SheetsWriteBuffer(ledger_path=path, lease_seconds=30)
+    first.enqueue_append("B001", make_row("B001"))
+
+    # worker ที่สองเริ่มทำงานระหว่างที่ worker แรกยังไม่ได้ flush
+    second = SheetsWriteBuffer(ledger_path=path, lease_seconds=30)
+    assert second.claim_orphaned() == 0
+    assert not second.has_pending()
+
+    _flush(first, worksheet)
+    _flush(second, worksheet)
+    assert [row[0] for row in worksheet.rows] == ["B001"]
+    assert second.claim_orphaned() == 0
+
+def test_expired_lease_is_claimed_and_written_once(tmp_path, worksheet):
+    path = str(tmp_path / "ledger.db")
+    crashed = SheetsWriteBuffer(ledger_path=path, lease_seconds=0.05)
+    crashed.enqueue_append("B001", make_row("B001"))
+    crashed.enqueue_update("B001", 12, "โทรยืนยันแล้ว")
+
+    survivor = SheetsWriteBuffer(ledger_path=path, lease_seconds=30)
+    time.sleep(0.1)
+    assert survivor.claim_orphaned() == 2
+
+    _flush(survivor, worksheet)
+    assert len(worksheet.rows) == 1
+    assert worksheet.rows[0][11] == "โทรยืนยันแล้ว"
+    assert survivor.ledger.get_stats()['pending'] == 0
+
+def test_replay_after_crash_between_append_and_mark(tmp_path, worksheet):
+    path = str(tmp_path / "ledger.db")
+    crashed = SheetsWriteBuffer(ledger_path=path, lease_seconds=0.05)
+    crashed.enqueue_append("B001", make_row("B001"))
+    # แถวถูกเขียนลง sheet แล้ว แต่ process ตายก่อนบันทึกผลลง ledger
+    worksheet.append_rows([make_row("B001")])
+
+    time.sleep(0.1)
+    survivor = SheetsWriteBuffer(ledger_path=path, lease_seconds=30)
+    assert survivor.claim_orphaned() == 1
+
+    _flush(survivor, worksheet)
+    assert [row[0] for row in worksheet.rows] == ["B001"]
+    assert survivor.get_stats()['duplicate_appends_skipped'] == 1
+
+def test_stop_releases_unwritten_events(tmp_path, worksheet):
+    path = str(tmp_path / "ledger.db")
+    stopping = SheetsWriteBuffer(ledger_path=path, lease_seconds=30)
+    stopping.enqueue_append("B001", make_row("B001"))
+    stopping.stop()
+
+    other = SheetsWriteBuffer(ledger_path=path, lease_seconds=30)
+    assert other.claim_orphaned() == 1
+
+def test_ledger_file_is_created_on_first_use(tmp_path):
+    path = tmp_path / "ledger" / "ledger.db"
+    buffer = SheetsWriteBuffer(ledger_path=str(path), lease_seconds=30)
+    assert not path.parent.exists()
+
+    buffer.enqueue_append("B001", make_row("B001"))
+    assert path.exists()
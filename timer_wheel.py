@@ -0,0 +1,139 @@
+import asyncio
+import inspect
+import logging
+import math
+import time
+from typing import Dict, Any, Optional, List, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+class _Timer:
+    __slots__ = ('key', 'slot', 'rounds', 'callback', 'args')
+
+    def __init__(self, key: Hashable, slot: int, rounds: int, callback: Callable, args: tuple):
+        self.key = key
+        self.slot = slot
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+
+class TimerWheel:
+    """
+    Hashed timing wheel ที่ทำงานบน event loop (ไม่ใช้ thread)
+
+    timer ทุกตัวอยู่ใน slot ของวงล้อ task เดียวเดินวงล้อทีละ tick แล้วเรียก callback ที่ถึงเวลา
+    การตั้ง / ยกเลิก / ตั้งใหม่ (key เดิม) เป็น O(1)
+    ความละเอียดของเวลาเท่ากับ tick_seconds
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, wheel_size: int = 1024):
+        self.tick_seconds = tick_seconds
+        self.wheel_size = wheel_size
+        self._slots: List[Dict[Hashable, _Timer]] = [{} for _ in range(wheel_size)]
+        self._timers: Dict[Hashable, _Timer] = {}
+        self._current_slot = 0
+        self._task: Optional[asyncio.Task] = None
+        self._fired = 0
+
+    def schedule(self, key: Hashable, delay_seconds: float, callback: Callable, *args):
+        """ตั้ง timer (ถ้ามี key เดิมอยู่แล้วจะถูกแทนที่)"""
+        self.cancel(key)
+
+        ticks = max(1, math.ceil(delay_seconds / self.tick_seconds))
+        slot = (self._current_slot + ticks) % self.wheel_size
+        rounds = (ticks - 1) // self.wheel_size
+
+        timer = _Timer(key, slot, rounds, callback, args)
+        self._slots[slot][key] = timer
+        self._timers[key] = timer
+
+        self._ensure_started()
+
+    def cancel(self, key: Hashable) -> bool:
+        """ยกเลิก timer"""
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        self._slots[timer.slot].pop(key, None)
+        return True
+
+    def has(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def start(self):
+        """เริ่มเดินวงล้อ (ต้องเรียกภายใน event loop)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="timer-wheel")
+
+    async def stop(self):
+        """หยุดเดินวงล้อ (timer ที่ค้างอยู่จะไม่ถูกเรียก)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """สถิติของ timer wheel"""
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'timers': len(self._timers),
+            'fired': self._fired,
+            'tick_seconds': self.tick_seconds
+        }
+
+    def _ensure_started(self):
+        # เริ่มอัตโนมัติถ้ามี event loop ทำงานอยู่ (ถ้าไม่มี จะเริ่มตอน start())
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.start()
+
+    async def _run(self):
+        next_tick = time.monotonic() + self.tick_seconds
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            next_tick += self.tick_seconds
+            self._advance()
+
+    def _advance(self):
+        self._current_slot = (self._current_slot + 1) % self.wheel_size
+        slot = self._slots[self._current_slot]
+        if not slot:
+            return
+
+        due = []
+        for timer in list(slot.values()):
+            if timer.rounds > 0:
+                timer.rounds -= 1
+            else:
+                due.append(timer)
+
+        for timer in due:
+            del slot[timer.key]
+            del self._timers[timer.key]
+            self._fire(timer)
+
+    def _fire(self, timer: _Timer):
+        self._fired += 1
+        try:
+            result = timer.callback(*timer.args)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                task.add_done_callback(self._log_task_error)
+        except Exception as e:
+            logger.error(f"Timer callback error for {timer.key}: {e}")
+
+    @staticmethod
+    def _log_task_error(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Timer task error: {task.exception()}")
+
+# Timer wheel ที่ใช้ร่วมกันทั้ง process
+timer_wheel = TimerWheel()
@@ -0,0 +1,142 @@
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+from config import TRACE_ENABLED, TRACE_BUFFER_SIZE
+from structured_log import encode_log_line
+
+# span ที่เสร็จแล้วเขียนลง logs/trace.jsonl ผ่าน log pipeline (logger 'trace')
+trace_logger = logging.getLogger('trace')
+
+class Span:
+    """ช่วงเวลาของงานหนึ่งงานใน trace (ซ้อนกันได้ผ่าน contextvars)"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attributes', 'started_at', 'start', 'error')
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        """เพิ่ม attribute ระหว่างที่ span ยังไม่จบ"""
+        self.attributes.update(attributes)
+
+    def to_dict(self, duration: float) -> Dict[str, Any]:
+        data = {
+            'ts': self.started_at,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'duration_ms': round(duration * 1000, 3)
+        }
+        if self.attributes:
+            data['attributes'] = self.attributes
+        if self.error:
+            data['error'] = self.error
+        return data
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+class SpanRecorder:
+    """
+    เก็บ span ที่จบแล้ว: เขียนเป็น JSON lines และเก็บรายการล่าสุดไว้ในหน่วยความจำ
+
+    ใช้ดูว่า request ที่ช้าเสียเวลาไปกับการเรียก Sheets / LINE API ครั้งไหน
+    (ทุก span ใน request เดียวกันมี trace_id เดียวกัน)
+    """
+
+    def __init__(self, max_spans: int = TRACE_BUFFER_SIZE):
+        self._recent: deque = deque(maxlen=max(1, max_spans))
+        self._lock = threading.Lock()
+        self._recorded = 0
+
+    def record(self, data: Dict[str, Any]):
+        with self._lock:
+            self._recent.append(data)
+            self._recorded += 1
+        trace_logger.info(encode_log_line(data))
+
+    def recent(self, limit: int = 200, trace_id: str = None, min_duration_ms: float = 0.0) -> List[Dict[str, Any]]:
+        """span ล่าสุด (กรองตาม trace_id / ระยะเวลาขั้นต่ำได้)"""
+        with self._lock:
+            spans = list(self._recent)
+        if trace_id:
+            spans = [span for span in spans if span['trace_id'] == trace_id]
+        if min_duration_ms:
+            spans = [span for span in spans if span['duration_ms'] >= min_duration_ms]
+        return spans[-limit:] if limit > 0 else spans
+
+    def export_jsonl(self, **filters) -> str:
+        """span ล่าสุดในรูปแบบ JSON lines"""
+        return "".join(encode_log_line(span) + "\n" for span in self.recent(**filters))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'enabled': TRACE_ENABLED, 'recorded': self._recorded, 'buffered': len(self._recent)}
+
+# Recorder ที่ใช้ร่วมกันทั้ง process
+span_recorder = SpanRecorder()
+
+_disabled = nullcontext()
+
+def _span(name: str, attributes: Dict[str, Any]):
+    parent = _current_span.get()
+    current = Span(name, parent, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        span_recorder.record(current.to_dict(time.perf_counter() - current.start))
+
+_span_context = contextmanager(_span)
+
+def span(name: str, **attributes):
+    """context manager สร้าง span (เมื่อปิด tracing คืนค่า context ที่ไม่ทำอะไร)"""
+    if not TRACE_ENABLED:
+        return _disabled
+    return _span_context(name, attributes)
+
+def current_trace_id() -> Optional[str]:
+    """trace_id ของงานปัจจุบัน (None ถ้าไม่ได้อยู่ใน span)"""
+    current = _current_span.get()
+    return current.trace_id if current else None
+
+def traced(name: str = None, **attributes):
+    """decorator ครอบฟังก์ชัน (sync หรือ async) ด้วย span"""
+    def decorator(func):
+        if not TRACE_ENABLED:
+            return func
+
+        span_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _span_context(span_name, dict(attributes)):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span_context(span_name, dict(attributes)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -7,7 +7,7 @@ import logging
 from typing import Dict, Optional, Any
 from datetime import datetime
 
-from config import LINE_CHANNEL_SECRET, LINE_HEADERS
+from config import LINE_CHANNEL_SECRET, LINE_HEADERS, LINE_API_BASE_URL
 
 logger = logging.getLogger(__name__)
 
@@ -105,13 +105,19 @@ def parse_reservation_message(message: str) -> Optional[Dict[str, Any]]:
         return None
 
 def get_line_display_name(user_id: str) -> str:
-    """ดึงชื่อแสดงของผู้ใช้จาก LINE API"""
+    """ดึงชื่อแสดงของผู้ใช้จาก LINE API (ใช้ cache ร่วมกับ profile_cache)"""
+    from profile_cache import profile_cache, fallback_display_name
+    
     try:
         if not user_id:
             return "Unknown User"
         
+        cached = profile_cache.get_cached(user_id)
+        if cached is not None:
+            return cached
+        
         response = requests.get(
-            f"https://api.line.me/v2/bot/profile/{user_id}",
+            f"{LINE_API_BASE_URL}/v2/bot/profile/{user_id}",
             headers=LINE_HEADERS,
             timeout=10
         )
@@ -119,18 +125,20 @@ def get_line_display_name(user_id: str) -> str:
         if response.status_code == 200:
             profile = response.json()
             display_name = profile.get('displayName', 'Unknown User')
+            profile_cache.set(user_id, display_name)
             logger.info(f"Retrieved display name for {user_id}: {display_name}")
             return display_name
         else:
             logger.warning(f"Failed to get user profile for {user_id}: {response.status_code}")
-            return f"User_{user_id[:8]}"
             
     except requests.exceptions.Timeout:
         logger.warning(f"Timeout getting user profile for {user_id}")
-        return f"User_{user_id[:8]}"
     except Exception as e:
         logger.error(f"Error getting user display name for {user_id}: {e}")
-        return f"User_{user_id[:8]}"
+    
+    display_name = fallback_display_name(user_id)
+    profile_cache.set(user_id, display_name, negative=True)
+    return display_name
 
 def validate_phone_number(phone: str) -> bool:
     """ตรวจสอบความถูกต้องของเบอร์โทรศัพท์"""
@@ -140,6 +148,18 @@ def validate_phone_number(phone: str) -> bool:
     # ตรวจสอบรูปแบบเบอร์โทรไทย (10 หลัก เริ่มต้นด้วย 0)
     return bool(re.match(r'^0\d{9}$', clean_phone))
 
+def normalize_phone(phone: Any) -> str:
+    """แปลงเบอร์โทรให้อยู่ในรูปแบบเดียวกัน (ใช้เป็น key สำหรับค้นหา)"""
+    if phone is None:
+        return ""
+    
+    # Google Sheets อาจแปลงเบอร์โทรเป็นตัวเลขทำให้ 0 ตัวหน้าหายไป
+    digits = re.sub(r'\D', '', str(phone))
+    if len(digits) == 9 and not digits.startswith('0'):
+        digits = '0' + digits
+    
+    return digits
+
 def validate_date_format(date_str: str) -> bool:
     """ตรวจสอบรูปแบบวันที่ (dd-mm-yyyy)"""
     try:
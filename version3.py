@@ -6,7 +6,9 @@ import hmac
 import base64
 from datetime import datetime, date, timedelta
 import asyncio
-from typing import Dict, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 import logging
 from pydantic import BaseModel
 import gspread
@@ -29,6 +31,10 @@ LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "credentials.json")
 GOOGLE_DRIVE_FOLDER_ID = os.getenv("GOOGLE_DRIVE_FOLDER_ID", "")
 SHARE_EMAIL = os.getenv("SHARE_EMAIL")
+# ไฟล์เก็บ map วันที่ -> spreadsheet ID ของชีทรายวัน (ไม่ต้องค้นหาใน Drive ทุกครั้ง)
+DAILY_SHEET_INDEX_PATH = os.getenv("DAILY_SHEET_INDEX_PATH", "daily_sheets.json")
+# จำนวนชีทรายวันที่อ่านพร้อมกันตอนค้นหาการจองหลายวัน
+DAILY_SHEET_READ_WORKERS = int(os.getenv("DAILY_SHEET_READ_WORKERS", "7"))
 
 LINE_HEADERS = {
     "Content-Type": "application/json",
@@ -150,23 +156,85 @@ def get_line_display_name(user_id: str) -> str:
         pass
     return user_id
 
-def get_or_create_daily_sheet(target_date: date):
-    title = f"จองโต๊ะ_{target_date.strftime('%Y-%m-%d')}"
+DAILY_SHEET_HEADERS = [
+    "เวลาจอง", "ชื่อลูกค้า", "เบอร์โทร", "วันที่", "เวลา",
+    "จำนวนคน", "คำขอเพิ่มเติม", "LINE DISPLAY NAME", "สถานะ"
+]
+
+def daily_sheet_title(target_date: date) -> str:
+    return f"จองโต๊ะ_{target_date.strftime('%Y-%m-%d')}"
+
+_daily_sheet_lock = threading.Lock()
+_daily_sheet_ids: Dict[str, str] = {}
+_daily_worksheets: Dict[str, gspread.Worksheet] = {}
+_daily_index_loaded = False
+
+def _save_daily_sheet_index():
+    tmp_path = f"{DAILY_SHEET_INDEX_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_daily_sheet_ids, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, DAILY_SHEET_INDEX_PATH)
+
+def load_daily_sheet_index():
+    """โหลด map วันที่ -> spreadsheet ID (ครั้งแรกสร้างจากไฟล์ที่มีอยู่ใน Drive) เรียกขณะถือ _daily_sheet_lock"""
+    global _daily_index_loaded
+    if _daily_index_loaded:
+        return
     try:
+        if os.path.exists(DAILY_SHEET_INDEX_PATH):
+            with open(DAILY_SHEET_INDEX_PATH, encoding="utf-8") as f:
+                _daily_sheet_ids.update(json.load(f))
+            _daily_index_loaded = True
+            return
+
+        # ยังไม่มีไฟล์ index ค้นหาชีทรายวันที่สร้างไว้ก่อนหน้าใน Drive ครั้งเดียว
+        for file in gc.list_spreadsheet_files(folder_id=GOOGLE_DRIVE_FOLDER_ID or None):
+            title = file.get("name", "")
+            if title.startswith("จองโต๊ะ_"):
+                _daily_sheet_ids[title[len("จองโต๊ะ_"):]] = file["id"]
+        _save_daily_sheet_index()
+        _daily_index_loaded = True
+        logger.info(f"Indexed {len(_daily_sheet_ids)} daily sheets from Drive")
+    except Exception as e:
+        logger.error(f"load_daily_sheet_index error: {e}")
+
+def get_or_create_daily_sheet(target_date: date, create: bool = True):
+    """worksheet ของวันที่ระบุ (create=False = ไม่สร้างชีทใหม่ถ้ายังไม่มี)"""
+    key = target_date.isoformat()
+    ws = _daily_worksheets.get(key)
+    if ws:
+        return ws
+
+    with _daily_sheet_lock:
+        ws = _daily_worksheets.get(key)
+        if ws:
+            return ws
         try:
-            sheet = gc.open(title)
-            move_to_drive_folder_and_share(sheet.id, GOOGLE_DRIVE_FOLDER_ID, SHARE_EMAIL)
-            return sheet.sheet1
-        except gspread.SpreadsheetNotFound:
-            sh = gc.create(title)
-            sh.sheet1.append_row([
-                "เวลาจอง", "ชื่อลูกค้า", "เบอร์โทร", "วันที่", "เวลา",
-                "จำนวนคน", "คำขอเพิ่มเติม", "LINE DISPLAY NAME", "สถานะ"
-            ])
-            move_to_drive_folder_and_share(sh.id, GOOGLE_DRIVE_FOLDER_ID, SHARE_EMAIL)
-            return sh.sheet1
-    except:
-        return None
+            # โหลด index ตอนใช้ครั้งแรก (import โมดูลไม่ต้องเรียก Drive)
+            load_daily_sheet_index()
+            sheet_id = _daily_sheet_ids.get(key)
+            if sheet_id:
+                try:
+                    ws = gc.open_by_key(sheet_id).sheet1
+                except gspread.SpreadsheetNotFound:
+                    # ชีทถูกลบไปแล้ว
+                    _daily_sheet_ids.pop(key, None)
+                    _save_daily_sheet_index()
+            if ws is None:
+                if not create:
+                    return None
+                sh = gc.create(daily_sheet_title(target_date))
+                sh.sheet1.append_row(DAILY_SHEET_HEADERS)
+                # ย้ายเข้าโฟลเดอร์และแชร์ครั้งเดียวตอนสร้าง
+                move_to_drive_folder_and_share(sh.id, GOOGLE_DRIVE_FOLDER_ID, SHARE_EMAIL)
+                _daily_sheet_ids[key] = sh.id
+                _save_daily_sheet_index()
+                ws = sh.sheet1
+            _daily_worksheets[key] = ws
+            return ws
+        except Exception as e:
+            logger.error(f"get_or_create_daily_sheet error: {e}")
+            return None
 
 def reservation_exists(ws, date, time, phone):
     try:
@@ -178,24 +246,68 @@ def reservation_exists(ws, date, time, phone):
         pass
     return False
 
-def find_user_reservations(phone: str, target_date: date = None):
-    """ค้นหาการจองของผู้ใช้ตามเบอร์โทร"""
+def parse_booking_date(date_str: str) -> date:
+    """แปลงวันที่ dd-mm-yyyy (พ.ศ. หรือ ค.ศ.) เป็น date"""
+    day, month, year = map(int, date_str.split('-'))
+    if year > 2500:
+        year -= 543
+    return date(year, month, day)
+
+_daily_read_pool: Optional[ThreadPoolExecutor] = None
+_daily_read_pool_lock = threading.Lock()
+
+def _get_daily_read_pool() -> ThreadPoolExecutor:
+    """pool สำหรับอ่านชีทรายวันพร้อมกัน (สร้างตอนค้นหาครั้งแรก ปิดตอน shutdown)"""
+    global _daily_read_pool
+    with _daily_read_pool_lock:
+        if _daily_read_pool is None:
+            _daily_read_pool = ThreadPoolExecutor(
+                max_workers=max(1, DAILY_SHEET_READ_WORKERS), thread_name_prefix="daily-sheet"
+            )
+        return _daily_read_pool
+
+def _read_daily_reservations(check_date: date, phone: str, time_str: Optional[str] = None) -> List[Dict]:
+    """อ่านการจองที่ยังไม่ยกเลิกของเบอร์นี้จากชีทของวันเดียว"""
+    ws = get_or_create_daily_sheet(check_date, create=False)
+    if not ws:
+        return []
+    reservations = []
+    records = ws.get_all_records()
+    for idx, row in enumerate(records, start=2):  # เริ่มจากแถวที่ 2 (ข้าม header)
+        if (row["เบอร์โทร"] == phone and
+            row["สถานะ"] not in ["ยกเลิก", "ยกเลิกแล้ว"] and
+            (time_str is None or row["เวลา"] == time_str)):
+            reservations.append({
+                "row_index": idx,
+                "worksheet": ws,
+                "data": row,
+                "date": check_date
+            })
+    return reservations
+
+def find_user_reservations(phone: str, target_date: date = None, date_str: str = None, time_str: str = None):
+    """ค้นหาการจองของผู้ใช้ตามเบอร์โทร (ระบุ date_str / time_str = ค้นหาเฉพาะวันที่ / เวลานั้น)"""
     reservations = []
     try:
-        # ค้นหาใน 7 วันข้างหน้า
-        for i in range(7):
-            check_date = (target_date or datetime.today().date()) + timedelta(days=i)
-            ws = get_or_create_daily_sheet(check_date)
-            if ws:
-                records = ws.get_all_records()
-                for idx, row in enumerate(records, start=2):  # เริ่มจากแถวที่ 2 (ข้าม header)
-                    if row["เบอร์โทร"] == phone and row["สถานะ"] not in ["ยกเลิก", "ยกเลิกแล้ว"]:
-                        reservations.append({
-                            "row_index": idx,
-                            "worksheet": ws,
-                            "data": row,
-                            "date": check_date
-                        })
+        if date_str:
+            days = [parse_booking_date(date_str)]
+        else:
+            # ค้นหาใน 7 วันข้างหน้า (อ่านทุกวันพร้อมกัน)
+            start = target_date or datetime.today().date()
+            days = [start + timedelta(days=i) for i in range(7)]
+
+        pool = _get_daily_read_pool()
+        futures = [pool.submit(_read_daily_reservations, d, phone, time_str) for d in days]
+        for i, future in enumerate(futures):
+            try:
+                reservations.extend(future.result())
+            except Exception as e:
+                logger.error(f"find_user_reservations error for {days[i]}: {e}")
+            # ค้นหาเวลาเฉพาะ เจอแล้วไม่ต้องรอวันที่เหลือ
+            if time_str and reservations:
+                for pending in futures[i + 1:]:
+                    pending.cancel()
+                break
     except Exception as e:
         logger.error(f"find_user_reservations error: {e}")
     return reservations
@@ -204,12 +316,9 @@ def cancel_reservation(phone: str, date_str: str, time_str: str):
     """ยกเลิกการจอง"""
     try:
         # แปลงวันที่
-        day, month, year = map(int, date_str.split('-'))
-        if year > 2500:
-            year -= 543
-        target_date = date(year, month, day)
+        target_date = parse_booking_date(date_str)
         
-        ws = get_or_create_daily_sheet(target_date)
+        ws = get_or_create_daily_sheet(target_date, create=False)
         if not ws:
             return False, "ไม่พบข้อมูลการจอง"
         
@@ -797,6 +906,15 @@ def send_user_reservations_flex(reply_token: str, reservations: list):
     except Exception as e:
         logger.error(f"send_user_reservations_flex error: {e}")
 
+@app.on_event("shutdown")
+async def shutdown():
+    """ปิด pool อ่านชีทรายวัน (รอการอ่านที่ค้างอยู่ให้เสร็จ)"""
+    global _daily_read_pool
+    with _daily_read_pool_lock:
+        pool, _daily_read_pool = _daily_read_pool, None
+    if pool is not None:
+        await asyncio.to_thread(pool.shutdown, True)
+
 @app.post("/webhook")
 async def webhook(request: Request):
     body = await request.body()
@@ -885,7 +1003,12 @@ async def process_line_event(event_data: Dict):
             # Session สำหรับการยกเลิกจอง
             if step == "cancel_phone":
                 phone = message_text.strip()
-                reservations = find_user_reservations(phone)
+                # กดปุ่มยกเลิกมา (ระบุวันที่และเวลาแล้ว) อ่านเฉพาะชีทของวันนั้น
+                reservations = find_user_reservations(
+                    phone,
+                    date_str=data.get("cancel_date"),
+                    time_str=data.get("cancel_time")
+                )
                 
                 if not reservations:
                     clear_reservation_session(user_id)
@@ -1,28 +1,94 @@
+import asyncio
 import logging
-from typing import Dict, Any
-from config import log_booking_event, log_error_with_context
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+from config import (
+    log_booking_event,
+    log_error_with_context,
+    MAX_CONCURRENT_EVENTS_PER_WEBHOOK,
+    MAX_CONCURRENT_EVENTS
+)
 from flex_messages import reply_to_user, send_admin_notification
 from booking_logic import handle_booking_process
-from utils import get_line_display_name
+from profile_cache import get_cached_display_name
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
+# Lock ต่อผู้ใช้ (event ของผู้ใช้คนเดียวกันต้องทำตามลำดับ) และ semaphore ของทั้ง process
+_user_locks: Dict[str, asyncio.Lock] = {}
+_user_lock_refs: Dict[str, int] = {}
+_process_semaphore: Optional[asyncio.Semaphore] = None
+_in_flight_events = 0
+
+def _get_process_semaphore() -> asyncio.Semaphore:
+    """semaphore จำกัดจำนวน event ที่ทำพร้อมกันทั้ง process"""
+    global _process_semaphore
+    if _process_semaphore is None:
+        _process_semaphore = asyncio.Semaphore(MAX_CONCURRENT_EVENTS)
+    return _process_semaphore
+
+@asynccontextmanager
+async def _user_lock(key: str):
+    """ถือ lock ของผู้ใช้ (ลบ lock ทิ้งเมื่อไม่มีใครใช้แล้ว)"""
+    lock = _user_locks.get(key)
+    if lock is None:
+        lock = _user_locks[key] = asyncio.Lock()
+    _user_lock_refs[key] = _user_lock_refs.get(key, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _user_lock_refs[key] -= 1
+        if _user_lock_refs[key] == 0:
+            del _user_lock_refs[key]
+            del _user_locks[key]
+
+async def dispatch_event(event: dict):
+    """จัดการ event โดยรักษาลำดับของผู้ใช้คนเดียวกันและจำกัดจำนวนที่ทำพร้อมกัน"""
+    global _in_flight_events
+    async with _user_lock(get_event_user_key(event)):
+        async with _get_process_semaphore():
+            _in_flight_events += 1
+            try:
+                await handle_event(event)
+            finally:
+                _in_flight_events -= 1
+
+def get_dispatch_stats() -> Dict[str, Any]:
+    """สถิติการประมวลผล event"""
+    return {
+        'max_concurrent_events': MAX_CONCURRENT_EVENTS,
+        'in_flight_events': _in_flight_events,
+        'active_users': len(_user_locks)
+    }
+
+@traced()
 async def handle_webhook_request(body: dict, headers: dict) -> bool:
-    """จัดการ webhook request จาก LINE"""
+    """จัดการ webhook request จาก LINE (ผู้ใช้ต่างคนกันประมวลผลพร้อมกัน)"""
     try:
         events = body.get('events', [])
         
+        # แยก event ตามผู้ใช้ (คงลำดับเดิมภายในผู้ใช้แต่ละคน)
+        events_by_user: Dict[str, List[dict]] = {}
         for event in events:
-            event_type = event.get('type')
-            
-            if event_type == 'message':
-                await handle_message_event(event)
-            elif event_type == 'follow':
-                await handle_follow_event(event)
-            elif event_type == 'unfollow':
-                await handle_unfollow_event(event)
-            else:
-                logger.info(f"Unhandled event type: {event_type}")
+            events_by_user.setdefault(get_event_user_key(event), []).append(event)
+        
+        webhook_semaphore = asyncio.Semaphore(MAX_CONCURRENT_EVENTS_PER_WEBHOOK)
+        
+        async def run_user_events(user_events: List[dict]):
+            async with webhook_semaphore:
+                for event in user_events:
+                    await dispatch_event(event)
+        
+        results = await asyncio.gather(
+            *(run_user_events(user_events) for user_events in events_by_user.values()),
+            return_exceptions=True
+        )
+        
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
         
         return True
         
@@ -34,6 +100,31 @@ async def handle_webhook_request(body: dict, headers: dict) -> bool:
         )
         return False
 
+@traced()
+async def handle_event(event: dict):
+    """จัดการ event เดียวตามประเภท"""
+    event_type = event.get('type')
+    
+    if event_type == 'message':
+        await handle_message_event(event)
+    elif event_type == 'follow':
+        await handle_follow_event(event)
+    elif event_type == 'unfollow':
+        await handle_unfollow_event(event)
+    else:
+        logger.info(f"Unhandled event type: {event_type}")
+
+def get_event_user_key(event: dict) -> str:
+    """key ที่ใช้จัดลำดับ event ของผู้ใช้คนเดียวกัน"""
+    source = event.get('source') or {}
+    return (
+        source.get('userId')
+        or source.get('groupId')
+        or source.get('roomId')
+        or event.get('webhookEventId')
+        or 'unknown'
+    )
+
 async def handle_message_event(event: dict):
     """จัดการ message event"""
     try:
@@ -44,7 +135,7 @@ async def handle_message_event(event: dict):
         message_type = message['type']
         
         # ดึงชื่อผู้ใช้ (จะใช้ใน log)
-        display_name = get_user_display_name(user_id)
+        display_name = await get_user_display_name(user_id)
         
         if message_type == 'text':
             message_text = message['text']
@@ -62,7 +153,7 @@ async def handle_message_event(event: dict):
             
         else:
             logger.info(f"Received non-text message: {message_type} from {display_name}")
-            reply_to_user(reply_token, "ขออภัย ระบบรองรับเฉพาะข้อความตัวอักษรเท่านั้น")
+            await reply_to_user(reply_token, "ขออภัย ระบบรองรับเฉพาะข้อความตัวอักษรเท่านั้น")
             
     except Exception as e:
         log_error_with_context(
@@ -82,7 +173,7 @@ async def handle_text_message(reply_token: str, user_id: str, message_text: str,
                 user_id=user_id,
                 user_name=display_name
             )
-            reply_to_user(reply_token, "สวัสดีครับ! ยินดีต้อนรับสู่ร้านยักษ์ใหญ่แดนใต้\n\nพิมพ์ 'จองโต๊ะ' เพื่อเริ่มจองโต๊ะ\nพิมพ์ 'ดูการจอง' เพื่อดูรายการจองของคุณ")
+            await reply_to_user(reply_token, "สวัสดีครับ! ยินดีต้อนรับสู่ร้านยักษ์ใหญ่แดนใต้\n\nพิมพ์ 'จองโต๊ะ' เพื่อเริ่มจองโต๊ะ\nพิมพ์ 'ดูการจอง' เพื่อดูรายการจองของคุณ")
             
         elif message_text in ['จองโต๊ะ', 'จอง']:
             log_booking_event(
@@ -132,10 +223,10 @@ async def handle_text_message(reply_token: str, user_id: str, message_text: str,
                 )
                 
                 # ส่งแจ้งแอดมิน
-                send_admin_notification(user_id, message_text, display_name)
+                await send_admin_notification(user_id, message_text, display_name)
                 
                 # ตอบลูกค้า
-                reply_to_user(
+                await reply_to_user(
                     reply_token, 
                     "ขอบคุณสำหรับข้อความของคุณ ทางเราได้รับเรื่องแล้ว และจะติดต่อกลับไปเร็วๆ นี้\n\nหากต้องการจองโต๊ะ กรุณาพิมพ์ 'จองโต๊ะ'"
                 )
@@ -156,7 +247,7 @@ async def handle_follow_event(event: dict):
     try:
         user_id = event['source']['userId']
         reply_token = event['replyToken']
-        display_name = get_user_display_name(user_id)
+        display_name = await get_user_display_name(user_id)
         
         log_booking_event(
             event_type="USER_FOLLOWED",
@@ -175,7 +266,7 @@ async def handle_follow_event(event: dict):
 
 ขอบคุณที่เลือกใช้บริการของเรา! 🙏"""
         
-        reply_to_user(reply_token, welcome_message)
+        await reply_to_user(reply_token, welcome_message)
         
     except Exception as e:
         log_error_with_context(
@@ -205,25 +296,6 @@ async def handle_unfollow_event(event: dict):
             additional_data={"event": event}
         )
 
-def get_user_display_name(user_id: str) -> str:
-    """ดึงชื่อแสดงของผู้ใช้"""
-    try:
-        # ใช้ LINE API เพื่อดึงข้อมูลผู้ใช้
-        import requests
-        from config import LINE_HEADERS
-        
-        response = requests.get(
-            f"https://api.line.me/v2/bot/profile/{user_id}",
-            headers=LINE_HEADERS
-        )
-        
-        if response.status_code == 200:
-            profile = response.json()
-            return profile.get('displayName', 'Unknown User')
-        else:
-            logger.warning(f"Failed to get user profile: {response.status_code}")
-            return f"User_{user_id[:8]}"
-            
-    except Exception as e:
-        logger.error(f"Error getting user display name: {e}")
-        return f"User_{user_id[:8]}"
\ No newline at end of file
+async def get_user_display_name(user_id: str) -> str:
+    """ดึงชื่อแสดงของผู้ใช้ (ผ่าน profile cache)"""
+    return await get_cached_display_name(user_id)